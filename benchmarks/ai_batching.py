@@ -0,0 +1,104 @@
+"""Throughput of parse_expenses_async with and without micro-batching.
+
+    python -m benchmarks.ai_batching
+    python -m benchmarks.ai_batching --messages 200 --gap-ms 5 --window-ms 100 --rate-limit 10
+
+Runs against a local fake OpenAI server (benchmarks.fake_openai) that answers
+after --latency-ms plus --per-message-ms per message in the request, and
+rejects requests beyond --rate-limit per second with HTTP 429. Messages
+arrive --gap-ms apart, like a user forwarding a week of receipts. Both modes
+go through the normal retry policy, so 429s cost backoff time. The parse
+cache is disabled so every message reaches the server.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+
+from openai import AsyncOpenAI
+
+from benchmarks.fake_openai import FakeOpenAI
+from bot.services import ai_parser, storage
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+async def _burst(texts: list[str], gap: float) -> tuple[list[float], int]:
+    latencies = []
+    failures = 0
+
+    async def one(i: int, text: str):
+        nonlocal failures
+        await asyncio.sleep(i * gap)
+        start = time.perf_counter()
+        try:
+            await ai_parser.parse_expenses_async(text)
+        except Exception:
+            failures += 1
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i, text) for i, text in enumerate(texts)))
+    return latencies, failures
+
+
+def run(args, window_ms: float) -> dict:
+    texts = [f"paragon {i} {10 + i % 90}" for i in range(args.messages)]
+    with FakeOpenAI(args.latency_ms / 1000, args.per_message_ms / 1000, args.rate_limit) as server:
+        ai_parser.client_ai_async = AsyncOpenAI(base_url=server.base_url, api_key="benchmark", max_retries=0)
+        ai_parser.AI_BATCH_WINDOW_MS = window_ms
+        ai_parser._reset_stats()
+        start = time.perf_counter()
+        latencies, failures = asyncio.run(_burst(texts, args.gap_ms / 1000))
+        elapsed = time.perf_counter() - start
+        stats = ai_parser.parser_stats()
+        return {
+            "mode": f"batched ({window_ms:g} ms)" if window_ms else "unbatched",
+            "messages": len(texts),
+            "seconds": round(elapsed, 3),
+            "messages_per_s": round(len(texts) / elapsed, 1),
+            "http_requests": len(server.requests),
+            "rate_limited": server.rejected,
+            "retries": stats["retries"],
+            "failures": failures,
+            "prompt_tokens": stats["prompt_tokens"],
+            "latency_p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+            "latency_p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+            "latency_mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--gap-ms", type=float, default=10, help="Delay between arriving messages")
+    parser.add_argument("--window-ms", type=float, default=100, help="AI_BATCH_WINDOW_MS for the batched run")
+    parser.add_argument("--max-batch", type=int, default=ai_parser.AI_BATCH_MAX_SIZE)
+    parser.add_argument("--latency-ms", type=float, default=400, help="Simulated time per completion")
+    parser.add_argument("--per-message-ms", type=float, default=30, help="Extra simulated time per message")
+    parser.add_argument("--rate-limit", type=int, default=None, help="Requests per second before HTTP 429")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx2").setLevel(logging.WARNING)
+    storage.PARSE_CACHE_MAX_ENTRIES = 0
+    ai_parser.AI_BATCH_MAX_SIZE = args.max_batch
+    results = [run(args, 0), run(args, args.window_ms)]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(f"{result['mode']}:")
+        for key, value in result.items():
+            if key != "mode":
+                print(f"  {key:16} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Answers in the structured format ai_parser asks for, reading "<words> <amount>"
+messages as one "1.1" expense each, after a simulated delay of
+latency + per_message * messages. With rate_limit set, requests beyond that
+many per second get HTTP 429, like the real API's request-per-minute limit;
+error_rate is the share of the rest answered with HTTP 500.
+
+    with FakeOpenAI(latency=0.2) as server:
+        client = AsyncOpenAI(base_url=server.base_url, api_key="test", max_retries=0)
+
+Run standalone as the PARSER_BACKEND=local stand-in (serves on
+http://127.0.0.1:8089/v1, the backend's default OPENAI_BASE_URL):
+
+    python -m benchmarks.fake_openai --latency-ms 400 --error-rate 0.02
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_AMOUNT = re.compile(r"(\d+(?:[.,]\d+)?)")
+
+
+def _expenses(text: str, today: str) -> list[dict]:
+    match = _AMOUNT.search(text)
+    if not match:
+        return []
+    description = " ".join(text.replace(match.group(1), " ").split()) or "wydatek"
+    return [{"amount": float(match.group(1).replace(",", ".")), "date": today, "code": "1.1", "description": description}]
+
+
+class FakeOpenAI:
+    def __init__(self, latency: float = 0.0, per_message: float = 0.0, rate_limit: int | None = None,
+                 error_rate: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.per_message = per_message
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.requests: list[dict] = []
+        self.rejected = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._window_start = 0.0
+        self._window_count = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _admit(self) -> bool:
+        if self.rate_limit is None:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            if self._window_count > self.rate_limit:
+                self.rejected += 1
+                return False
+            return True
+
+    def reply(self, body: dict) -> tuple[str, int]:
+        """Content for a request body and the number of messages it carried."""
+        today = time.strftime("%Y-%m-%d")
+        user_text = body["messages"][-1]["content"]
+        if body["response_format"]["json_schema"]["name"] == "expense_batch":
+            messages = json.loads(user_text)
+            results = [{"id": m["id"], "expenses": _expenses(m["text"], today)} for m in messages]
+            return json.dumps({"results": results}), len(messages)
+        return json.dumps({"expenses": _expenses(user_text, today)}), 1
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload: dict):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake._lock:
+                    fake.requests.append(body)
+                if not fake._admit():
+                    self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}})
+                    return
+                if fake.error_rate and random.random() < fake.error_rate:
+                    with fake._lock:
+                        fake.errors += 1
+                    self._send(500, {"error": {"message": "Simulated server error", "type": "server_error"}})
+                    return
+                content, count = fake.reply(body)
+                time.sleep(fake.latency + fake.per_message * count)
+                prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+                self._send(200, {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": len(content) // 4,
+                        "total_tokens": prompt_tokens + len(content) // 4,
+                    },
+                })
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI chat-completions stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=400)
+    parser.add_argument("--per-message-ms", type=float, default=30)
+    parser.add_argument("--rate-limit", type=int, default=None, help="Requests per second before HTTP 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    args = parser.parse_args()
+
+    server = FakeOpenAI(args.latency_ms / 1000, args.per_message_ms / 1000, args.rate_limit,
+                        args.error_rate, args.host, args.port)
+    print(f"Serving on {server.base_url} (Ctrl+C to stop)")
+    with server:
+        try:
+            server._thread.join()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Fast-path parser hit rate and latency on historical messages.
+
+    python -m benchmarks.fast_parser                  # newest 1000 messages from PostgreSQL
+    python -m benchmarks.fast_parser --corpus msgs.txt
+
+With the database, the corpus is the user's newest --limit messages
+(expenses.original_text) and the dictionary is learned only from expenses
+saved before them, so hits are predictions, not replays. "agree" is the share
+of hits whose categories match what was actually saved. A --corpus file has
+one message per line and is parsed with the history-free keyword dictionary.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+from bot.services import database, fast_parser
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def load_corpus(args) -> tuple[list[str], list[list[tuple[str, str]]] | None, fast_parser.MerchantDictionary]:
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        return texts, None, fast_parser.MerchantDictionary()
+
+    if not database.is_available():
+        raise SystemExit("DATABASE_URL is not set; pass --corpus FILE instead.")
+    user_id = database.get_or_create_user(args.telegram_id)
+    history = database.get_parse_history(user_id, args.limit)
+    if not history:
+        raise SystemExit("No expenses with original_text in the database.")
+    oldest = min(h["created_at"] for h in history)
+    dictionary = fast_parser.build_dictionary(database.get_description_categories(user_id, before=oldest))
+    return [h["original_text"] for h in history], [h["expenses"] for h in history], dictionary
+
+
+def run(texts, expected, dictionary, repeat: int) -> dict:
+    latencies_us = []
+    hits = 0
+    agree = 0
+    for i, text in enumerate(texts):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = fast_parser.parse_expenses(text, dictionary)
+        latencies_us.append((time.perf_counter() - start) / repeat * 1e6)
+        if result is None:
+            continue
+        hits += 1
+        if expected is not None and [(e["category"], e["subcategory"]) for e in result] == expected[i]:
+            agree += 1
+
+    return {
+        "messages": len(texts),
+        "dictionary_phrases": len(dictionary),
+        "fast_path_hits": hits,
+        "hit_rate": hits / len(texts),
+        "agree_rate": (agree / hits if hits else 0.0) if expected is not None else None,
+        "latency_us_mean": statistics.fmean(latencies_us),
+        "latency_us_p50": _percentile(latencies_us, 50),
+        "latency_us_p99": _percentile(latencies_us, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="File with one message per line instead of the database")
+    parser.add_argument("--limit", type=int, default=1000, help="Newest messages to test (database mode)")
+    parser.add_argument("--repeat", type=int, default=20, help="Parses per message for timing")
+    parser.add_argument("--telegram-id", type=int, default=int(os.environ.get("ALLOWED_USER_ID", "0")))
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    texts, expected, dictionary = load_corpus(args)
+    report = run(texts, expected, dictionary, args.repeat)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"messages           {report['messages']}")
+    print(f"dictionary phrases {report['dictionary_phrases']}")
+    print(f"fast-path hits     {report['fast_path_hits']} ({report['hit_rate']:.1%}), "
+          f"{report['messages'] - report['fast_path_hits']} sent to the LLM")
+    if report["agree_rate"] is not None:
+        print(f"agree with saved   {report['agree_rate']:.1%} of hits")
+    print(f"latency            mean {report['latency_us_mean']:.1f} µs, "
+          f"p50 {report['latency_us_p50']:.1f} µs, p99 {report['latency_us_p99']:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
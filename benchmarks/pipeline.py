@@ -0,0 +1,190 @@
+"""End-to-end throughput of handle_message -> confirm -> save.
+
+    python -m benchmarks.pipeline                          # PARSER_BACKEND=local, in-process stand-in
+    python -m benchmarks.pipeline --backend rules --messages 2000
+    python -m benchmarks.pipeline --base-url http://127.0.0.1:8089/v1   # external stand-in
+
+Drives the real Telegram handlers with minimal stand-in Update objects, one
+message and one "Zapisz" press per expense, with --concurrency conversations
+in flight. --ai-share of the messages name an unknown merchant, so the rule
+parser passes them to the backend; the rest are read locally. With
+PARSER_BACKEND=local and no --base-url, a benchmarks.fake_openai server
+runs in-process (--latency-ms). The Google Sheets write is replaced by a
+--sheets-ms sleep; with DATABASE_URL set, expenses are really saved to
+PostgreSQL. State lives in a temporary SQLite file.
+
+Still needs the variables bot.config requires (SPREADSHEET_NAME,
+SHEET_TAB_NAME, ALLOWED_USER_ID); Google credentials are never loaded.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+class _Chat:
+    """Collects what the handlers send back, like a Telegram chat would show it."""
+
+    def __init__(self):
+        self.last_text = None
+        self.last_markup = None
+
+    async def send_message(self, chat_id, text, reply_markup=None, parse_mode=None):
+        self.last_text, self.last_markup = text, reply_markup
+
+    async def send_chat_action(self, chat_id, action):
+        pass
+
+    async def edit_message_text(self, text, reply_markup=None, parse_mode=None):
+        self.last_text, self.last_markup = text, reply_markup
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    def button(self, prefix: str) -> str | None:
+        if self.last_markup is None:
+            return None
+        for row in self.last_markup.inline_keyboard:
+            for button in row:
+                if button.callback_data.startswith(prefix):
+                    return button.callback_data
+        return None
+
+
+async def _conversation(text: str, user_id: int) -> tuple[str, float]:
+    from bot.handlers.callbacks import handle_callback
+    from bot.handlers.messages import handle_message
+    from bot.i18n import t
+
+    chat = _Chat()
+    user = SimpleNamespace(id=user_id, full_name="Benchmark")
+    start = time.perf_counter()
+    message_update = SimpleNamespace(
+        message=SimpleNamespace(text=text),
+        effective_chat=SimpleNamespace(id=user_id),
+        effective_user=user,
+    )
+    await handle_message(message_update, SimpleNamespace(bot=chat))
+    confirm = chat.button("confirm:")
+    if confirm is None:
+        return "not_parsed", time.perf_counter() - start
+
+    query = SimpleNamespace(data=confirm, from_user=user, answer=chat.answer, edit_message_text=chat.edit_message_text)
+    await handle_callback(SimpleNamespace(callback_query=query), SimpleNamespace(bot=chat))
+    outcome = "failed" if chat.last_text in (t("save_error"), t("expense_expired")) else "saved"
+    return outcome, time.perf_counter() - start
+
+
+async def _run(texts: list[str], user_id: int, concurrency: int) -> tuple[list[float], dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    outcomes: dict[str, int] = {}
+
+    async def one(text: str):
+        async with semaphore:
+            outcome, seconds = await _conversation(text, user_id)
+        latencies.append(seconds)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    await asyncio.gather(*(one(text) for text in texts))
+    return latencies, outcomes
+
+
+def build_messages(count: int, ai_share: float) -> list[str]:
+    """Known-merchant messages for the rule parser, and unknown ones that need the backend."""
+    known = ["biedronka", "lidl", "zabka", "kaufland", "restauracja"]
+    every = round(1 / ai_share) if ai_share > 0 else 0
+    messages = []
+    for i in range(count):
+        amount = 10 + i % 90
+        if every and i % every == 0:
+            messages.append(f"paragon{i} {amount}")
+        else:
+            messages.append(f"{known[i % len(known)]} {amount}")
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("openai", "local", "rules"), default="local")
+    parser.add_argument("--base-url", help="OPENAI_BASE_URL; default: an in-process stand-in for --backend local")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10, help="Conversations in flight at once")
+    parser.add_argument("--ai-share", type=float, default=0.5, help="Share of messages the rule parser cannot read")
+    parser.add_argument("--latency-ms", type=float, default=400, help="In-process stand-in delay per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="In-process stand-in HTTP 500 share")
+    parser.add_argument("--sheets-ms", type=float, default=50, help="Simulated Google Sheets write")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    # bot.config reads these at import time, so set them before any bot import
+    state_dir = tempfile.TemporaryDirectory()
+    os.environ["PARSER_BACKEND"] = args.backend
+    os.environ["STATE_DB_PATH"] = os.path.join(state_dir.name, "state.db")
+    os.environ["PARSE_CACHE_MAX_ENTRIES"] = "0"
+
+    server = None
+    if args.backend == "local" and not args.base_url:
+        from benchmarks.fake_openai import FakeOpenAI
+        server = FakeOpenAI(args.latency_ms / 1000, error_rate=args.error_rate).__enter__()
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+    elif args.base_url:
+        os.environ["OPENAI_BASE_URL"] = args.base_url
+
+    from bot.config import ALLOWED_USER_ID
+    from bot.services import ai_parser, database, sheets, storage
+
+    logging.getLogger("httpx2").setLevel(logging.WARNING)
+    storage._init_db()
+    row_counter = iter(range(2, 10**9))
+
+    def save_expenses_to_sheet(expenses, original_text):
+        time.sleep(args.sheets_ms / 1000)
+        return [next(row_counter) for _ in expenses]
+
+    sheets.save_expenses_to_sheet = save_expenses_to_sheet
+
+    texts = build_messages(args.messages, args.ai_share)
+    try:
+        start = time.perf_counter()
+        latencies, outcomes = asyncio.run(_run(texts, ALLOWED_USER_ID, args.concurrency))
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.__exit__(None, None, None)
+        state_dir.cleanup()
+
+    stats = ai_parser.parser_stats()
+    result = {
+        "backend": args.backend,
+        "database": database.is_available(),
+        "messages": len(texts),
+        "outcomes": outcomes,
+        "seconds": round(elapsed, 3),
+        "messages_per_s": round(len(texts) / elapsed, 1),
+        "ai_requests": stats["requests"],
+        "ai_batches": stats["batches"],
+        "latency_p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "latency_p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "latency_mean_ms": round(statistics.mean(latencies) * 1000, 1),
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    for key, value in result.items():
+        print(f"{key:16} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Latency of database.search_expenses at growing expense-history sizes.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.search
+    DATABASE_URL=postgresql://... python -m benchmarks.search --sizes 10000 100000 --repeat 20
+
+Fills one throwaway user's history with generated expenses (generate_series,
+in INSERTs of _FILL_CHUNK rows) up to each --sizes count, then times each query
+--repeat times, both ways:
+- like:   the previous LOWER(col) LIKE '%q%' scan over four columns, all rows;
+- search: the indexed full-text search (migration 005), first page of 20
+          with the total count, as /search and `budzet search` run it.
+The benchmark user and its expenses are deleted at the end. Use a scratch
+database: migrations are applied and bulk inserts fire the expense triggers.
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from bot.services import database
+
+_WORDS = ["biedronka", "lidl", "zabka", "kaufland", "orlen", "apteka", "kino", "obiad",
+          "kebab", "pizza", "paliwo", "bilet", "prezent", "czynsz", "netflix", "spotify",
+          "fryzjer", "ksiazki", "siłownia", "taxi"]
+
+# Rows per INSERT/DELETE; the monthly totals trigger folds each statement's rows into one jsonb
+_FILL_CHUNK = 100_000
+
+QUERIES = {
+    "word": "kebab",                # ~1 in 10 rows
+    "prefix": "bied",               # ~1 in 10 rows, as a prefix
+    "two words": "obiad pizza",     # ~1 in 200 rows, in either order
+    "miss": "samolot",              # no rows
+}
+
+_LIKE = """SELECT id, amount, date, category, subcategory, description, original_text, month_name, created_at
+           FROM expenses WHERE user_id = %s AND (
+               LOWER(description) LIKE LOWER(%s)
+               OR LOWER(category) LIKE LOWER(%s)
+               OR LOWER(subcategory) LIKE LOWER(%s)
+               OR LOWER(original_text) LIKE LOWER(%s)
+           )
+           ORDER BY date DESC, created_at DESC"""
+
+
+def _fill(user_id: int, start: int, stop: int) -> None:
+    # Word choice from i mixed with a multiplier, so words combine independently
+    database._execute(
+        """INSERT INTO expenses (user_id, amount, date, category, subcategory, description, original_text, month_name)
+           SELECT %s, round((random() * 200)::numeric, 2), DATE '2023-01-01' + (i %% 1000),
+                  'Jedzenie', 'Jedzenie dom',
+                  (%s::text[])[1 + i %% 20] || ' ' || (%s::text[])[1 + (i * 7 / 20) %% 20],
+                  'zakupy ' || i, 'Styczeń'
+           FROM generate_series(%s, %s - 1) AS i""",
+        (user_id, _WORDS, _WORDS, start, stop),
+    )
+
+
+def _time(func, repeat: int) -> tuple[float, int]:
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = len(func())
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per query; the median is reported")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    if not database.DATABASE_URL:
+        parser.error("DATABASE_URL is not set")
+    database.init_db()
+    user_id = database.get_or_create_user(-int(time.time()), "search benchmark")
+    results = []
+    try:
+        filled = 0
+        for size in sorted(args.sizes):
+            started = time.perf_counter()
+            for chunk_start in range(filled, size, _FILL_CHUNK):
+                _fill(user_id, chunk_start, min(chunk_start + _FILL_CHUNK, size))
+            database._execute("ANALYZE expenses")
+            fill_seconds = time.perf_counter() - started
+            filled = size
+            for name, query in QUERIES.items():
+                pattern = f"%{query}%"
+                like_ms, like_rows = _time(
+                    lambda: database._execute_dict(_LIKE, (user_id, pattern, pattern, pattern, pattern)), args.repeat)
+                search_ms, page_rows = _time(
+                    lambda: database.search_expenses(user_id, query, limit=20), args.repeat)
+                page = database.search_expenses(user_id, query, limit=20)
+                results.append({
+                    "rows": size,
+                    "query": name,
+                    "like_ms": round(like_ms, 2),
+                    "like_matches": like_rows,
+                    "search_ms": round(search_ms, 2),
+                    "search_matches": page[0]["total_count"] if page else 0,
+                    "fill_s": round(fill_seconds, 1),
+                })
+    finally:
+        while database._execute(
+                """DELETE FROM expenses WHERE id IN (SELECT id FROM expenses WHERE user_id = %s LIMIT %s)
+                   RETURNING id""", (user_id, _FILL_CHUNK), fetch=True):
+            pass
+        database._execute("DELETE FROM users WHERE id = %s", (user_id,))
+        database.close_pool()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'rows':>9} {'query':10} {'like ms':>9} {'matches':>8} {'search ms':>10} {'matches':>8}")
+    for r in results:
+        print(f"{r['rows']:>9} {r['query']:10} {r['like_ms']:>9} {r['like_matches']:>8} "
+              f"{r['search_ms']:>10} {r['search_matches']:>8}")
+
+
+if __name__ == "__main__":
+    main()
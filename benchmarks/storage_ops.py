@@ -0,0 +1,125 @@
+"""Operations per second of the SQLite state storage.
+
+    python -m benchmarks.storage_ops
+    python -m benchmarks.storage_ops --rounds 5000 --threads 4
+
+Two workloads, each round on its own pending expense:
+- confirm: save_pending, get_pending twice, save_pending, pop_pending,
+  save_last_saved — one confirmed expense;
+- edit: save_pending, then the storage calls of a category edit
+  (edit -> cat -> sub -> back taps): get_pending_entry three times,
+  replace_pending, get_pending.
+
+Each runs against a temporary file-backed state DB in three modes: a
+connection opened and closed per call (the original behaviour, default
+synchronous=FULL), persistent per-thread connections with the pending
+cache off, and with it on. --threads runs that many workers at once.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from bot.services import storage
+
+
+def _data(worker: int) -> dict:
+    return {"user_id": worker, "expenses": [{"amount": 12.5, "category": "Jedzenie", "subcategory": "Jedzenie dom",
+                                             "description": "chleb", "date": "2026-02-15"}],
+            "original_text": "chleb 12,5"}
+
+
+def _confirm_round(worker: int, i: int) -> int:
+    expense_id = f"{worker}-{i}"
+    data = _data(worker)
+    storage.save_pending(expense_id, data)
+    storage.get_pending(expense_id)
+    storage.get_pending(expense_id)
+    storage.save_pending(expense_id, data)
+    storage.pop_pending(expense_id)
+    storage.save_last_saved(worker, {"row_indices": [i], "expenses": data["expenses"]})
+    return 6
+
+
+def _edit_round(worker: int, i: int) -> int:
+    expense_id = f"{worker}-{i}"
+    storage.save_pending(expense_id, _data(worker))
+    storage.get_pending_entry(expense_id)  # edit
+    storage.get_pending_entry(expense_id)  # cat
+    pending, version = storage.get_pending_entry(expense_id)  # sub
+    pending["expenses"][0]["category"] = "Rozrywka"
+    storage.replace_pending(expense_id, pending, version)
+    storage.get_pending(expense_id)  # back
+    return 6
+
+
+ROUNDS = {"confirm": _confirm_round, "edit": _edit_round}
+
+
+def run(workload: str, mode: str, rounds: int, threads: int) -> dict:
+    round_func = ROUNDS[workload]
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DB_PATH = os.path.join(tmp, "state.db")
+        storage._init_db()
+        original = storage._get_conn, storage.PENDING_CACHE_MAX_ENTRIES
+        if mode == "per-call":
+            storage._get_conn = lambda: sqlite3.connect(storage.DB_PATH)
+        if mode != "cached":
+            storage.PENDING_CACHE_MAX_ENTRIES = 0
+        ops = [0] * threads
+
+        def worker(n: int):
+            for i in range(rounds):
+                ops[n] += round_func(n, i)
+            storage.close()
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        start = time.perf_counter()
+        try:
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+        finally:
+            storage._get_conn, storage.PENDING_CACHE_MAX_ENTRIES = original
+        elapsed = time.perf_counter() - start
+        storage.close()
+    return {
+        "workload": workload,
+        "mode": mode,
+        "threads": threads,
+        "ops": sum(ops),
+        "seconds": round(elapsed, 3),
+        "ops_per_s": round(sum(ops) / elapsed),
+        "us_per_op": round(elapsed / sum(ops) * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000, help="Expense round trips per thread")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = [
+        run(workload, mode, args.rounds, args.threads)
+        for workload in ROUNDS
+        for mode in ("per-call", "persistent", "cached")
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(f"{result['workload']} / {result['mode']}:")
+        for key, value in result.items():
+            if key not in ("workload", "mode"):
+                print(f"  {key:12} {value}")
+
+
+if __name__ == "__main__":
+    main()
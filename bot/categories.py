@@ -79,7 +79,27 @@ def build_categories_display() -> str:
     return "\n".join(lines)
 
 
+def build_subcategory_codes() -> dict[str, tuple[str, str]]:
+    """Short codes for prompts: "<category no>.<subcategory no>" -> (category, subcategory)."""
+    return {
+        f"{i}.{j}": (cat, sub)
+        for i, (cat, subs) in enumerate(CATEGORIES.items(), 1)
+        for j, sub in enumerate(subs, 1)
+    }
+
+
+def build_categories_codes_context() -> str:
+    """One line per category listing its subcategory codes, e.g. "1 Jedzenie: 1.1 Jedzenie dom; ..."."""
+    lines = []
+    for i, (cat, subs) in enumerate(CATEGORIES.items(), 1):
+        codes = "; ".join(f"{i}.{j} {sub}" for j, sub in enumerate(subs, 1))
+        lines.append(f"{i} {cat}: {codes}")
+    return "\n".join(lines)
+
+
 CATEGORIES_CONTEXT = build_categories_context()
+SUBCATEGORY_CODES = build_subcategory_codes()
+CATEGORIES_CODES_CONTEXT = build_categories_codes_context()
 CATEGORIES_DISPLAY = build_categories_display()
 
 
@@ -7,22 +7,30 @@ import logging
 import re
 import sys
 from datetime import datetime, date, timedelta
+from decimal import Decimal
 from io import StringIO
 
 logger = logging.getLogger(__name__)
 
-from rich.columns import Columns
-from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
-from rich.tree import Tree
-from rich import box
-
 from bot.config import ALLOWED_USER_ID, MONTHS_MAPPING, MONTH_NAME_TO_NUM
 from bot.categories import CATEGORIES, CATEGORIES_DISPLAY, CATEGORY_EMOJIS, INCOME_CATEGORIES, INCOME_CATEGORY_EMOJIS
 from bot.i18n import t, set_lang
 
-console = Console()
+
+class _LazyConsole:
+    """The rich Console, imported on first print: rich is a large import,
+    and argparse errors or --help never need it."""
+
+    _console = None
+
+    def __getattr__(self, name):
+        if self._console is None:
+            from rich.console import Console
+            _LazyConsole._console = Console()
+        return getattr(self._console, name)
+
+
+console = _LazyConsole()
 
 
 # ── helpers ──────────────────────────────────────────────────────────
@@ -128,8 +136,11 @@ def _normalize_expense(e: dict) -> dict:
     return result
 
 
-def _rich_expense_table(expenses: list[dict], title: str) -> Table:
+def _rich_expense_table(expenses: list[dict], title: str) -> "Table":
     """Return a rich Table for a list of expense dicts."""
+    from rich import box
+    from rich.table import Table
+
     table = Table(
         title=title,
         show_header=True,
@@ -158,18 +169,13 @@ def _check_budgets(user_db_id: int, expenses: list[dict]) -> list[str]:
 
     warnings = []
     try:
-        budgets = database.get_budgets(user_db_id)
-        if not budgets:
-            return warnings
-
         expense_date = datetime.strptime(expenses[0]["date"], "%Y-%m-%d")
-        month_name = MONTHS_MAPPING[expense_date.month]
 
-        for budget in budgets:
+        for budget in database.get_budget_status(user_db_id, expense_date.year, expense_date.month):
             cat = budget["category"]
-            limit_val = float(budget["monthly_limit"])
-            usage = database.get_budget_usage(user_db_id, cat, month_name)
-            pct = (usage / limit_val * 100) if limit_val > 0 else 0
+            limit_val = budget["monthly_limit"]
+            usage = budget["used"]
+            pct = budget["pct"]
 
             display_cat = cat if cat else _strip_markdown(t("budget_total_label"))
             if pct >= 100:
@@ -206,13 +212,14 @@ def _check_budgets(user_db_id: int, expenses: list[dict]) -> list[str]:
 
 def cmd_add(args):
     """Parse and save expense(s) via AI."""
-    from bot.services import ai_parser, database, sheets, storage
+    from bot.services import database, expense_parser, fast_parser, sheets, storage, sync
 
     text = " ".join(args.text)
     console.print(f"Parsing: {text}")
 
     try:
-        expenses = ai_parser.parse_expenses(text)
+        dictionary = fast_parser.get_dictionary(ALLOWED_USER_ID)
+        expenses = expense_parser.parse_expenses(text, dictionary)
     except Exception as e:
         console.print(f"[bold red]Error parsing expense:[/bold red] {e}")
         return 1
@@ -256,13 +263,12 @@ def cmd_add(args):
             )
 
             try:
-                row_indices = sheets.save_expenses_to_sheet(expenses, text)
-                for eid, ridx in zip(expense_ids, row_indices):
-                    database.mark_synced(eid, ridx)
+                sync.sync_saved_expenses(expense_ids, expenses, text)
             except Exception:
                 console.print("[dim](Sheets sync deferred)[/dim]")
 
             warnings = _check_budgets(user_db_id, expenses)
+            fast_parser.learn(ALLOWED_USER_ID, expenses)
             n = len(expenses)
             msg = f"Saved {n} expense{'s' if n > 1 else ''}!"
             if _json_mode(args):
@@ -277,6 +283,7 @@ def cmd_add(args):
                 ALLOWED_USER_ID,
                 {"row_indices": row_indices, "expenses": expenses},
             )
+            fast_parser.learn(ALLOWED_USER_ID, expenses)
             n = len(expenses)
             msg = f"Saved {n} expense{'s' if n > 1 else ''}!"
             if _json_mode(args):
@@ -355,6 +362,8 @@ def cmd_income(args):
 
 def cmd_incomes(args):
     """Show income list for current (or given) month."""
+    from rich.table import Table
+
     _require_db()
     from bot.services import database
 
@@ -407,47 +416,21 @@ def cmd_incomes(args):
 
 def cmd_summary(args):
     """Show monthly summary by category with subcategory breakdown."""
-    from bot.services import database, sheets
+    from rich import box
+    from rich.panel import Panel
+    from rich.table import Table
+    from bot.services import database, sheet_mirror
 
     target_month = _resolve_month(args.month)
 
-    totals: dict[str, float] = {}
-    sub_totals: dict[str, dict[str, float]] = {}
-    count = 0
-
     try:
         if database.is_available():
             user_db_id = _get_user_id()
-            rows = database.get_expenses_by_month(user_db_id, target_month)
-            for row in rows:
-                amount = float(row["amount"])
-                category = row["category"]
-                totals[category] = totals.get(category, 0) + amount
-                subcategory = row["subcategory"]
-                if subcategory:
-                    sub_totals.setdefault(category, {})
-                    sub_totals[category][subcategory] = (
-                        sub_totals[category].get(subcategory, 0) + amount
-                    )
-                count += 1
+            start, end = database.month_range(target_month)
+            rows = database.get_category_totals(user_db_id, start, end)
         else:
-            all_rows = sheets.get_all_rows()
-            for row in all_rows:
-                if len(row) < 7 or row[6].strip() != target_month:
-                    continue
-                try:
-                    amount = float(row[1].replace("\xa0", "").replace(" ", "").replace(",", "."))
-                    category = row[2]
-                    totals[category] = totals.get(category, 0) + amount
-                    subcategory = row[3] if len(row) > 3 else ""
-                    if subcategory:
-                        sub_totals.setdefault(category, {})
-                        sub_totals[category][subcategory] = (
-                            sub_totals[category].get(subcategory, 0) + amount
-                        )
-                    count += 1
-                except (ValueError, IndexError):
-                    continue
+            rows = sheet_mirror.get_month_totals(target_month)
+        _, count, totals, sub_totals = database.fold_category_totals(rows)
     except Exception as e:
         console.print(f"[bold red]Error:[/bold red] {e}")
         return 1
@@ -536,28 +519,44 @@ def cmd_search(args):
     _require_db()
     from bot.services import database
 
+    for d, label in [(args.date_from, "--from"), (args.date_to, "--to")]:
+        if d is None:
+            continue
+        try:
+            datetime.strptime(d, "%Y-%m-%d")
+        except ValueError:
+            console.print(f"[bold red]Error:[/bold red] {label} date must be in YYYY-MM-DD format.")
+            return 1
+
     query = " ".join(args.query)
+    page = max(args.page, 1)
     user_db_id = _get_user_id()
-    results = database.search_expenses(user_db_id, query)
+    results = database.search_expenses(
+        user_db_id, query, limit=20, offset=(page - 1) * 20,
+        min_amount=args.min_amount, max_amount=args.max_amount,
+        start=args.date_from, end=args.date_to,
+    )
 
     if not results:
         console.print(f'No results for: "{query}"')
         return 0
 
-    display = results[:20]
+    total = results[0]["total_count"]
 
     if _json_mode(args):
         data = {
             "query": query,
-            "count": len(results),
-            "expenses": [_normalize_expense(e) for e in display],
+            "count": total,
+            "page": page,
+            "expenses": [_normalize_expense(e) for e in results],
         }
         print(_json.dumps(data, ensure_ascii=False, indent=2))
         return 0
 
-    console.print(_rich_expense_table(display, f'Results for "{query}" ({len(results)} found)'))
-    if len(results) > 20:
-        console.print(f"[dim]... +{len(results) - 20} more[/dim]")
+    console.print(_rich_expense_table(results, f'Results for "{query}" ({total} found)'))
+    remaining = total - (page - 1) * 20 - len(results)
+    if remaining > 0:
+        console.print(f"[dim]... +{remaining} more (--page {page + 1})[/dim]")
     return 0
 
 
@@ -638,6 +637,10 @@ def cmd_export(args):
 
 def cmd_budget(args):
     """Manage monthly budgets (set/list/remove)."""
+    from rich import box
+    from rich.panel import Panel
+    from rich.table import Table
+
     _require_db()
     from bot.services import database
 
@@ -658,7 +661,8 @@ def cmd_budget(args):
         return 0
 
     if action == "list":
-        budgets = database.get_budgets(user_db_id)
+        now = datetime.now()
+        budgets = database.get_budget_status(user_db_id, now.year, now.month)
         if not budgets:
             msg = "No budgets set."
             if _json_mode(args):
@@ -667,19 +671,15 @@ def cmd_budget(args):
                 console.print(msg)
             return 0
 
-        month_name = MONTHS_MAPPING[datetime.now().month]
-        budget_rows = []
-        for budget in budgets:
-            cat = budget["category"]
-            limit_val = float(budget["monthly_limit"])
-            usage = database.get_budget_usage(user_db_id, cat, month_name)
-            pct = (usage / limit_val * 100) if limit_val > 0 else 0
-            budget_rows.append({
-                "category": cat or "total",
-                "monthly_limit": round(limit_val, 2),
-                "used": round(usage, 2),
-                "pct": round(pct, 1),
-            })
+        budget_rows = [
+            {
+                "category": budget["category"] or "total",
+                "monthly_limit": round(budget["monthly_limit"], 2),
+                "used": round(budget["used"], 2),
+                "pct": round(budget["pct"], 1),
+            }
+            for budget in budgets
+        ]
 
         if _json_mode(args):
             print(_json.dumps({"month": month_name, "budgets": budget_rows}, ensure_ascii=False, indent=2))
@@ -737,28 +737,18 @@ def cmd_chart(args):
     """Generate expense chart and save as PNG."""
     _require_db()
     from bot.services import database
-    from bot.utils.formatting import generate_pie_chart, generate_bar_chart
+    from bot.utils.formatting import generate_pie_chart, generate_bar_chart, bar_chart_data
 
     user_db_id = _get_user_id()
     chart_type = args.type or "pie"
     output_file = args.output or "chart.png"
 
     if chart_type == "bar":
-        months_data = {}
-        now = datetime.now()
-        for i in range(3):
-            m = now.month - i
-            y = now.year
-            if m <= 0:
-                m += 12
-                y -= 1
-            month_name = MONTHS_MAPPING[m]
-            rows = database.get_expenses_by_month(user_db_id, month_name)
-            totals = {}
-            for row in rows:
-                cat = row["category"]
-                totals[cat] = totals.get(cat, 0) + float(row["amount"])
-            months_data[month_name] = totals
+        this_month = datetime.now().date().replace(day=1)
+        trend = database.get_monthly_trend(
+            user_db_id, database.shift_month(this_month, -2), this_month
+        )
+        months_data = bar_chart_data(trend)
 
         if not any(months_data.values()):
             console.print("No data for chart.")
@@ -768,11 +758,9 @@ def cmd_chart(args):
         buf = generate_bar_chart(months_data, title)
     else:
         target_month = _resolve_month(args.month)
-        rows = database.get_expenses_by_month(user_db_id, target_month)
-        categories_data = {}
-        for row in rows:
-            cat = row["category"]
-            categories_data[cat] = categories_data.get(cat, 0) + float(row["amount"])
+        start, end = database.month_range(target_month)
+        rows = database.get_category_totals(user_db_id, start, end)
+        categories_data = database.fold_category_totals(rows)[2]
 
         if not categories_data:
             console.print(f"No data for chart in: {target_month}.")
@@ -804,6 +792,10 @@ FREQ_MAP = {
 
 def cmd_recurring(args):
     """Manage recurring expenses (add/list/remove)."""
+    from rich import box
+    from rich.panel import Panel
+    from rich.table import Table
+
     _require_db()
     from bot.services import database
 
@@ -902,17 +894,18 @@ def cmd_recurring(args):
 
 def cmd_balance(args):
     """Show income vs expenses balance for current month."""
+    from rich.panel import Panel
+
     _require_db()
     from bot.services import database
 
     user_db_id = _get_user_id()
     month_name = MONTHS_MAPPING[datetime.now().month]
+    start, end = database.month_range(month_name)
 
-    expenses = database.get_expenses_by_month(user_db_id, month_name)
-    total_expenses = sum(float(e["amount"]) for e in expenses)
-
-    income_items = database.get_income_by_month(user_db_id, month_name)
-    total_income = sum(float(i["amount"]) for i in income_items)
+    rows = database.get_category_totals(user_db_id, start, end)
+    total_expenses = database.fold_category_totals(rows)[0]
+    total_income = database.get_income_total(user_db_id, start, end)
 
     if total_expenses == 0 and total_income == 0:
         console.print(f"No data for: {month_name}.")
@@ -943,6 +936,8 @@ def cmd_balance(args):
 
 def cmd_categories(args):
     """Display all expense categories."""
+    from rich.tree import Tree
+
     if _json_mode(args):
         data = {
             "categories": [
@@ -1042,77 +1037,98 @@ def cmd_sync(args):
     _require_db()
     from bot.services import sync
 
-    count = sync.sync_unsynced_to_sheets()
+    result = sync.run_sync(chunk_size=getattr(args, "chunk_size", None))
+    count = result["synced"] + result["recovered"]
     if count:
-        msg = f"Synced {count} expense{'s' if count > 1 else ''} to Google Sheets."
+        msg = (
+            f"Synced {count} expense{'s' if count > 1 else ''} to Google Sheets "
+            f"({result['rows_per_sec']:.1f} rows/s)."
+        )
     else:
         msg = "Nothing to sync."
+    if result["remaining"]:
+        msg += f" Backlog remaining: {result['remaining']}."
 
     if _json_mode(args):
-        print(_json.dumps({"status": "ok", "message": msg, "count": count}, ensure_ascii=False))
+        print(_json.dumps({
+            "status": "error" if result["error"] else "ok",
+            "message": msg,
+            "count": count,
+            "chunks": result["chunks"],
+            "rows_per_sec": round(result["rows_per_sec"], 1),
+            "remaining": result["remaining"],
+            "error": result["error"],
+        }, ensure_ascii=False))
     else:
         console.print(f"[bold green]{msg}[/bold green]" if count else msg)
-    return 0
+        if result["error"]:
+            console.print(f"[bold red]Error:[/bold red] {result['error']}")
+    return 1 if result["error"] else 0
 
 
 def cmd_import_sheets(args):
     """Import all expenses from Google Sheets into the database."""
     _require_db()
-    from bot.services import database, sheets
+    from bot.services import database, importer
     from bot.config import ALLOWED_USER_ID
 
     user_db_id = database.get_or_create_user(ALLOWED_USER_ID)
 
-    console.print("Fetching rows from Google Sheets...")
-    all_rows = sheets.get_all_rows()
-
-    # Skip header row if present
-    data_rows = all_rows
-    if data_rows and data_rows[0][0].lower() in ("date", "data"):
-        data_rows = data_rows[1:]
+    def progress(result):
+        if not _json_mode(args):
+            console.print(
+                f"  [dim]{result['rows']} rows read, {result['imported']} imported "
+                f"({result['rows_per_sec']:.0f} rows/s)[/dim]"
+            )
 
-    imported = 0
-    skipped = 0
-    for row in data_rows:
-        if len(row) < 5:
-            skipped += 1
-            continue
-        try:
-            date_str = row[0].strip()
-            amount = float(row[1].replace("\xa0", "").replace(" ", "").replace(",", "."))
-            category = row[2].strip()
-            subcategory = row[3].strip() if len(row) > 3 else ""
-            description = row[4].strip() if len(row) > 4 else ""
-            original_text = row[5].strip() if len(row) > 5 else ""
-
-            # Validate date
-            datetime.strptime(date_str, "%Y-%m-%d")
-
-            expense_dict = {
-                "amount": amount,
-                "date": date_str,
-                "category": category,
-                "subcategory": subcategory,
-                "description": description,
-            }
-            database.save_expense(user_db_id, expense_dict, original_text)
-            imported += 1
-        except (ValueError, IndexError) as e:
-            skipped += 1
-            if args.verbose:
-                console.print(f"  [dim]Skipped row: {row[:3]}... ({e})[/dim]")
-            continue
+    if not _json_mode(args):
+        console.print("Importing rows from Google Sheets...")
+    result = importer.import_from_sheets(
+        user_db_id,
+        page_size=args.page_size,
+        resume=not args.restart,
+        progress=progress,
+    )
 
-    msg = f"Imported {imported} expenses into database. Skipped {skipped} rows."
+    imported = result["imported"]
+    skipped = sum(result["skipped"].values())
+    msg = (
+        f"Imported {imported} expenses into database "
+        f"({result['rows_per_sec']:.0f} rows/s). Skipped {skipped} rows."
+    )
     if _json_mode(args):
-        print(_json.dumps({"status": "ok", "message": msg, "imported": imported, "skipped": skipped}, ensure_ascii=False))
+        print(_json.dumps({
+            "status": "ok",
+            "message": msg,
+            "imported": imported,
+            "skipped": skipped,
+            "skipped_reasons": result["skipped"],
+            "skipped_rows": [
+                {"row": r, "reason": reason, "detail": detail}
+                for r, reason, detail in result["skipped_rows"]
+            ],
+            "rows_per_sec": round(result["rows_per_sec"], 1),
+            "resumed_from": result["resumed_from"],
+        }, ensure_ascii=False))
     else:
+        if result["resumed_from"]:
+            console.print(f"Resumed from row {result['resumed_from']}.")
         console.print(f"[bold green]{msg}[/bold green]")
+        for reason, count in sorted(result["skipped"].items()):
+            console.print(f"  {reason}: {count}")
+        if args.verbose:
+            for r, reason, detail in result["skipped_rows"]:
+                console.print(f"  [dim]Skipped row {r}: {reason} {detail}[/dim]")
     return 0
 
 
 def cmd_dashboard(args):
     """At-a-glance overview of current month."""
+    from rich import box
+    from rich.columns import Columns
+    from rich.panel import Panel
+    from rich.table import Table
+
     _require_db()
     from bot.services import database
 
@@ -1120,21 +1136,18 @@ def cmd_dashboard(args):
     now = datetime.now()
     month_name = MONTHS_MAPPING[now.month]
 
+    start, end = database.month_range(month_name, now.date())
+
     # Fetch all data
-    expenses = database.get_expenses_by_month(user_db_id, month_name)
-    totals: dict[str, float] = {}
-    for e in expenses:
-        cat = e["category"]
-        totals[cat] = totals.get(cat, 0) + float(e["amount"])
-    grand_total = sum(totals.values())
+    rows = database.get_category_totals(user_db_id, start, end)
+    grand_total, expense_count, totals, _ = database.fold_category_totals(rows)
 
     budgets = database.get_budgets(user_db_id)
     budget_map = {b["category"]: float(b["monthly_limit"]) for b in budgets}
 
     recent = database.get_recent_expenses(user_db_id, limit=5)
 
-    income_items = database.get_income_by_month(user_db_id, month_name)
-    total_income = sum(float(i["amount"]) for i in income_items)
+    total_income = database.get_income_total(user_db_id, start, end)
     net = total_income - grand_total
 
     if _json_mode(args):
@@ -1145,7 +1158,7 @@ def cmd_dashboard(args):
                 "total_expenses": round(grand_total, 2),
                 "total_income": round(total_income, 2),
                 "net": round(net, 2),
-                "expense_count": len(expenses),
+                "expense_count": expense_count,
             },
             "categories": [
                 {
@@ -1253,8 +1266,49 @@ def cmd_dashboard(args):
     return 0
 
 
+def cmd_rollup(args):
+    """Rebuild or verify the monthly_category_totals rollup."""
+    _require_db()
+    from bot.services import database
+
+    rebuilt = None
+    if args.rollup_action == "rebuild":
+        rebuilt = database.rebuild_monthly_totals()
+    mismatches = database.verify_monthly_totals()
+
+    if rebuilt is not None:
+        msg = f"Rollup rebuilt: {rebuilt} rows."
+    else:
+        msg = "Rollup checked."
+    msg += " Consistent with expenses." if not mismatches else f" {len(mismatches)} mismatches!"
+
+    if _json_mode(args):
+        print(_json.dumps({
+            "status": "ok" if not mismatches else "error",
+            "message": msg,
+            "rows": rebuilt,
+            "mismatches": [
+                {k: (float(v) if isinstance(v, Decimal) else v) for k, v in m.items()}
+                for m in mismatches
+            ],
+        }, ensure_ascii=False))
+    else:
+        console.print(f"[bold green]{msg}[/bold green]" if not mismatches else f"[bold red]{msg}[/bold red]")
+        for m in mismatches[:20]:
+            console.print(
+                f"  {m['year']}-{m['month']:02d} {m['category']} / {m['subcategory']}: "
+                f"expenses {m['expected_total']} ({m['expected_count']}), "
+                f"rollup {m['rollup_total']} ({m['rollup_count']})"
+            )
+    return 0 if not mismatches else 1
+
+
 def cmd_stats(args):
     """Spending analytics: monthly trends and top categories."""
+    from rich import box
+    from rich.panel import Panel
+    from rich.table import Table
+
     _require_db()
     from bot.services import database
 
@@ -1262,27 +1316,21 @@ def cmd_stats(args):
     now = datetime.now()
     n_months = max(1, min(args.months, 24))
 
-    # Build monthly data (oldest first)
+    # Build monthly data (oldest first) from one aggregate query
+    this_month = now.date().replace(day=1)
+    trend = database.get_monthly_trend(
+        user_db_id, database.shift_month(this_month, -(n_months - 1)), this_month
+    )
     monthly_data = []
-    for i in range(n_months - 1, -1, -1):
-        m = now.month - i
-        y = now.year
-        while m <= 0:
-            m += 12
-            y -= 1
-        month_name = MONTHS_MAPPING[m]
-        rows = database.get_expenses_by_month(user_db_id, month_name)
-        # Filter by year (get_expenses_by_month matches month name only, not year)
-        rows = [r for r in rows if str(r["date"]).startswith(str(y))]
-        by_cat: dict[str, float] = {}
-        for r in rows:
-            by_cat[r["category"]] = by_cat.get(r["category"], 0) + float(r["amount"])
+    for month, values, total in zip(trend["months"], trend["matrix"], trend["totals"]):
         monthly_data.append({
-            "month": month_name,
-            "year": y,
-            "month_num": m,
-            "total": round(sum(by_cat.values()), 2),
-            "by_category": by_cat,
+            "month": MONTHS_MAPPING[month.month],
+            "year": month.year,
+            "month_num": month.month,
+            "total": round(total, 2),
+            "by_category": {
+                cat: amt for cat, amt in zip(trend["categories"], values) if amt
+            },
         })
 
     # YTD by category (current calendar year only)
@@ -1410,6 +1458,11 @@ def build_parser() -> argparse.ArgumentParser:
         dest="output_json",
         help="Output data as JSON (for agents/scripting)",
     )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Run the command in a fresh interpreter and show where startup time went",
+    )
     sub = parser.add_subparsers(dest="command", help="Available commands")
 
     # add
@@ -1447,6 +1500,11 @@ def build_parser() -> argparse.ArgumentParser:
     # search
     p = sub.add_parser("search", help="Search expenses")
     p.add_argument("query", nargs="+", help="Search query")
+    p.add_argument("--min", dest="min_amount", type=float, help="Minimum amount")
+    p.add_argument("--max", dest="max_amount", type=float, help="Maximum amount")
+    p.add_argument("--from", dest="date_from", help="Start date (YYYY-MM-DD)")
+    p.add_argument("--to", dest="date_to", help="End date (YYYY-MM-DD)")
+    p.add_argument("--page", type=int, default=1, help="Page of 20 results (default: 1)")
 
     # expenses
     p = sub.add_parser("expenses", help="Filter expenses by date range")
@@ -1515,11 +1573,19 @@ def build_parser() -> argparse.ArgumentParser:
     p.add_argument("lang", choices=["pl", "en"], help="Language code")
 
     # sync
-    sub.add_parser("sync", help="Sync unsynced expenses to Google Sheets")
+    p = sub.add_parser("sync", help="Sync unsynced expenses to Google Sheets")
+    p.add_argument(
+        "--chunk-size", type=int, default=None,
+        help="Rows per Sheets append / DB update (default: SYNC_CHUNK_SIZE or 200)",
+    )
 
     # import-sheets
     p = sub.add_parser("import-sheets", help="Import expenses from Google Sheets into DB")
     p.add_argument("-v", "--verbose", action="store_true", help="Show skipped rows")
+    p.add_argument("--page-size", type=int, default=None, help="Sheet rows read per request")
+    p.add_argument(
+        "--restart", action="store_true", help="Ignore a saved checkpoint and start from row 1"
+    )
 
     # dashboard
     sub.add_parser("dashboard", help="At-a-glance overview of current month")
@@ -1534,6 +1600,12 @@ def build_parser() -> argparse.ArgumentParser:
         help="Number of months to analyze (default: 6)",
     )
 
+    # rollup
+    p_rollup = sub.add_parser("rollup", help="Maintain the monthly totals rollup")
+    rollup_sub = p_rollup.add_subparsers(dest="rollup_action")
+    rollup_sub.add_parser("rebuild", help="Recompute from expenses and verify")
+    rollup_sub.add_parser("verify", help="Compare with expenses without changing anything")
+
     return parser
 
 
@@ -1559,10 +1631,55 @@ COMMAND_MAP = {
     "import-sheets": cmd_import_sheets,
     "dashboard": cmd_dashboard,
     "stats": cmd_stats,
+    "rollup": cmd_rollup,
 }
 
 
+def _profile_startup(argv: list[str]) -> int:
+    """Re-run ``budzet <argv>`` under ``python -X importtime`` and print its
+    wall time and import-time breakdown (top-level imports and packages)."""
+    import subprocess
+    import time
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "bot.cli", *argv],
+        capture_output=True,
+        text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    sys.stdout.write(result.stdout)
+
+    top_level: list[tuple[float, str]] = []
+    packages: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            sys.stderr.write(line + "\n")
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # Column header
+        module = name.strip()
+        if len(name) - len(name.lstrip()) == 1:
+            top_level.append((int(cumulative_us) / 1000, module))
+        package = module.split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us) / 1000
+
+    import_ms = sum(ms for ms, _ in top_level)
+    print(f"\nStartup profile: {wall_ms:.0f} ms wall, {import_ms:.0f} ms importing modules")
+    print("\nSlowest top-level imports (incl. their dependencies):")
+    for ms, module in sorted(top_level, reverse=True)[:12]:
+        print(f"  {ms:8.1f} ms  {module}")
+    print("\nImport time by package:")
+    for package, ms in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:12]:
+        print(f"  {ms:8.1f} ms  {package}")
+    return result.returncode
+
+
 def main():
+    if "--profile-startup" in sys.argv[1:]:
+        sys.exit(_profile_startup([a for a in sys.argv[1:] if a != "--profile-startup"]))
+
     parser = build_parser()
     args = parser.parse_args()
 
@@ -1586,6 +1703,9 @@ def main():
     if args.command == "recurring" and not getattr(args, "recurring_action", None):
         parser.parse_args(["recurring", "--help"])
         return
+    if args.command == "rollup" and not getattr(args, "rollup_action", None):
+        parser.parse_args(["rollup", "--help"])
+        return
 
     handler = COMMAND_MAP.get(args.command)
     if handler:
@@ -2,15 +2,26 @@ import os
 import base64
 import tempfile
 import logging
+from functools import lru_cache
 from dotenv import load_dotenv
-import gspread
-from openai import OpenAI
 
 load_dotenv()
 
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN", "")
-OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
+# How messages the rule-based parser cannot read are parsed (bot.services.expense_parser):
+# "openai", "local" (an OpenAI-compatible stand-in, no API key needed) or "rules" (no AI)
+PARSER_BACKEND = os.environ.get("PARSER_BACKEND", "openai").lower()
+PARSER_BACKENDS = ("openai", "local", "rules")
+if PARSER_BACKEND not in PARSER_BACKENDS:
+    raise ValueError(f"PARSER_BACKEND must be one of {', '.join(PARSER_BACKENDS)}, got {PARSER_BACKEND!r}")
+OPENAI_API_KEY = os.environ["OPENAI_API_KEY"] if PARSER_BACKEND == "openai" else os.environ.get("OPENAI_API_KEY", "local")
+# The "local" backend defaults to `python -m benchmarks.fake_openai`
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or (
+    "http://127.0.0.1:8089/v1" if PARSER_BACKEND == "local" else None
+)
 SPREADSHEET_NAME = os.environ["SPREADSHEET_NAME"]
+# Opens the spreadsheet directly instead of searching Drive for SPREADSHEET_NAME
+SPREADSHEET_ID = os.environ.get("SPREADSHEET_ID")
 SHEET_TAB_NAME = os.environ["SHEET_TAB_NAME"]
 ALLOWED_USER_ID = int(os.environ["ALLOWED_USER_ID"])
 USER_LANGUAGE = os.environ.get("USER_LANGUAGE", "pl")
@@ -25,19 +36,68 @@ MONTHS_MAPPING = {
 
 MONTH_NAME_TO_NUM = {v.lower(): k for k, v in MONTHS_MAPPING.items()}
 
-# OpenAI client
-client_ai = OpenAI(api_key=OPENAI_API_KEY)
-
-# Google Sheets client — handles Railway (env var) and local file
-_creds_b64 = os.environ.get("GOOGLE_CREDENTIALS_BASE64")
-if _creds_b64:
-    _creds_json = base64.b64decode(_creds_b64 + "==").decode("utf-8")
-    _tmp = tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False)
-    _tmp.write(_creds_json)
-    _tmp.close()
-    gc = gspread.service_account(filename=_tmp.name)
-else:
-    gc = gspread.service_account(filename="credentials.json")
+# Clients are built on first use: importing this module stays cheap for CLI
+# commands that never talk to OpenAI or Google Sheets.
+
+
+@lru_cache(maxsize=None)
+def get_openai_client():
+    """Blocking OpenAI client (retries and timeouts are handled in bot.services.ai_parser)."""
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0)
+
+
+@lru_cache(maxsize=None)
+def get_async_openai_client():
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0)
+
+
+def credentials_file() -> str:
+    """Path of the Google service account key.
+
+    With GOOGLE_CREDENTIALS_BASE64 (Railway) the key is written once to a file
+    named after its hash and reused by later runs; otherwise credentials.json.
+    """
+    creds_b64 = os.environ.get("GOOGLE_CREDENTIALS_BASE64")
+    if not creds_b64:
+        return "credentials.json"
+    import hashlib
+
+    creds_json = base64.b64decode(creds_b64 + "==")
+    digest = hashlib.sha256(creds_json).hexdigest()[:16]
+    path = os.path.join(tempfile.gettempdir(), f"budzet-credentials-{digest}.json")
+    if not os.path.exists(path):
+        fd, tmp_path = tempfile.mkstemp(suffix=".json", dir=tempfile.gettempdir())
+        with os.fdopen(fd, "wb") as f:
+            f.write(creds_json)
+        os.replace(tmp_path, path)  # Atomic, so a concurrent start never reads half a file
+    return path
+
+
+@lru_cache(maxsize=None)
+def get_gspread_client():
+    import gspread
+    return gspread.service_account(filename=credentials_file())
+
+
+class _LazyClient:
+    """Stands in for a client until an attribute is first used, then
+    forwards everything to the one its factory builds."""
+
+    def __init__(self, factory):
+        self._factory = factory
+
+    def __getattr__(self, name):
+        # Private and dunder probes (mock.patch, copy, pickle) must not build the client
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._factory(), name)
+
+
+client_ai = _LazyClient(get_openai_client)
+client_ai_async = _LazyClient(get_async_openai_client)
+gc = _LazyClient(get_gspread_client)
 
 # Logging
 logging.basicConfig(
@@ -4,32 +4,29 @@ import logging
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from bot.services import sheets, storage, database
+from bot.services import sheets, storage, database, fast_parser, sync
 from bot.utils.formatting import build_preview_text, build_save_confirmation
 from bot.categories import CATEGORIES, CATEGORY_NAMES, CATEGORY_EMOJIS, INCOME_CATEGORIES, INCOME_CATEGORY_EMOJIS
-from bot.config import MONTHS_MAPPING
 from bot.i18n import t, set_lang
 
 logger = logging.getLogger(__name__)
 
+# Re-reads of a pending expense before a category edit gives up
+_CAS_ATTEMPTS = 5
+
 
 def _check_budgets(user_db_id: int, expenses: list[dict]) -> list[str]:
     """Check if any budgets are close to or exceeded. Returns warning strings."""
     warnings = []
     try:
-        budgets = database.get_budgets(user_db_id)
-        if not budgets:
-            return warnings
-
         # Determine month from first expense
         expense_date = datetime.strptime(expenses[0]["date"], "%Y-%m-%d")
-        month_name = MONTHS_MAPPING[expense_date.month]
 
-        for budget in budgets:
+        for budget in database.get_budget_status(user_db_id, expense_date.year, expense_date.month):
             cat = budget["category"]
-            limit_val = float(budget["monthly_limit"])
-            usage = database.get_budget_usage(user_db_id, cat, month_name)
-            pct = (usage / limit_val * 100) if limit_val > 0 else 0
+            limit_val = budget["monthly_limit"]
+            usage = budget["used"]
+            pct = budget["pct"]
 
             display_cat = cat if cat else t("budget_total_label")
             if pct >= 100:
@@ -114,14 +111,16 @@ async def _handle_income_callback(query, parts: list[str]) -> None:
     action = parts[0]
     income_id = parts[1]
 
-    if action == "income_cancel":
-        pending = storage.pop_pending_income(income_id)
-        if pending is None:
-            await query.edit_message_text(t("expense_expired"))
-            return
-        if query.from_user.id != pending["user_id"]:
+    # Only the owner's tap takes the entry; someone else's leaves it in place
+    pending = await storage.aio.pop_pending_income(income_id, user_id=query.from_user.id)
+    if pending is None:
+        if await storage.aio.get_pending_income(income_id) is not None:
             await query.answer(t("not_your_expense"), show_alert=True)
-            return
+        else:
+            await query.edit_message_text(t("expense_expired"))
+        return
+
+    if action == "income_cancel":
         await query.edit_message_text(t("income_cancelled"))
         return
 
@@ -129,20 +128,12 @@ async def _handle_income_callback(query, parts: list[str]) -> None:
     cat_idx = int(parts[2])
     category = INCOME_CATEGORIES[cat_idx]
 
-    pending = storage.pop_pending_income(income_id)
-    if pending is None:
-        await query.edit_message_text(t("expense_expired"))
-        return
-    if query.from_user.id != pending["user_id"]:
-        await query.answer(t("not_your_expense"), show_alert=True)
-        return
-
     try:
-        user_db_id = database.get_or_create_user(
+        user_db_id = await database.aio.get_or_create_user(
             pending["user_id"],
             query.from_user.full_name,
         )
-        database.save_income(
+        await database.aio.save_income(
             user_db_id,
             pending["amount"],
             pending["source"],
@@ -153,7 +144,7 @@ async def _handle_income_callback(query, parts: list[str]) -> None:
 
         # Sync to Sheets (best-effort)
         try:
-            sheets.save_income_to_sheet({
+            await database.run_async(sheets.save_income_to_sheet, {
                 "date": pending["date"],
                 "amount": pending["amount"],
                 "category": category,
@@ -199,10 +190,11 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # For edit/cat/sub/back, we need to peek at the pending expense without removing it
     if action in ("edit", "cat", "sub", "back"):
-        pending = storage.get_pending(expense_id)
-        if pending is None:
+        entry = await storage.aio.get_pending_entry(expense_id)
+        if entry is None:
             await query.edit_message_text(t("expense_expired"))
             return
+        pending, version = entry
         if query.from_user.id != pending["user_id"]:
             await query.answer(t("not_your_expense"), show_alert=True)
             return
@@ -240,9 +232,22 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         cat_name = CATEGORY_NAMES[cat_idx]
         sub_name = CATEGORIES[cat_name][sub_idx]
 
-        pending["expenses"][item_idx]["category"] = cat_name
-        pending["expenses"][item_idx]["subcategory"] = sub_name
-        storage.save_pending(expense_id, pending)
+        # Compare-and-swap, so a concurrent edit is not overwritten and a
+        # confirmed or cancelled expense is not brought back
+        for _ in range(_CAS_ATTEMPTS):
+            pending["expenses"][item_idx]["category"] = cat_name
+            pending["expenses"][item_idx]["subcategory"] = sub_name
+            if await storage.aio.replace_pending(expense_id, pending, version):
+                break
+            entry = await storage.aio.get_pending_entry(expense_id)
+            if entry is None:
+                await query.edit_message_text(t("expense_expired"))
+                return
+            pending, version = entry
+        else:
+            logger.warning(f"Pending expense {expense_id} kept changing; edit dropped")
+            await query.answer(t("save_error"), show_alert=True)
+            return
 
         preview = build_preview_text(pending["expenses"])
         keyboard = _build_confirmation_keyboard(expense_id, len(pending["expenses"]))
@@ -251,7 +256,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if action == "back":
         # Return to preview
-        pending = storage.get_pending(expense_id)
+        pending = await storage.aio.get_pending(expense_id)
         if pending is None:
             await query.edit_message_text(t("expense_expired"))
             return
@@ -260,15 +265,14 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text(preview, reply_markup=keyboard, parse_mode="Markdown")
         return
 
-    # For confirm/cancel, pop the pending expense
-    pending = storage.pop_pending(expense_id)
+    # For confirm/cancel, pop the pending expense: of several taps (or bot
+    # replicas) racing here, exactly one gets it
+    pending = await storage.aio.pop_pending(expense_id, user_id=query.from_user.id)
     if pending is None:
-        await query.edit_message_text(t("expense_expired"))
-        return
-
-    if query.from_user.id != pending["user_id"]:
-        storage.save_pending(expense_id, pending)
-        await query.answer(t("not_your_expense"), show_alert=True)
+        if await storage.aio.get_pending(expense_id) is not None:
+            await query.answer(t("not_your_expense"), show_alert=True)
+        else:
+            await query.edit_message_text(t("expense_expired"))
         return
 
     if action == "cancel":
@@ -277,45 +281,47 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if action == "confirm":
         try:
-            if database.is_available():
-                user_db_id = database.get_or_create_user(
+            if await database.aio.is_available():
+                user_db_id = await database.aio.get_or_create_user(
                     pending["user_id"],
                     query.from_user.full_name,
                 )
-                expense_ids = database.save_expenses(
+                expense_ids = await database.aio.save_expenses(
                     user_db_id, pending["expenses"], pending["original_text"]
                 )
-                storage.save_last_saved(pending["user_id"], {
+                await storage.aio.save_last_saved(pending["user_id"], {
                     "expense_ids": expense_ids,
                     "expenses": pending["expenses"],
                 })
 
                 # Sync to Sheets in background (best-effort)
                 try:
-                    row_indices = sheets.save_expenses_to_sheet(
-                        pending["expenses"], pending["original_text"]
+                    await database.run_async(
+                        sync.sync_saved_expenses, expense_ids, pending["expenses"], pending["original_text"]
                     )
-                    for eid, ridx in zip(expense_ids, row_indices):
-                        database.mark_synced(eid, ridx)
                 except Exception:
                     logger.warning("Sheets sync failed, will retry later")
 
                 # Check budgets and warn
-                budget_warnings = _check_budgets(user_db_id, pending["expenses"])
+                budget_warnings = await database.run_async(
+                    _check_budgets, user_db_id, pending["expenses"]
+                )
                 result_text = build_save_confirmation(pending["expenses"])
                 if budget_warnings:
                     result_text += "\n\n" + "\n".join(budget_warnings)
+                fast_parser.learn(pending["user_id"], pending["expenses"], pending.get("suggested"))
                 await query.edit_message_text(result_text)
             else:
                 # Fallback: Sheets-only mode
-                row_indices = sheets.save_expenses_to_sheet(
-                    pending["expenses"], pending["original_text"]
+                row_indices = await database.run_async(
+                    sheets.save_expenses_to_sheet, pending["expenses"], pending["original_text"]
                 )
-                storage.save_last_saved(pending["user_id"], {
+                await storage.aio.save_last_saved(pending["user_id"], {
                     "row_indices": row_indices,
                     "expenses": pending["expenses"],
                 })
                 result_text = build_save_confirmation(pending["expenses"])
+                fast_parser.learn(pending["user_id"], pending["expenses"], pending.get("suggested"))
                 await query.edit_message_text(result_text)
 
         except Exception as e:
@@ -9,7 +9,7 @@ from telegram.constants import ChatAction
 from telegram.ext import ContextTypes
 from bot.config import MONTHS_MAPPING, MONTH_NAME_TO_NUM
 from bot.categories import CATEGORIES_DISPLAY, CATEGORY_EMOJIS, INCOME_CATEGORY_EMOJIS
-from bot.services import sheets, storage, database
+from bot.services import sheets, sheet_mirror, storage, database, importer
 from bot.utils.auth import authorized
 from bot.i18n import t, set_lang
 
@@ -68,45 +68,13 @@ async def summary_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     try:
-        totals: dict[str, float] = {}
-        sub_totals: dict[str, dict[str, float]] = {}
-        count = 0
-
-        if database.is_available():
-            user_db_id = database.get_or_create_user(update.effective_user.id)
-            rows = database.get_expenses_by_month(user_db_id, target_month)
-            for row in rows:
-                amount = float(row["amount"])
-                category = row["category"]
-                totals[category] = totals.get(category, 0) + amount
-                subcategory = row["subcategory"]
-                if subcategory:
-                    if category not in sub_totals:
-                        sub_totals[category] = {}
-                    sub_totals[category][subcategory] = (
-                        sub_totals[category].get(subcategory, 0) + amount
-                    )
-                count += 1
+        if await database.aio.is_available():
+            user_db_id = await database.aio.get_or_create_user(update.effective_user.id)
+            start, end = database.month_range(target_month)
+            rows = await database.aio.get_category_totals(user_db_id, start, end)
         else:
-            all_rows = sheets.get_all_rows()
-            for row in all_rows:
-                if len(row) < 7:
-                    continue
-                if row[6].strip() == target_month:
-                    try:
-                        amount = float(row[1].replace("\xa0", "").replace(" ", "").replace(",", "."))
-                        category = row[2]
-                        totals[category] = totals.get(category, 0) + amount
-                        subcategory = row[3] if len(row) > 3 else ""
-                        if subcategory:
-                            if category not in sub_totals:
-                                sub_totals[category] = {}
-                            sub_totals[category][subcategory] = (
-                                sub_totals[category].get(subcategory, 0) + amount
-                            )
-                        count += 1
-                    except (ValueError, IndexError):
-                        continue
+            rows = await database.run_async(sheet_mirror.get_month_totals, target_month)
+        _, count, totals, sub_totals = database.fold_category_totals(rows)
 
         if not totals:
             await context.bot.send_message(
@@ -143,7 +111,7 @@ async def summary_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @authorized
 async def undo_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    saved = storage.get_last_saved(user_id)
+    saved = await storage.aio.get_last_saved(user_id)
 
     if not saved:
         await context.bot.send_message(
@@ -160,17 +128,17 @@ async def undo_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         expense_ids = saved.get("expense_ids")
         row_indices = saved.get("row_indices")
 
-        if expense_ids and database.is_available():
-            database.delete_expenses(expense_ids)
+        if expense_ids and await database.aio.is_available():
+            await database.aio.delete_expenses(expense_ids)
             n = len(expense_ids)
             # Also try to delete from Sheets if we have row indices
             if row_indices:
                 try:
-                    sheets.delete_rows(row_indices)
+                    await database.run_async(sheets.delete_rows, row_indices)
                 except Exception:
                     logger.warning("Sheets undo failed, rows may remain in sheet")
         elif row_indices:
-            sheets.delete_rows(row_indices)
+            await database.run_async(sheets.delete_rows, row_indices)
             n = len(row_indices)
         else:
             await context.bot.send_message(
@@ -179,7 +147,7 @@ async def undo_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
-        storage.delete_last_saved(user_id)
+        await storage.aio.delete_last_saved(user_id)
 
         if n == 1:
             await context.bot.send_message(
@@ -227,7 +195,7 @@ def _build_progress_bar(pct: float, width: int = 10) -> str:
 @authorized
 async def budget_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Set or remove a monthly budget: /budget <category> <amount> or /budget remove <category>."""
-    if not database.is_available():
+    if not await database.aio.is_available():
         await update.message.reply_text(t("db_required"))
         return
 
@@ -236,7 +204,7 @@ async def budget_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(t("budget_usage"), parse_mode="Markdown")
         return
 
-    user_db_id = database.get_or_create_user(update.effective_user.id)
+    user_db_id = await database.aio.get_or_create_user(update.effective_user.id)
 
     # /budget remove <category>
     if args[0].lower() == "remove":
@@ -246,7 +214,7 @@ async def budget_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         cat = " ".join(args[1:])
         category = None if cat.lower() == "total" else cat
         display = t("budget_total_label") if category is None else category
-        database.delete_budget(user_db_id, category)
+        await database.aio.delete_budget(user_db_id, category)
         await update.message.reply_text(t("budget_removed", category=display), parse_mode="Markdown")
         return
 
@@ -265,7 +233,7 @@ async def budget_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     category = None if cat.lower() == "total" else cat
     display = t("budget_total_label") if category is None else category
 
-    database.set_budget(user_db_id, category, amount)
+    await database.aio.set_budget(user_db_id, category, amount)
     await update.message.reply_text(
         t("budget_set", category=display, limit=f"{amount:.0f}"),
         parse_mode="Markdown",
@@ -275,25 +243,25 @@ async def budget_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @authorized
 async def budgets_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show all budgets with progress bars."""
-    if not database.is_available():
+    if not await database.aio.is_available():
         await update.message.reply_text(t("db_required"))
         return
 
-    user_db_id = database.get_or_create_user(update.effective_user.id)
-    budgets = database.get_budgets(user_db_id)
+    user_db_id = await database.aio.get_or_create_user(update.effective_user.id)
+    now = datetime.now()
+    budgets = await database.aio.get_budget_status(user_db_id, now.year, now.month)
 
     if not budgets:
         await update.message.reply_text(t("budget_no_budgets"), parse_mode="Markdown")
         return
 
-    month_name = MONTHS_MAPPING[datetime.now().month]
     lines = [t("budget_list_title", month=month_name)]
 
     for budget in budgets:
         cat = budget["category"]
-        limit_val = float(budget["monthly_limit"])
-        usage = database.get_budget_usage(user_db_id, cat, month_name)
-        pct = (usage / limit_val * 100) if limit_val > 0 else 0
+        limit_val = budget["monthly_limit"]
+        usage = budget["used"]
+        pct = budget["pct"]
         bar = _build_progress_bar(pct)
 
         if cat is None:
@@ -313,14 +281,14 @@ async def budgets_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @authorized
 async def chart_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Generate expense charts: /chart, /chart bar, /chart <month>."""
-    if not database.is_available():
+    if not await database.aio.is_available():
         await update.message.reply_text(t("db_required"))
         return
 
-    from bot.utils.formatting import generate_pie_chart, generate_bar_chart
+    from bot.utils.formatting import generate_pie_chart, generate_bar_chart, bar_chart_data
 
     args = context.args
-    user_db_id = database.get_or_create_user(update.effective_user.id)
+    user_db_id = await database.aio.get_or_create_user(update.effective_user.id)
 
     await context.bot.send_chat_action(
         chat_id=update.effective_chat.id, action=ChatAction.UPLOAD_PHOTO
@@ -329,21 +297,11 @@ async def chart_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # /chart bar — last 3 months comparison
     if args and args[0].lower() == "bar":
         try:
-            months_data = {}
-            now = datetime.now()
-            for i in range(3):
-                m = now.month - i
-                y = now.year
-                if m <= 0:
-                    m += 12
-                    y -= 1
-                month_name = MONTHS_MAPPING[m]
-                rows = database.get_expenses_by_month(user_db_id, month_name)
-                totals = {}
-                for row in rows:
-                    cat = row["category"]
-                    totals[cat] = totals.get(cat, 0) + float(row["amount"])
-                months_data[month_name] = totals
+            this_month = date.today().replace(day=1)
+            trend = await database.aio.get_monthly_trend(
+                user_db_id, database.shift_month(this_month, -2), this_month
+            )
+            months_data = bar_chart_data(trend)
 
             if not any(months_data.values()):
                 await update.message.reply_text(t("chart_no_data", month=""), parse_mode="Markdown")
@@ -371,11 +329,9 @@ async def chart_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         target_month = MONTHS_MAPPING[datetime.now().month]
 
     try:
-        rows = database.get_expenses_by_month(user_db_id, target_month)
-        categories_data = {}
-        for row in rows:
-            cat = row["category"]
-            categories_data[cat] = categories_data.get(cat, 0) + float(row["amount"])
+        start, end = database.month_range(target_month)
+        rows = await database.aio.get_category_totals(user_db_id, start, end)
+        categories_data = database.fold_category_totals(rows)[2]
 
         if not categories_data:
             await update.message.reply_text(t("chart_no_data", month=target_month), parse_mode="Markdown")
@@ -420,7 +376,7 @@ def _calculate_next_due(frequency: str, day_of_month: int | None = None) -> date
 @authorized
 async def recurring_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manage recurring expenses: /recurring add|list|remove."""
-    if not database.is_available():
+    if not await database.aio.is_available():
         await update.message.reply_text(t("db_required"))
         return
 
@@ -429,11 +385,11 @@ async def recurring_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(t("recurring_usage"), parse_mode="Markdown")
         return
 
-    user_db_id = database.get_or_create_user(update.effective_user.id)
+    user_db_id = await database.aio.get_or_create_user(update.effective_user.id)
     action = args[0].lower()
 
     if action == "list":
-        items = database.get_recurring(user_db_id)
+        items = await database.aio.get_recurring(user_db_id)
         if not items:
             await update.message.reply_text(t("recurring_no_items"), parse_mode="Markdown")
             return
@@ -460,7 +416,7 @@ async def recurring_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except ValueError:
             await update.message.reply_text(t("recurring_usage"), parse_mode="Markdown")
             return
-        database.delete_recurring(rid)
+        await database.aio.delete_recurring(rid)
         await update.message.reply_text(t("recurring_removed", id=rid), parse_mode="Markdown")
         return
 
@@ -486,7 +442,7 @@ async def recurring_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         next_due = _calculate_next_due(frequency)
         freq_display = t(f"recurring_freq_{frequency}")
 
-        rid = database.add_recurring(user_db_id, {
+        rid = await database.aio.add_recurring(user_db_id, {
             "amount": amount,
             "category": "Inne wydatki",
             "subcategory": "Inne",
@@ -506,12 +462,13 @@ async def recurring_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def process_recurring(context):
     """Daily job: create expenses for due recurring items, notify user."""
-    if not database.is_available():
+    if not await database.aio.is_available():
         return
 
     today = date.today()
-    due = database.get_due_recurring(today)
+    due = await database.aio.get_due_recurring(today)
 
+    items = []
     for item in due:
         try:
             expense_dict = {
@@ -521,11 +478,27 @@ async def process_recurring(context):
                 "subcategory": item["subcategory"],
                 "description": item["description"],
             }
-            database.save_expense(item["user_id"], expense_dict, f"recurring: {item['description']}")
-
             next_due = _calculate_next_due(item["frequency"], item.get("day_of_month"))
-            database.update_next_due(item["id"], next_due)
+            items.append((
+                item["id"], item["user_id"], expense_dict,
+                f"recurring: {item['description']}", next_due,
+            ))
+        except Exception as e:
+            logger.error(f"Error processing recurring expense {item['id']}: {e}")
 
+    if not items:
+        return
+    try:
+        await database.aio.save_recurring_expenses(items)
+    except Exception as e:
+        logger.error(f"Error saving {len(items)} recurring expenses: {e}")
+        return
+
+    booked = {rid for rid, *_ in items}
+    for item in due:
+        if item["id"] not in booked:
+            continue
+        try:
             await context.bot.send_message(
                 chat_id=item["telegram_id"],
                 text=t("recurring_created",
@@ -534,7 +507,7 @@ async def process_recurring(context):
                 parse_mode="Markdown",
             )
         except Exception as e:
-            logger.error(f"Error processing recurring expense {item['id']}: {e}")
+            logger.error(f"Error notifying about recurring expense {item['id']}: {e}")
 
 
 # --- Balance / Income commands ---
@@ -542,18 +515,17 @@ async def process_recurring(context):
 @authorized
 async def balance_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show income vs expenses for current month."""
-    if not database.is_available():
+    if not await database.aio.is_available():
         await update.message.reply_text(t("db_required"))
         return
 
-    user_db_id = database.get_or_create_user(update.effective_user.id)
+    user_db_id = await database.aio.get_or_create_user(update.effective_user.id)
     month_name = MONTHS_MAPPING[datetime.now().month]
+    start, end = database.month_range(month_name)
 
-    expenses = database.get_expenses_by_month(user_db_id, month_name)
-    total_expenses = sum(float(e["amount"]) for e in expenses)
-
-    income_items = database.get_income_by_month(user_db_id, month_name)
-    total_income = sum(float(i["amount"]) for i in income_items)
+    rows = await database.aio.get_category_totals(user_db_id, start, end)
+    total_expenses = database.fold_category_totals(rows)[0]
+    total_income = await database.aio.get_income_total(user_db_id, start, end)
 
     if total_expenses == 0 and total_income == 0:
         await update.message.reply_text(t("balance_no_data", month=month_name), parse_mode="Markdown")
@@ -573,14 +545,14 @@ async def balance_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @authorized
 async def incomes_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show income entries for current month grouped by category."""
-    if not database.is_available():
+    if not await database.aio.is_available():
         await update.message.reply_text(t("db_required"))
         return
 
-    user_db_id = database.get_or_create_user(update.effective_user.id)
+    user_db_id = await database.aio.get_or_create_user(update.effective_user.id)
     month_name = MONTHS_MAPPING[datetime.now().month]
 
-    income_items = database.get_income_by_month(user_db_id, month_name)
+    income_items = await database.aio.get_income_by_month(user_db_id, month_name)
     if not income_items:
         await update.message.reply_text(
             t("income_list_empty", month=month_name), parse_mode="Markdown"
@@ -610,7 +582,7 @@ async def incomes_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @authorized
 async def search_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Search expenses: /search <query>."""
-    if not database.is_available():
+    if not await database.aio.is_available():
         await update.message.reply_text(t("db_required"))
         return
 
@@ -620,27 +592,27 @@ async def search_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     query = " ".join(args)
-    user_db_id = database.get_or_create_user(update.effective_user.id)
-    results = database.search_expenses(user_db_id, query)
+    user_db_id = await database.aio.get_or_create_user(update.effective_user.id)
+    results = await database.aio.search_expenses(user_db_id, query, limit=20)
 
     if not results:
         await update.message.reply_text(t("search_no_results", query=query), parse_mode="Markdown")
         return
 
     lines = [t("search_title", query=query)]
-    for i, r in enumerate(results[:20], 1):
+    for i, r in enumerate(results, 1):
         lines.append(f"{i}. `{r['date']}` — *{float(r['amount']):.2f} PLN*\n"
                      f"    {r['category']} > {r['subcategory']}\n"
                      f"    {r['description']}")
-    if len(results) > 20:
-        lines.append(f"\n... +{len(results) - 20}")
+    if results[0]["total_count"] > len(results):
+        lines.append(f"\n... +{results[0]['total_count'] - len(results)}")
     await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
 
 
 @authorized
 async def last_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show last N expenses: /last [N]."""
-    if not database.is_available():
+    if not await database.aio.is_available():
         await update.message.reply_text(t("db_required"))
         return
 
@@ -653,8 +625,8 @@ async def last_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except ValueError:
             pass
 
-    user_db_id = database.get_or_create_user(update.effective_user.id)
-    results = database.get_recent_expenses(user_db_id, limit=limit)
+    user_db_id = await database.aio.get_or_create_user(update.effective_user.id)
+    results = await database.aio.get_recent_expenses(user_db_id, limit=limit)
 
     if not results:
         await update.message.reply_text(t("last_no_data"), parse_mode="Markdown")
@@ -671,7 +643,7 @@ async def last_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @authorized
 async def expenses_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Filter expenses by date range: /expenses <start_date> <end_date>."""
-    if not database.is_available():
+    if not await database.aio.is_available():
         await update.message.reply_text(t("db_required"))
         return
 
@@ -690,8 +662,8 @@ async def expenses_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(t("expenses_usage"), parse_mode="Markdown")
         return
 
-    user_db_id = database.get_or_create_user(update.effective_user.id)
-    results = database.get_expenses_by_date_range(user_db_id, start_date, end_date)
+    user_db_id = await database.aio.get_or_create_user(update.effective_user.id)
+    results = await database.aio.get_expenses_by_date_range(user_db_id, start_date, end_date)
 
     if not results:
         await update.message.reply_text(t("expenses_no_data"), parse_mode="Markdown")
@@ -712,7 +684,7 @@ async def expenses_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @authorized
 async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Export expenses as CSV: /export [month]."""
-    if not database.is_available():
+    if not await database.aio.is_available():
         await update.message.reply_text(t("db_required"))
         return
 
@@ -730,8 +702,8 @@ async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         target_month = MONTHS_MAPPING[datetime.now().month]
 
-    user_db_id = database.get_or_create_user(update.effective_user.id)
-    expenses = database.get_expenses_by_month(user_db_id, target_month)
+    user_db_id = await database.aio.get_or_create_user(update.effective_user.id)
+    expenses = await database.aio.get_expenses_by_month(user_db_id, target_month)
 
     if not expenses:
         await update.message.reply_text(t("export_no_data", month=target_month), parse_mode="Markdown")
@@ -755,7 +727,7 @@ async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @authorized
 async def import_sheets_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Import all expenses from Google Sheets into the database: /importsheets."""
-    if not database.is_available():
+    if not await database.aio.is_available():
         await update.message.reply_text(t("db_required"))
         return
 
@@ -763,51 +735,20 @@ async def import_sheets_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_id=update.effective_chat.id, action=ChatAction.TYPING
     )
 
-    user_db_id = database.get_or_create_user(update.effective_user.id)
+    user_db_id = await database.aio.get_or_create_user(update.effective_user.id)
 
     try:
-        all_rows = sheets.get_all_rows()
+        result = await database.run_async(importer.import_from_sheets, user_db_id)
     except Exception as e:
+        # Progress is checkpointed; running /importsheets again resumes
         logger.error(f"Import error: {e}")
         await update.message.reply_text(t("general_error"))
         return
 
-    # Skip header row if present
-    data_rows = all_rows
-    if data_rows and data_rows[0][0].lower() in ("date", "data"):
-        data_rows = data_rows[1:]
-
-    imported = 0
-    skipped = 0
-    for row in data_rows:
-        if len(row) < 5:
-            skipped += 1
-            continue
-        try:
-            date_str = row[0].strip()
-            amount = float(row[1].replace("\xa0", "").replace(" ", "").replace(",", "."))
-            category = row[2].strip()
-            subcategory = row[3].strip() if len(row) > 3 else ""
-            description = row[4].strip() if len(row) > 4 else ""
-            original_text = row[5].strip() if len(row) > 5 else ""
-
-            datetime.strptime(date_str, "%Y-%m-%d")
-
-            expense_dict = {
-                "amount": amount,
-                "date": date_str,
-                "category": category,
-                "subcategory": subcategory,
-                "description": description,
-            }
-            database.save_expense(user_db_id, expense_dict, original_text)
-            imported += 1
-        except (ValueError, IndexError):
-            skipped += 1
-            continue
-
+    invalid = sum(result["skipped"].values()) - result["duplicates"]
     await update.message.reply_text(
-        f"✅ Zaimportowano *{imported}* wydatków z arkusza.\n"
-        f"⏭️ Pominięto: {skipped} wierszy.",
+        f"✅ Zaimportowano *{result['imported']}* wydatków z arkusza "
+        f"({result['rows_per_sec']:.0f} wierszy/s).\n"
+        f"⏭️ Pominięto: {result['duplicates']} duplikatów, {invalid} błędnych wierszy.",
         parse_mode="Markdown",
     )
@@ -8,7 +8,7 @@ from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ChatAction
 from telegram.ext import ContextTypes
-from bot.services import ai_parser, storage, database
+from bot.services import expense_parser, fast_parser, storage, database
 from bot.utils.auth import authorized
 from bot.utils.formatting import build_preview_text
 from bot.handlers.callbacks import _build_confirmation_keyboard
@@ -44,14 +44,15 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Check for income pattern: +5000 wyplata
     income_match = _INCOME_PATTERN.match(user_text)
-    if income_match and database.is_available():
+    if income_match and await database.aio.is_available():
         await _handle_income(update, income_match)
         return
 
     await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
 
     try:
-        data = ai_parser.parse_expenses(user_text)
+        dictionary = await database.run_async(fast_parser.get_dictionary, update.effective_user.id)
+        data = await expense_parser.parse_expenses_async(user_text, dictionary)
 
         if not data:
             await context.bot.send_message(
@@ -66,6 +67,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "user_id": update.effective_user.id,
             "expenses": data,
             "original_text": user_text,
+            "suggested": [[e["category"], e["subcategory"]] for e in data],
         })
 
         preview = build_preview_text(data)
@@ -1,5 +1,9 @@
 """Main entry point for the budget bot."""
 
+import json
+import logging
+import os
+
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -9,11 +13,17 @@ from telegram.ext import (
 )
 from bot.config import TELEGRAM_TOKEN
 from bot.handlers import commands, messages, callbacks
-from bot.services import storage, database, sync
+from bot.services import ai_parser, database, sheets, storage, sync
+
+logger = logging.getLogger(__name__)
+
+# Seconds between runtime stats log lines (0 disables them)
+STATS_LOG_INTERVAL = int(os.environ.get("STATS_LOG_INTERVAL", "3600"))
 
 
 def create_app():
-    application = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    # Handlers await slow I/O (AI parsing); let other users' updates run meanwhile
+    application = ApplicationBuilder().token(TELEGRAM_TOKEN).concurrent_updates(True).build()
 
     application.add_handler(CommandHandler("start", commands.start))
     application.add_handler(CommandHandler("help", commands.help_cmd))
@@ -41,17 +51,44 @@ def create_app():
 
 
 async def cleanup_expired_pending(context):
-    storage.cleanup_expired()
+    """Periodic TTL sweep of the state DB (see storage.sweep_expired)."""
+    try:
+        await storage.aio.sweep_expired()
+    except Exception as e:
+        logger.warning(f"State DB sweep failed: {e}")
 
 
 async def sync_sheets_job(context):
     """Periodic job to sync unsynced expenses to Google Sheets."""
     try:
-        sync.sync_unsynced_to_sheets()
+        await database.run_async(sync.sync_unsynced_to_sheets)
     except Exception:
         pass
 
 
+def collect_stats() -> dict:
+    """Runtime counters of this process: AI parser and parse cache, DB pool
+    and circuit breaker, state DB sweeps and Sheets API requests."""
+    return {
+        "parser": ai_parser.parser_stats(),
+        "parse_cache": storage.parse_cache_stats(),
+        "db_pool": database.pool_stats(),
+        "db_breaker": database.breaker_stats(),
+        "sweep_expired": storage.sweep_stats()["expired"],
+        "sheets_requests": sheets.request_stats(),
+    }
+
+
+async def log_stats_job(context):
+    """Periodic log line with collect_stats()."""
+    try:
+        stats = await database.run_async(collect_stats)
+    except Exception as e:
+        logger.warning(f"Collecting runtime stats failed: {e}")
+        return
+    logger.info(f"Runtime stats: {json.dumps(stats, default=str)}")
+
+
 def main():
     # Initialize PostgreSQL if configured
     if database.is_available():
@@ -63,6 +100,8 @@ def main():
     app = create_app()
     # Run cleanup every 30 minutes
     app.job_queue.run_repeating(cleanup_expired_pending, interval=1800, first=60)
+    if STATS_LOG_INTERVAL > 0:
+        app.job_queue.run_repeating(log_stats_job, interval=STATS_LOG_INTERVAL, first=STATS_LOG_INTERVAL)
     # Sync unsynced expenses to Sheets every 5 minutes (if DB available)
     if database.is_available():
         app.job_queue.run_repeating(sync_sheets_job, interval=300, first=120)
@@ -70,6 +109,7 @@ def main():
         app.job_queue.run_repeating(commands.process_recurring, interval=86400, first=60)
     print("Bot wystartował...")
     app.run_polling()
+    database.close_pool()
 
 
 if __name__ == "__main__":
@@ -1,64 +1,630 @@
-"""OpenAI-based expense parsing service."""
+"""OpenAI-based expense parsing service.
 
+parse_expenses_async() is the bot's path: it awaits the AsyncOpenAI client,
+so a slow completion never blocks the event loop. At most AI_MAX_CONCURRENCY
+requests run at once; each attempt has a deadline of AI_TIMEOUT seconds, and
+429/5xx/timeout errors are retried with jittered exponential backoff.
+Messages arriving within AI_BATCH_WINDOW_MS of each other (a burst of
+forwarded receipts) go out as one request, each message with its own user's
+hints, whose reply is split back to each waiting caller. parse_expenses() is the blocking, unbatched equivalent used
+by the CLI.
+parser_stats() reports queue depth and latency percentiles.
+
+Both paths first look the message up in the persistent parse cache
+(storage.parse_cache), keyed on the normalized text, the user's merchant
+hints and PROMPT_VERSION.
+Dates are cached as offsets from the day of the original parse, so "wczoraj"
+replayed tomorrow still means yesterday. Messages naming a calendar date,
+month or weekday are never cached: their meaning depends on when they were sent.
+
+The system prompt is split so its long part never changes between requests:
+STATIC_PROMPT (rules and numbered subcategory codes) goes first, and hints and
+today's date follow in a second message, so providers can reuse the cached
+prefix. The model answers with codes under a strict JSON schema, which
+_parse_response maps back to category names.
+"""
+
+import asyncio
+import hashlib
 import json
 import logging
-from datetime import datetime
-from bot.config import client_ai
-from bot.categories import CATEGORIES_CONTEXT
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+from bot.config import client_ai, client_ai_async
+from bot.categories import CATEGORIES_CODES_CONTEXT, SUBCATEGORY_CODES
+from bot.services import storage
 
 logger = logging.getLogger(__name__)
 
+AI_MODEL = os.environ.get("AI_MODEL", "gpt-4o-mini")
+# Bump whenever build_system_prompt() changes meaning; old cache entries stop matching
+PROMPT_VERSION = "2"
+# Parse requests allowed in flight at once; the rest wait in a queue
+AI_MAX_CONCURRENCY = int(os.environ.get("AI_MAX_CONCURRENCY", "4"))
+# Deadline for a single completion attempt, in seconds
+AI_TIMEOUT = float(os.environ.get("AI_TIMEOUT", "20"))
+# Retries after the first attempt for rate limits, 5xx and timeouts
+AI_MAX_RETRIES = int(os.environ.get("AI_MAX_RETRIES", "3"))
+AI_RETRY_BASE = float(os.environ.get("AI_RETRY_BASE", "0.5"))
+AI_RETRY_MAX = 8.0
+# Messages arriving within this many milliseconds of each other are parsed in
+# one request (parse_expenses_async only); 0 sends every message on its own
+AI_BATCH_WINDOW_MS = float(os.environ.get("AI_BATCH_WINDOW_MS", "100"))
+AI_BATCH_MAX_SIZE = int(os.environ.get("AI_BATCH_MAX_SIZE", "8"))
+
+# How many recent request latencies the percentiles are computed over
+_LATENCY_WINDOW = 500
+
+_metrics_lock = threading.Lock()
+_latencies: deque = deque(maxlen=_LATENCY_WINDOW)
+_stats = {
+    "requests": 0,
+    "retries": 0,
+    "timeouts": 0,
+    "failures": 0,
+    "queued": 0,
+    "in_flight": 0,
+    "queue_wait_max": 0.0,
+    "cache_hits": 0,
+    "cache_misses": 0,
+    "cache_bypassed": 0,
+    "cache_saved_seconds": 0.0,
+    "usage_reports": 0,
+    "prompt_tokens": 0,
+    "cached_prompt_tokens": 0,
+    "completion_tokens": 0,
+    "batches": 0,
+    "batched_messages": 0,
+}
+
+# Text whose date depends on the calendar, not just on "today": explicit dates,
+# month and weekday names, "N days ago". Such messages bypass the parse cache.
+_CALENDAR_REFERENCE = re.compile(
+    r"\b\d{4}-\d{1,2}-\d{1,2}\b"
+    r"|\b(?:0?[1-9]|[12]\d|3[01])[./-](?:0?[1-9]|1[0-2])\b"
+    r"|\b(?:stycz|lut|kwie|czerw|lip|sierp|wrze|pa[zź]dziern|listopad|grud"
+    r"|poniedzia|wtor|[sś]rod|czwart|pi[aą]t|sobot|niedziel|tydzie|tygodni|miesi"
+    r"|january|february|april|june|july|august|september|october|november|december"
+    r"|monday|tuesday|wednesday|thursday|friday|saturday|sunday|week|month)"
+    r"|\b(?:marzec|marca|marcu|maj|maja|march|may|pon|wt|[sś]r|czw|pt|sob|ndz?|temu|ago|rok|roku|year)\b",
+    re.IGNORECASE,
+)
+
+_semaphore: asyncio.Semaphore | None = None
+_semaphore_loop = None
+# The batch currently collecting messages, if any (see _parse_batched)
+_open_batch = None
+
+
+STATIC_PROMPT = (
+    "Jesteś asystentem finansowym. Wyciągnij z tekstu użytkownika wszystkie wydatki (może być jeden lub kilka).\n"
+    "Dla każdego wydatku podaj:\n"
+    "- amount: kwota (liczba)\n"
+    "- date: data wydatku YYYY-MM-DD; data bez roku (np. '1 listopada', '25.04') to bieżący rok, "
+    "'wczoraj'/'dzisiaj' licz od dzisiejszej daty podanej na końcu; nie wpisuj innego roku, "
+    "chyba że użytkownik wyraźnie go poda\n"
+    "- code: kod podkategorii z listy poniżej\n"
+    "- description: krótka nazwa wydatku, bez daty, kategorii i ceny\n"
+    "Jeśli tekst nie zawiera żadnego wydatku (powitanie, pytanie, rozmowa), zwróć pustą listę expenses.\n"
+    "\nKody podkategorii:\n"
+    f"{CATEGORIES_CODES_CONTEXT}"
+)
+
+# Structured output: the reply is always {"expenses": [...]} with a valid code
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "expenses",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "expenses": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "amount": {"type": "number"},
+                            "date": {"type": "string"},
+                            "code": {"type": "string", "enum": list(SUBCATEGORY_CODES)},
+                            "description": {"type": "string"},
+                        },
+                        "required": ["amount", "date", "code", "description"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["expenses"],
+            "additionalProperties": False,
+        },
+    },
+}
 
-def build_system_prompt() -> str:
-    """Build the system prompt for expense parsing."""
-    now = datetime.now()
-    today_str = now.strftime("%Y-%m-%d")
-    current_year = now.year
-
-    return (
-        f"Jesteś asystentem finansowym. Dzisiejsza data to: {today_str}. "
-        f"ZASADA NR 1: Jeśli użytkownik poda datę bez roku (np. '1 listopada', '25.04', 'wczoraj'), "
-        f"ZAWSZE przyjmij, że chodzi o rok {current_year}. "
-        f"Nie wpisuj roku 2022, 2023 czy 2024, chyba że użytkownik wyraźnie go napisze. "
-        f"\n\nPrzeanalizuj tekst użytkownika. Tekst może zawierać JEDEN lub WIELE wydatków. "
-        f"Dla KAŻDEGO wydatku wyciągnij:\n"
-        f"1. Kwotę (liczba float).\n"
-        f"2. Datę wydatku w formacie YYYY-MM-DD (pamiętaj o ZASADZIE NR 1).\n"
-        f"3. Kategorię i podkategorię pasującą do listy: {CATEGORIES_CONTEXT}\n"
-        f"4. Krótki opis — tylko nazwa wydatku, bez daty/kategorii/ceny.\n"
-        f"\nJeśli tekst NIE zawiera żadnego wydatku (np. powitanie, pytanie, rozmowa), "
-        f"zwróć pusty JSON array: []\n"
-        f"\nZwróć WYŁĄCZNIE JSON array (nawet dla jednego wydatku): "
-        f'[{{"amount": 0.0, "date": "YYYY-MM-DD", "category": "String", '
-        f'"subcategory": "String", "description": "String"}}]'
+_CODE_BY_SUBCATEGORY = {pair: code for code, pair in SUBCATEGORY_CODES.items()}
+
+
+def _format_hints(hints: list[tuple[str, str, str]]) -> str:
+    return "; ".join(
+        f"{word} → {_CODE_BY_SUBCATEGORY.get((category, subcategory), '?')}"
+        for word, category, subcategory in hints
     )
 
 
-def parse_expenses(user_text: str) -> list[dict]:
-    """Parse user text into expense dicts using OpenAI.
+def build_dynamic_prompt(hints: list[tuple[str, str, str]] | None = None) -> str:
+    """The per-request part of the prompt: user hints, then today's date.
 
-    Returns a list of expense dicts, or empty list for non-expense messages.
-    Raises json.JSONDecodeError or Exception on failure.
+    hints are (word, category, subcategory) the user has confirmed before for
+    words in this message (fast_parser.MerchantDictionary.hints).
     """
-    system_prompt = build_system_prompt()
+    lines = []
+    if hints:
+        lines.append("Ten użytkownik przypisuje zwykle: " + _format_hints(hints))
+    today = datetime.now()
+    lines.append(f"Dzisiejsza data: {today.strftime('%Y-%m-%d')} (bieżący rok: {today.year}).")
+    return "\n".join(lines)
+
 
-    response = client_ai.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
+def build_system_prompt(hints: list[tuple[str, str, str]] | None = None) -> str:
+    """The full system prompt: STATIC_PROMPT first so providers can cache it
+    as a prefix, the changing part last."""
+    return f"{STATIC_PROMPT}\n\n{build_dynamic_prompt(hints)}"
+
+
+def _request_kwargs(user_text: str, hints=None) -> dict:
+    return {
+        "model": AI_MODEL,
+        "messages": [
+            {"role": "system", "content": STATIC_PROMPT},
+            {"role": "system", "content": build_dynamic_prompt(hints)},
             {"role": "user", "content": user_text},
         ],
-        temperature=0.3,
+        "temperature": 0.3,
+        "response_format": RESPONSE_FORMAT,
+        "timeout": AI_TIMEOUT,
+    }
+
+
+BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "expense_batch",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "results": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "expenses": RESPONSE_FORMAT["json_schema"]["schema"]["properties"]["expenses"],
+                        },
+                        "required": ["id", "expenses"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["results"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+_BATCH_INSTRUCTION = (
+    "Dostaniesz kilka niezależnych wiadomości jako listę JSON obiektów {id, text}. "
+    "Dla każdej wiadomości zwróć w results obiekt z tym samym id i jej wydatkami. "
+    "Pole hints (jeśli jest) to przypisania autora tej wiadomości i dotyczy tylko jej."
+)
+
+
+def _batch_request_kwargs(messages: list[tuple[str, list | None]]) -> dict:
+    """One request for several (user_text, hints) messages; ids are list positions.
+
+    Messages may come from different users, so each one carries its own hints
+    instead of sharing them through the system prompt.
+    """
+    payload = []
+    for i, (text, hints) in enumerate(messages):
+        item = {"id": i, "text": text}
+        if hints:
+            item["hints"] = _format_hints(hints)
+        payload.append(item)
+    return {
+        "model": AI_MODEL,
+        "messages": [
+            {"role": "system", "content": STATIC_PROMPT},
+            {"role": "system", "content": f"{_BATCH_INSTRUCTION}\n{build_dynamic_prompt()}"},
+            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+        ],
+        "temperature": 0.3,
+        "response_format": BATCH_RESPONSE_FORMAT,
+        "timeout": AI_TIMEOUT,
+    }
+
+
+def _count(value) -> int:
+    return value if isinstance(value, int) else 0
+
+
+def _record_usage(response) -> None:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    prompt_tokens = _count(getattr(usage, "prompt_tokens", 0))
+    cached_tokens = _count(getattr(details, "cached_tokens", 0))
+    completion_tokens = _count(getattr(usage, "completion_tokens", 0))
+    with _metrics_lock:
+        _stats["usage_reports"] += 1
+        _stats["prompt_tokens"] += prompt_tokens
+        _stats["cached_prompt_tokens"] += cached_tokens
+        _stats["completion_tokens"] += completion_tokens
+    logger.debug(f"AI parse tokens: prompt {prompt_tokens} ({cached_tokens} cached), completion {completion_tokens}")
+
+
+def _decode_expenses(items: list[dict]) -> list[dict]:
+    expenses = []
+    for item in items:
+        if item["code"] not in SUBCATEGORY_CODES:
+            raise ValueError(f"Unknown subcategory code from AI: {item['code']!r}")
+        category, subcategory = SUBCATEGORY_CODES[item["code"]]
+        expenses.append({
+            "amount": item["amount"],
+            "date": item["date"],
+            "category": category,
+            "subcategory": subcategory,
+            "description": item["description"],
+        })
+    return expenses
+
+
+def _parse_response(response) -> list[dict]:
+    """Decode a structured reply into expense dicts with category names."""
+    _record_usage(response)
+    data = json.loads(response.choices[0].message.content)
+    return _decode_expenses(data["expenses"])
+
+
+def _parse_batch_response(response, size: int) -> list:
+    """Decode a batched reply into one result per message, in request order.
+
+    Each result is a list of expense dicts, or the exception explaining why
+    that message's part of the reply is unusable.
+    """
+    _record_usage(response)
+    data = json.loads(response.choices[0].message.content)
+    by_id = {result["id"]: result["expenses"] for result in data["results"]}
+    results = []
+    for message_id in range(size):
+        if message_id not in by_id:
+            results.append(ValueError(f"AI reply has no result for message {message_id}"))
+            continue
+        try:
+            results.append(_decode_expenses(by_id[message_id]))
+        except (KeyError, TypeError, ValueError) as e:
+            results.append(e)
+    return results
+
+
+def is_retryable_error(e: Exception) -> bool:
+    """True for rate limits (429), server errors (5xx), timeouts and dropped connections."""
+    if isinstance(e, (TimeoutError, APIConnectionError)):
+        return True
+    return isinstance(e, APIStatusError) and (e.status_code == 429 or e.status_code >= 500)
+
+
+def _retry_delay(attempt: int, e: Exception) -> float:
+    """Full-jitter exponential backoff, stretched to a Retry-After header if one is sent."""
+    delay = random.uniform(0, min(AI_RETRY_MAX, AI_RETRY_BASE * 2 ** attempt))
+    response = getattr(e, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), AI_RETRY_MAX))
+        except ValueError:
+            pass
+    return delay
+
+
+def _next_retry(attempt: int, e: Exception) -> float | None:
+    """Seconds to wait before retrying after attempt number `attempt` failed, or None to give up."""
+    with _metrics_lock:
+        if isinstance(e, (TimeoutError, APITimeoutError)):
+            _stats["timeouts"] += 1
+        if not is_retryable_error(e) or attempt >= AI_MAX_RETRIES:
+            _stats["failures"] += 1
+            return None
+        _stats["retries"] += 1
+    delay = _retry_delay(attempt, e)
+    logger.warning(f"AI parse attempt {attempt + 1} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+    return delay
+
+
+def _record_latency(seconds: float) -> None:
+    with _metrics_lock:
+        _stats["requests"] += 1
+        _latencies.append(seconds)
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    # A semaphore belongs to one event loop; the CLI and tests may run several
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+        _semaphore_loop = loop
+    return _semaphore
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def parser_stats() -> dict:
+    """Request counters, queue depth, latency percentiles (seconds) over recent
+    requests, token usage and parse cache hit/miss counts for this process."""
+    with _metrics_lock:
+        result = dict(_stats)
+        latencies = sorted(_latencies)
+    result["queue_depth"] = result.pop("queued")
+    result["max_concurrency"] = AI_MAX_CONCURRENCY
+    result["latency_p50"] = _percentile(latencies, 50)
+    result["latency_p95"] = _percentile(latencies, 95)
+    result["latency_p99"] = _percentile(latencies, 99)
+    reports = result["usage_reports"]
+    result["prompt_tokens_avg"] = result["prompt_tokens"] / reports if reports else 0.0
+    result["completion_tokens_avg"] = result["completion_tokens"] / reports if reports else 0.0
+    result["prompt_cache_ratio"] = (
+        result["cached_prompt_tokens"] / result["prompt_tokens"] if result["prompt_tokens"] else 0.0
     )
+    lookups = result["cache_hits"] + result["cache_misses"]
+    result["cache_hit_ratio"] = result["cache_hits"] / lookups if lookups else 0.0
+    return result
+
+
+def _reset_stats() -> None:
+    with _metrics_lock:
+        _latencies.clear()
+        for key, value in _stats.items():
+            _stats[key] = 0.0 if isinstance(value, float) else 0
+
+
+def _today() -> date:
+    return date.today()
+
+
+def normalize_text(user_text: str) -> str:
+    """Case- and whitespace-insensitive form of a message, used as the cache key."""
+    return " ".join(user_text.casefold().split())
+
+
+def _cache_key(user_text: str, hints=None) -> str | None:
+    """Cache key for user_text, or None if its result must not be cached.
+
+    The hints are part of the key: they come from the sender's own merchant
+    dictionary, so the same text may parse differently for another user or
+    after the user corrects a category.
+    """
+    if storage.PARSE_CACHE_MAX_ENTRIES <= 0 or _CALENDAR_REFERENCE.search(user_text):
+        with _metrics_lock:
+            _stats["cache_bypassed"] += 1
+        return None
+    hints_key = json.dumps(sorted(list(h) for h in hints or ()), ensure_ascii=False)
+    key = f"{PROMPT_VERSION}:{AI_MODEL}:{hints_key}:{normalize_text(user_text)}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _cache_lookup(cache_key: str | None) -> list[dict] | None:
+    if cache_key is None:
+        return None
+    try:
+        cached = storage.get_cached_parse(cache_key)
+    except sqlite3.Error as e:
+        logger.warning(f"Parse cache lookup failed: {e}")
+        cached = None
+    with _metrics_lock:
+        if cached is None:
+            _stats["cache_misses"] += 1
+            return None
+        _stats["cache_hits"] += 1
+        _stats["cache_saved_seconds"] += cached[1]
+
+    today = _today()
+    data = []
+    for item in cached[0]:
+        item = dict(item)
+        offset = item.pop("date_offset")
+        item["date"] = (today + timedelta(days=offset)).strftime("%Y-%m-%d")
+        data.append(item)
+    return data
+
+
+def _cache_store(cache_key: str | None, data: list[dict], cost_seconds: float) -> None:
+    if cache_key is None:
+        return
+    today = _today()
+    entries = []
+    for item in data:
+        try:
+            expense_date = datetime.strptime(item["date"], "%Y-%m-%d").date()
+        except (KeyError, TypeError, ValueError):
+            return  # Leave odd-looking results uncached
+        entry = {k: v for k, v in item.items() if k != "date"}
+        entry["date_offset"] = (expense_date - today).days
+        entries.append(entry)
+    try:
+        storage.save_cached_parse(cache_key, entries, cost_seconds)
+    except sqlite3.Error as e:
+        logger.warning(f"Parse cache store failed: {e}")
+
+
+async def _complete_async(request: dict):
+    """Send one completion request: waits for a concurrency slot, applies the
+    per-attempt deadline and retries. Returns (response, elapsed seconds)."""
+    semaphore = _get_semaphore()
+    queued_at = time.monotonic()
+    with _metrics_lock:
+        _stats["queued"] += 1
+    try:
+        await semaphore.acquire()
+    finally:
+        with _metrics_lock:
+            _stats["queued"] -= 1
 
-    content = response.choices[0].message.content.strip()
-    if content.startswith("```"):
-        content = content.replace("```json", "").replace("```", "").strip()
+    start = time.monotonic()
+    with _metrics_lock:
+        _stats["in_flight"] += 1
+        _stats["queue_wait_max"] = max(_stats["queue_wait_max"], start - queued_at)
+    try:
+        attempt = 0
+        while True:
+            try:
+                response = await asyncio.wait_for(client_ai_async.chat.completions.create(**request), AI_TIMEOUT)
+                break
+            except Exception as e:
+                delay = _next_retry(attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+    finally:
+        with _metrics_lock:
+            _stats["in_flight"] -= 1
+        semaphore.release()
+        elapsed = time.monotonic() - start
+        _record_latency(elapsed)
+    return response, elapsed
 
-    data = json.loads(content)
 
-    # Normalize: if AI returned a single object, wrap it
-    if isinstance(data, dict):
-        data = [data]
+class _Batch:
+    """Messages collected during one batching window, each with the future
+    its caller is waiting on."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.messages: list[tuple[str, list | None]] = []
+        self.futures: list[asyncio.Future] = []
+        self.full = asyncio.Event()
+        self.task = None
+
+
+async def _run_batch(batch: _Batch) -> None:
+    global _open_batch
+    try:
+        await asyncio.wait_for(batch.full.wait(), AI_BATCH_WINDOW_MS / 1000)
+    except TimeoutError:
+        pass
+    if _open_batch is batch:
+        _open_batch = None
+
+    size = len(batch.messages)
+    try:
+        if size == 1:
+            response, elapsed = await _complete_async(_request_kwargs(*batch.messages[0]))
+            results = [_parse_response(response)]
+        else:
+            response, elapsed = await _complete_async(_batch_request_kwargs(batch.messages))
+            results = _parse_batch_response(response, size)
+            with _metrics_lock:
+                _stats["batches"] += 1
+                _stats["batched_messages"] += size
+            logger.debug(f"AI parse batch of {size} messages took {elapsed:.2f}s")
+    except Exception as e:
+        results = [e] * size
+        elapsed = 0.0
+
+    for future, result in zip(batch.futures, results):
+        if future.done():
+            continue  # Caller gave up waiting
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result((result, elapsed))
+
+
+async def _parse_batched(user_text: str, hints=None) -> tuple[list[dict], float]:
+    """Join the open batch (starting one if needed) and wait for its result.
+
+    The first message of a batch waits up to AI_BATCH_WINDOW_MS for others;
+    the batch is sent early once it holds AI_BATCH_MAX_SIZE messages.
+    """
+    global _open_batch
+    loop = asyncio.get_running_loop()
+    batch = _open_batch
+    if batch is None or batch.loop is not loop:
+        batch = _open_batch = _Batch(loop)
+        batch.task = loop.create_task(_run_batch(batch))
+    future = loop.create_future()
+    batch.messages.append((user_text, hints))
+    batch.futures.append(future)
+    if len(batch.messages) >= AI_BATCH_MAX_SIZE:
+        _open_batch = None
+        batch.full.set()
+    return await future
+
+
+async def parse_expenses_async(user_text: str, hints=None) -> list[dict]:
+    """Parse user text into expense dicts without blocking the event loop.
+
+    Same contract as parse_expenses(). Messages arriving close together are
+    sent as one batched request (AI_BATCH_WINDOW_MS). Waits for a free slot
+    when AI_MAX_CONCURRENCY requests are already running; cache hits never wait.
+    """
+    cache_key = _cache_key(user_text, hints)
+    cached = _cache_lookup(cache_key)
+    if cached is not None:
+        return cached
+
+    if AI_BATCH_WINDOW_MS > 0:
+        data, elapsed = await _parse_batched(user_text, hints)
+    else:
+        response, elapsed = await _complete_async(_request_kwargs(user_text, hints))
+        data = _parse_response(response)
+    _cache_store(cache_key, data, elapsed)
+    return data
+
+
+def parse_expenses(user_text: str, hints=None) -> list[dict]:
+    """Parse user text into expense dicts using OpenAI.
+
+    Returns a list of expense dicts, or empty list for non-expense messages.
+    Raises json.JSONDecodeError or Exception on failure.
+    """
+    cache_key = _cache_key(user_text, hints)
+    cached = _cache_lookup(cache_key)
+    if cached is not None:
+        return cached
+
+    start = time.monotonic()
+    try:
+        attempt = 0
+        while True:
+            try:
+                response = client_ai.chat.completions.create(**_request_kwargs(user_text, hints))
+                break
+            except Exception as e:
+                delay = _next_retry(attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+    finally:
+        elapsed = time.monotonic() - start
+        _record_latency(elapsed)
 
+    data = _parse_response(response)
+    _cache_store(cache_key, data, elapsed)
     return data
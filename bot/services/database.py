@@ -6,77 +6,507 @@ is_available() returns False and the bot falls back to Sheets-only mode.
 
 import os
 import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
 from datetime import date, datetime, timedelta
 from decimal import Decimal
 from pathlib import Path
 
+from bot.utils.aio import AsyncFacade, run_async
+
 logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
-_pool: list = []
-_POOL_SIZE = 3
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "5"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+# Connections idle longer than this get a SELECT 1 before being handed out
+DB_POOL_IDLE_CHECK = float(os.environ.get("DB_POOL_IDLE_CHECK", "30"))
+# Idle connections above DB_POOL_MIN are closed after this many seconds
+DB_POOL_MAX_IDLE = float(os.environ.get("DB_POOL_MAX_IDLE", "300"))
+
+# A successful query vouches for the database for this many seconds
+DB_HEALTH_TTL = float(os.environ.get("DB_HEALTH_TTL", "15"))
+# Consecutive connection failures that open the circuit breaker
+DB_BREAKER_THRESHOLD = int(os.environ.get("DB_BREAKER_THRESHOLD", "3"))
+# Seconds the breaker stays open before letting a single probe through
+DB_BREAKER_COOLDOWN = float(os.environ.get("DB_BREAKER_COOLDOWN", "30"))
+
+# pg_advisory_lock key serializing Sheets appends of expenses (see sheets_sync_lock)
+SHEETS_SYNC_LOCK_KEY = 0x53594E43
+# Seconds a blocking sheets_sync_lock() waits before giving up
+SHEETS_SYNC_LOCK_TIMEOUT = float(os.environ.get("SHEETS_SYNC_LOCK_TIMEOUT", "30"))
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the checkout timeout."""
+
+
+class DatabaseUnavailable(Exception):
+    """Raised without touching the network while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker driven by real query outcomes.
+
+    closed    — queries flow; a recent success makes is_available() free.
+    open      — queries fail fast with DatabaseUnavailable until the cooldown ends.
+    half_open — exactly one probe query is let through; its outcome closes
+                or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold: int = 3, cooldown: float = 30.0,
+                 health_ttl: float = 15.0, clock=time.monotonic):
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._health_ttl = health_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._last_success: float | None = None
+        self._probe_in_flight = False
+        self._stats = {
+            "transitions": 0,
+            "opened": 0,
+            "fast_failures": 0,
+            "failures": 0,
+            "probes": 0,
+        }
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def is_healthy(self) -> bool:
+        """True if closed and a query succeeded within the health TTL."""
+        with self._lock:
+            return (
+                self._state == self.CLOSED
+                and self._last_success is not None
+                and self._clock() - self._last_success < self._health_ttl
+            )
+
+    def allow_request(self) -> bool:
+        """Whether a query may hit the network right now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if self._clock() - self._opened_at < self._cooldown:
+                    self._stats["fast_failures"] += 1
+                    return False
+                self._transition(self.HALF_OPEN)
+            if self._probe_in_flight:
+                self._stats["fast_failures"] += 1
+                return False
+            self._probe_in_flight = True
+            self._stats["probes"] += 1
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._last_success = self._clock()
+            self._probe_in_flight = False
+            if self._state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._stats["failures"] += 1
+            self._last_success = None
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= self._threshold
+            ):
+                self._opened_at = self._clock()
+                self._stats["opened"] += 1
+                self._transition(self.OPEN)
+
+    def release_probe(self) -> None:
+        """Give up a half-open probe slot without judging the database."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._last_success = None
+            self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._stats)
+            result["state"] = self._state
+            result["consecutive_failures"] = self._failures
+            result["last_success_age"] = (
+                self._clock() - self._last_success if self._last_success is not None else None
+            )
+        return result
+
+    def _transition(self, new_state: str) -> None:
+        # Caller holds the lock
+        logger.warning(f"Database circuit breaker: {self._state} -> {new_state}"
+                       f" (consecutive failures: {self._failures})")
+        self._state = new_state
+        self._stats["transitions"] += 1
+
+
+class ConnectionPool:
+    """Bounded, thread-safe PostgreSQL connection pool.
+
+    Idle connections are kept LIFO so the hottest one is reused first.
+    Liveness is only checked for connections that sat idle longer than
+    ``idle_check`` seconds, not on every checkout.
+    """
+
+    def __init__(self, dsn: str, minconn: int = 1, maxconn: int = 5,
+                 timeout: float = 5.0, idle_check: float = 30.0,
+                 max_idle: float = 300.0, connect=None):
+        if maxconn < 1 or minconn < 0 or minconn > maxconn:
+            raise ValueError("invalid pool size")
+        self._dsn = dsn
+        self._minconn = minconn
+        self._maxconn = maxconn
+        self._timeout = timeout
+        self._idle_check = idle_check
+        self._max_idle = max_idle
+        self._connect_fn = connect or _connect
+        self._idle: list[tuple] = []  # (conn, released_at monotonic)
+        self._out: set[int] = set()  # ids of checked-out connections
+        self._size = 0  # open connections, idle + checked out
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "exhausted": 0,
+            "timeouts": 0,
+            "created": 0,
+            "closed": 0,
+            "liveness_checks": 0,
+            "liveness_failures": 0,
+        }
+
+    def getconn(self):
+        """Check out a connection, waiting up to the pool timeout."""
+        start = time.monotonic()
+        deadline = start + self._timeout
+        waited = False
+        while True:
+            conn = None
+            released_at = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("connection pool is closed")
+                    if self._idle:
+                        conn, released_at = self._idle.pop()
+                        break
+                    if self._size < self._maxconn:
+                        self._size += 1
+                        break
+                    if not waited:
+                        waited = True
+                        self._stats["exhausted"] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"no connection available within {self._timeout:.1f}s "
+                            f"(pool size {self._maxconn})"
+                        )
+                    self._cond.wait(remaining)
+
+            if conn is None:
+                try:
+                    conn = self._connect_fn(self._dsn)
+                except Exception:
+                    self._drop_slot()
+                    raise
+                with self._cond:
+                    self._stats["created"] += 1
+            elif time.monotonic() - released_at > self._idle_check and not self._is_alive(conn):
+                self._close(conn)
+                continue
+
+            with self._cond:
+                self._out.add(id(conn))
+            self._record_checkout(time.monotonic() - start)
+            return conn
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        """Return a connection; broken or discarded connections are closed."""
+        with self._cond:
+            owned = id(conn) in self._out
+            self._out.discard(id(conn))
+        if not owned:
+            # Not ours (e.g. checked out before the pool was replaced)
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+
+        if not discard and not conn.closed and not self._closed:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        if discard:
+            self._close(conn)
+            return
+
+        now = time.monotonic()
+        stale = []
+        with self._cond:
+            self._idle.append((conn, now))
+            # Shrink back towards minconn, oldest idle connections first
+            while (self._size - len(stale) > self._minconn and self._idle
+                   and now - self._idle[0][1] > self._max_idle):
+                stale.append(self._idle.pop(0)[0])
+            self._cond.notify()
+        for old in stale:
+            self._close(old)
+
+    def warm(self) -> None:
+        """Open connections up to minconn."""
+        conns = []
+        try:
+            while True:
+                with self._cond:
+                    if self._size >= self._minconn:
+                        break
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+
+    def closeall(self) -> None:
+        """Close every idle connection and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self) -> dict:
+        """Snapshot of pool counters and current occupancy."""
+        with self._cond:
+            result = dict(self._stats)
+            result["size"] = self._size
+            result["idle"] = len(self._idle)
+            result["in_use"] = self._size - len(self._idle)
+            result["max_size"] = self._maxconn
+        checkouts = result["checkouts"]
+        result["wait_seconds_avg"] = result["wait_seconds_total"] / checkouts if checkouts else 0.0
+        return result
+
+    def _is_alive(self, conn) -> bool:
+        with self._cond:
+            self._stats["liveness_checks"] += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            with self._cond:
+                self._stats["liveness_failures"] += 1
+            return False
+
+    def _record_checkout(self, wait: float) -> None:
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["wait_seconds_total"] += wait
+            if wait > self._stats["wait_seconds_max"]:
+                self._stats["wait_seconds_max"] = wait
+
+    def _close(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats["closed"] += 1
+        self._drop_slot()
+
+    def _drop_slot(self) -> None:
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+
+def _connect(dsn: str):
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = False
+    return conn
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DATABASE_URL,
+                    minconn=DB_POOL_MIN,
+                    maxconn=DB_POOL_MAX,
+                    timeout=DB_POOL_TIMEOUT,
+                    idle_check=DB_POOL_IDLE_CHECK,
+                    max_idle=DB_POOL_MAX_IDLE,
+                )
+    return _pool
+
+
+def close_pool() -> None:
+    """Close all pooled connections; the next query opens a fresh pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+def pool_stats() -> dict:
+    """Connection pool counters (checkout wait time, exhaustion, churn)."""
+    if _pool is None:
+        return {}
+    return _pool.stats()
+
+
+_breaker = CircuitBreaker(
+    threshold=DB_BREAKER_THRESHOLD,
+    cooldown=DB_BREAKER_COOLDOWN,
+    health_ttl=DB_HEALTH_TTL,
+)
+
+
+def breaker_stats() -> dict:
+    """Circuit breaker state and transition counters."""
+    return _breaker.stats()
 
 
 def is_available() -> bool:
-    """Check if PostgreSQL is configured and reachable."""
+    """Check if PostgreSQL is configured and reachable.
+
+    Answered from the circuit breaker: free while recent queries succeed,
+    False without any network I/O while the breaker is open.
+    """
     if not DATABASE_URL:
         return False
+    if _breaker.is_healthy():
+        return True
     try:
-        conn = _get_conn()
-        with conn.cursor() as cur:
-            cur.execute("SELECT 1")
-        _release_conn(conn)
+        _execute("SELECT 1", fetchone=True)
         return True
+    except DatabaseUnavailable:
+        return False
     except Exception as e:
         logger.warning(f"Database not available: {e}")
         return False
 
 
 def _get_conn():
-    """Get a connection from the pool or create a new one."""
-    import psycopg2
-    import psycopg2.extras
-
-    if _pool:
-        conn = _pool.pop()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1")
-            return conn
-        except Exception:
-            try:
-                conn.close()
-            except Exception:
-                pass
-
-    conn = psycopg2.connect(DATABASE_URL)
-    conn.autocommit = False
-    return conn
+    """Check out a connection from the pool."""
+    return _get_pool().getconn()
 
 
 def _release_conn(conn):
     """Return a connection to the pool."""
-    if len(_pool) < _POOL_SIZE:
-        try:
-            conn.rollback()
-            _pool.append(conn)
-        except Exception:
-            try:
-                conn.close()
-            except Exception:
-                pass
-    else:
+    pool = _pool
+    if pool is None:
         try:
             conn.close()
         except Exception:
             pass
+        return
+    pool.putconn(conn)
 
 
-def _execute(query, params=None, fetch=False, fetchone=False, returning=False):
-    """Execute a query with automatic connection management."""
-    conn = _get_conn()
+@contextmanager
+def _connection():
+    """Check out a connection and report the outcome to the circuit breaker.
+
+    Only connection-level failures (connect errors, connections that broke
+    mid-query) count against the database; SQL errors prove it is reachable.
+    """
+    if not _breaker.allow_request():
+        raise DatabaseUnavailable("database circuit breaker is open")
+    try:
+        conn = _get_conn()
+    except PoolTimeout:
+        _breaker.release_probe()
+        raise
+    except Exception:
+        _breaker.record_failure()
+        raise
     try:
+        yield conn
+    except Exception:
+        if conn.closed:
+            _breaker.record_failure()
+        else:
+            _breaker.record_success()
+        _safe_rollback(conn)
+        raise
+    else:
+        _breaker.record_success()
+    finally:
+        _release_conn(conn)
+
+
+@contextmanager
+def _connection_or(conn=None):
+    """Use the given connection (e.g. the one holding sheets_sync_lock), else check one out."""
+    if conn is not None:
+        yield conn
+        return
+    with _connection() as conn:
+        yield conn
+
+
+def _safe_rollback(conn) -> None:
+    """Roll back, ignoring errors from connections that already broke."""
+    try:
+        conn.rollback()
+    except Exception:
+        pass
+
+
+# --- Async facade ---
+
+# ``await database.aio.get_budgets(uid)``; run_async(func, ...) for anything else
+aio = AsyncFacade(globals())
+
+
+def _execute(query, params=None, fetch=False, fetchone=False, returning=False, conn=None):
+    """Execute a query with automatic connection management."""
+    with _connection_or(conn) as conn:
         with conn.cursor() as cur:
             cur.execute(query, params)
             result = None
@@ -86,19 +516,13 @@ def _execute(query, params=None, fetch=False, fetchone=False, returning=False):
                 result = cur.fetchall()
             conn.commit()
             return result
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        _release_conn(conn)
 
 
-def _execute_dict(query, params=None, fetchone=False):
+def _execute_dict(query, params=None, fetchone=False, conn=None):
     """Execute a query and return results as list of dicts."""
     import psycopg2.extras
 
-    conn = _get_conn()
-    try:
+    with _connection_or(conn) as conn:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
             cur.execute(query, params)
             if fetchone:
@@ -107,11 +531,19 @@ def _execute_dict(query, params=None, fetchone=False):
             rows = cur.fetchall()
             conn.commit()
             return [dict(r) for r in rows]
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        _release_conn(conn)
+
+
+def _execute_values(query, rows, template=None, fetch=False, page_size=1000, conn=None):
+    """Run a multi-row VALUES statement (execute_values) in one transaction."""
+    import psycopg2.extras
+
+    with _connection_or(conn) as conn:
+        with conn.cursor() as cur:
+            result = psycopg2.extras.execute_values(
+                cur, query, rows, template=template, page_size=page_size, fetch=fetch
+            )
+            conn.commit()
+            return result
 
 
 # --- Migrations ---
@@ -132,8 +564,7 @@ def init_db():
 
 def _run_migrations():
     """Run all pending SQL migrations from migrations/ directory."""
-    conn = _get_conn()
-    try:
+    with _connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS schema_version (
@@ -155,7 +586,7 @@ def _run_migrations():
                 continue
 
             logger.info(f"Applying migration {migration_file.name}")
-            sql = migration_file.read_text()
+            sql = migration_file.read_text(encoding="utf-8")
 
             with conn.cursor() as cur:
                 cur.execute(sql)
@@ -166,12 +597,6 @@ def _run_migrations():
             conn.commit()
             logger.info(f"Migration {migration_file.name} applied successfully")
 
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        _release_conn(conn)
-
 
 # --- User Management ---
 
@@ -213,36 +638,112 @@ def set_user_language(telegram_id: int, language: str):
 
 # --- Expenses ---
 
-def save_expense(user_id: int, expense_dict: dict, original_text: str) -> int:
-    """Save a single expense. Returns expense ID."""
+def _expense_values(user_id: int, expense_dict: dict, original_text: str) -> tuple:
     from bot.config import MONTHS_MAPPING
 
     expense_date = datetime.strptime(expense_dict["date"], "%Y-%m-%d")
-    month_name = MONTHS_MAPPING[expense_date.month]
+    return (
+        user_id,
+        expense_dict["amount"],
+        expense_dict["date"],
+        expense_dict["category"],
+        expense_dict["subcategory"],
+        expense_dict["description"],
+        original_text,
+        MONTHS_MAPPING[expense_date.month],
+    )
 
-    row = _execute(
-        """INSERT INTO expenses
-           (user_id, amount, date, category, subcategory, description, original_text, month_name)
-           VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-           RETURNING id""",
-        (
-            user_id,
-            expense_dict["amount"],
-            expense_dict["date"],
-            expense_dict["category"],
-            expense_dict["subcategory"],
-            expense_dict["description"],
-            original_text,
-            month_name,
-        ),
-        returning=True,
+
+_INSERT_EXPENSES = """INSERT INTO expenses
+    (user_id, amount, date, category, subcategory, description, original_text, month_name)
+    VALUES %s
+    RETURNING id"""
+
+
+def _insert_expenses(cur, rows: list[tuple]) -> list[int]:
+    """Insert _expense_values() rows on an open cursor with one multi-row
+    INSERT. IDs come back in input order."""
+    import psycopg2.extras
+
+    if not rows:
+        return []
+    result = psycopg2.extras.execute_values(
+        cur, _INSERT_EXPENSES, rows, page_size=len(rows), fetch=True
     )
-    return row[0]
+    return [r[0] for r in result]
+
+
+def save_expense(user_id: int, expense_dict: dict, original_text: str) -> int:
+    """Save a single expense. Returns expense ID."""
+    return save_expense_rows([(user_id, expense_dict, original_text)])[0]
+
+
+def save_expense_rows(items: list[tuple[int, dict, str]]) -> list[int]:
+    """Save (user_id, expense_dict, original_text) items in one transaction.
+
+    Returns expense IDs in input order. Either all rows are saved or none.
+    """
+    if not items:
+        return []
+    rows = [_expense_values(*item) for item in items]
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            ids = _insert_expenses(cur, rows)
+        conn.commit()
+    return ids
 
 
 def save_expenses(user_id: int, expenses: list[dict], original_text: str) -> list[int]:
-    """Save multiple expenses. Returns list of expense IDs."""
-    return [save_expense(user_id, e, original_text) for e in expenses]
+    """Save multiple expenses atomically. Returns list of expense IDs."""
+    return save_expense_rows([(user_id, e, original_text) for e in expenses])
+
+
+def import_sheet_expenses(user_id: int, rows: list[tuple[str, int, dict, str, int]]) -> list[int]:
+    """Insert expenses read from the sheet, skipping ones already stored.
+
+    rows: (content_hash, occurrence, expense_dict, original_text, sheet_row).
+    occurrence is the 1-based count of that hash in the sheet so far, so
+    legitimately repeated expenses (two identical coffees on one day) are
+    kept while a re-import adds nothing. Imported rows are marked synced to
+    their sheet row. Runs in one transaction; returns the sheet rows that
+    were skipped as duplicates.
+    """
+    import psycopg2.extras
+
+    if not rows:
+        return []
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """SELECT content_hash, COUNT(*) FROM expenses
+                   WHERE user_id = %s AND content_hash = ANY(%s)
+                   GROUP BY content_hash""",
+                (user_id, list({r[0] for r in rows})),
+            )
+            stored = dict(cur.fetchall())
+
+            values = []
+            duplicates = []
+            for content_hash, occurrence, expense, original_text, sheet_row in rows:
+                if occurrence <= stored.get(content_hash, 0):
+                    duplicates.append(sheet_row)
+                    continue
+                stored[content_hash] = stored.get(content_hash, 0) + 1
+                values.append(_expense_values(user_id, expense, original_text) + (sheet_row,))
+
+            if values:
+                psycopg2.extras.execute_values(
+                    cur,
+                    """INSERT INTO expenses
+                       (user_id, amount, date, category, subcategory, description,
+                        original_text, month_name, sheets_row_index, synced_to_sheets)
+                       VALUES %s""",
+                    values,
+                    template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE)",
+                    page_size=len(values),
+                )
+        conn.commit()
+    return duplicates
 
 
 def delete_expenses(expense_ids: list[int]):
@@ -273,19 +774,185 @@ def get_expenses_by_date_range(user_id: int, start_date: str, end_date: str) ->
     )
 
 
-def search_expenses(user_id: int, query: str) -> list[dict]:
-    """Full-text search in expense descriptions."""
-    pattern = f"%{query}%"
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def month_range(month_name: str, today: date | None = None) -> tuple[date, date]:
+    """[start, end) dates of the most recent occurrence of a Polish month name.
+
+    The current month and earlier ones resolve to this year, later months to
+    last year (asking for "Listopad" in March means last November).
+    """
+    from bot.config import MONTH_NAME_TO_NUM
+
+    today = today or date.today()
+    month_num = MONTH_NAME_TO_NUM[month_name.lower()]
+    year = today.year if month_num <= today.month else today.year - 1
+    start = date(year, month_num, 1)
+    end = date(year + 1, 1, 1) if month_num == 12 else date(year, month_num + 1, 1)
+    return start, end
+
+
+def get_category_totals(user_id: int, start_date, end_date, rollup: bool = False) -> list[dict]:
+    """Sum and count of expenses per (category, subcategory) in [start_date, end_date).
+
+    One aggregate query; the result size depends on the number of categories,
+    not expenses. Whole-month ranges are answered from the
+    monthly_category_totals rollup, other ranges from expenses. With
+    rollup=True the result also holds per-category rows (subcategory None)
+    and a grand total row (category and subcategory None). Rows are ordered
+    by total, largest first.
+    """
+    group_by = "ROLLUP (category, subcategory)" if rollup else "category, subcategory"
+    start, end = _as_date(start_date), _as_date(end_date)
+    if start.day == 1 and end.day == 1:
+        rows = _execute_dict(
+            f"""SELECT category, subcategory, SUM(total) AS total, SUM(count) AS count
+                FROM monthly_category_totals
+                WHERE user_id = %s AND (year, month) >= (%s, %s) AND (year, month) < (%s, %s)
+                GROUP BY {group_by}
+                ORDER BY total DESC, category, subcategory""",
+            (user_id, start.year, start.month, end.year, end.month),
+        )
+    else:
+        rows = _execute_dict(
+            f"""SELECT category, subcategory, SUM(amount) AS total, COUNT(*) AS count
+                FROM expenses WHERE user_id = %s AND date >= %s AND date < %s
+                GROUP BY {group_by}
+                ORDER BY total DESC, category, subcategory""",
+            (user_id, start, end),
+        )
+    for row in rows:
+        row["total"] = float(row["total"])
+        row["count"] = int(row["count"])
+    return rows
+
+
+def fold_category_totals(rows: list[dict]) -> tuple[float, int, dict, dict]:
+    """Fold get_category_totals() leaf rows into
+    (grand_total, count, {category: total}, {category: {subcategory: total}}).
+
+    Rollup rows, if present, are ignored; totals are recomputed from leaves.
+    """
+    totals: dict[str, float] = {}
+    sub_totals: dict[str, dict[str, float]] = {}
+    count = 0
+    for row in rows:
+        category, subcategory = row["category"], row["subcategory"]
+        if category is None or subcategory is None:
+            continue
+        totals[category] = totals.get(category, 0) + row["total"]
+        if subcategory:
+            sub_totals.setdefault(category, {})[subcategory] = row["total"]
+        count += row["count"]
+    return sum(totals.values()), count, totals, sub_totals
+
+
+def shift_month(month_start: date, months: int) -> date:
+    """First day of the month `months` away from month_start (may be negative)."""
+    index = month_start.year * 12 + month_start.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def get_monthly_trend(user_id: int, first_month: date, last_month: date) -> dict:
+    """Expense totals per month and category from first_month to last_month
+    (inclusive, both given as any day in the month), in one query.
+
+    Returns a dense matrix: {"months": [date, ...] oldest first,
+    "categories": [name, ...] by overall total, "matrix": [[total, ...], ...]
+    with matrix[i][j] the total of categories[j] in months[i] (0.0 when
+    nothing was spent), "totals": [month total, ...]}.
+    """
+    first = first_month.replace(day=1)
+    last = last_month.replace(day=1)
+    end = shift_month(last, 1)
+    rows = _execute(
+        """SELECT make_date(year, month, 1) AS month, category, SUM(total)
+           FROM monthly_category_totals
+           WHERE user_id = %s AND (year, month) >= (%s, %s) AND (year, month) < (%s, %s)
+           GROUP BY year, month, category""",
+        (user_id, first.year, first.month, end.year, end.month),
+        fetch=True,
+    )
+
+    months = []
+    month = first
+    while month <= last:
+        months.append(month)
+        month = shift_month(month, 1)
+
+    by_category: dict[str, float] = {}
+    for _, category, total in rows:
+        by_category[category] = by_category.get(category, 0.0) + float(total)
+    categories = sorted(by_category, key=lambda c: (-by_category[c], c))
+
+    row_of = {m: i for i, m in enumerate(months)}
+    col_of = {c: j for j, c in enumerate(categories)}
+    matrix = [[0.0] * len(categories) for _ in months]
+    for month, category, total in rows:
+        matrix[row_of[month]][col_of[category]] = float(total)
+
+    return {
+        "months": months,
+        "categories": categories,
+        "matrix": matrix,
+        "totals": [sum(values) for values in matrix],
+    }
+
+
+_SEARCH_WORD = re.compile(r"[^\W_]+")
+
+
+def search_tsquery(query: str) -> str | None:
+    """tsquery text for a search: every word, as a prefix ("bied" finds
+    "biedronka"). None if the query has no words."""
+    words = _SEARCH_WORD.findall(query)
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def search_expenses(
+    user_id: int,
+    query: str,
+    limit: int | None = None,
+    offset: int = 0,
+    min_amount: float | None = None,
+    max_amount: float | None = None,
+    start: date | str | None = None,
+    end: date | str | None = None,
+) -> list[dict]:
+    """Full-text search in descriptions, categories and original messages
+    (migration 005), best matches first, then newest.
+
+    Words match case- and Polish-diacritic-insensitively, as prefixes; all of
+    them must match. Amount and date bounds are inclusive. Each row has
+    "rank" and "total_count" (matches across all pages).
+    """
+    tsquery = search_tsquery(query)
+    if tsquery is None:
+        return []
+    conditions = ["user_id = %s", "search_vector @@ q"]
+    params: list = [tsquery, user_id]
+    for condition, value in (("amount >= %s", min_amount), ("amount <= %s", max_amount),
+                             ("date >= %s", start), ("date <= %s", end)):
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    params += [limit, offset]
     return _execute_dict(
-        """SELECT id, amount, date, category, subcategory, description, original_text, month_name, created_at
-           FROM expenses WHERE user_id = %s AND (
-               LOWER(description) LIKE LOWER(%s)
-               OR LOWER(category) LIKE LOWER(%s)
-               OR LOWER(subcategory) LIKE LOWER(%s)
-               OR LOWER(original_text) LIKE LOWER(%s)
-           )
-           ORDER BY date DESC, created_at DESC""",
-        (user_id, pattern, pattern, pattern, pattern),
+        f"""SELECT id, amount, date, category, subcategory, description, original_text, month_name, created_at,
+                   ts_rank_cd(search_vector, q) AS rank, COUNT(*) OVER () AS total_count
+            FROM expenses, to_tsquery('simple', expense_search_fold(%s)) AS q
+            WHERE {" AND ".join(conditions)}
+            ORDER BY rank DESC, date DESC, created_at DESC
+            LIMIT %s OFFSET %s""",
+        tuple(params),
     )
 
 
@@ -300,16 +967,121 @@ def get_recent_expenses(user_id: int, limit: int = 10) -> list[dict]:
     )
 
 
-def get_unsynced_expenses() -> list[dict]:
-    """Get expenses not yet synced to Google Sheets."""
+def get_description_categories(user_id: int, before: datetime | None = None) -> list[dict]:
+    """How often each description was saved under each (category, subcategory).
+
+    Rows: {"description", "category", "subcategory", "count"}. ``before``
+    limits the history to expenses created earlier than that moment.
+    """
     return _execute_dict(
-        """SELECT e.id, e.amount, e.date, e.category, e.subcategory, e.description,
+        """SELECT LOWER(description) AS description, category, subcategory, COUNT(*) AS count
+           FROM expenses
+           WHERE user_id = %s AND description <> ''
+             AND (%s::timestamp IS NULL OR created_at < %s)
+           GROUP BY 1, 2, 3""",
+        (user_id, before, before),
+    )
+
+
+def get_parse_history(user_id: int, limit: int = 1000) -> list[dict]:
+    """The most recent messages and what was saved from them, newest first.
+
+    Rows: {"original_text", "created_at", "expenses": [(category, subcategory), ...]}.
+    """
+    rows = _execute_dict(
+        """SELECT original_text, created_at,
+                  array_agg(category ORDER BY id) AS categories,
+                  array_agg(subcategory ORDER BY id) AS subcategories
+           FROM expenses
+           WHERE user_id = %s AND original_text <> ''
+           GROUP BY original_text, created_at
+           ORDER BY created_at DESC
+           LIMIT %s""",
+        (user_id, limit),
+    )
+    return [
+        {
+            "original_text": row["original_text"],
+            "created_at": row["created_at"],
+            "expenses": list(zip(row["categories"], row["subcategories"])),
+        }
+        for row in rows
+    ]
+
+
+def get_unsynced_expenses(limit: int | None = None, conn=None) -> list[dict]:
+    """Get expenses not yet synced to Google Sheets, oldest first."""
+    query = """SELECT e.id, e.amount, e.date, e.category, e.subcategory, e.description,
                   e.original_text, e.month_name, u.telegram_id
            FROM expenses e
            JOIN users u ON e.user_id = u.id
            WHERE e.synced_to_sheets = FALSE
-           ORDER BY e.created_at"""
+           ORDER BY e.created_at, e.id"""
+    if limit is not None:
+        return _execute_dict(query + " LIMIT %s", (limit,), conn=conn)
+    return _execute_dict(query, conn=conn)
+
+
+def filter_unsynced(expense_ids: list[int], conn=None) -> set[int]:
+    """The ids among expense_ids that are still waiting for Sheets sync."""
+    if not expense_ids:
+        return set()
+    rows = _execute(
+        "SELECT id FROM expenses WHERE id = ANY(%s) AND synced_to_sheets = FALSE",
+        (list(expense_ids),),
+        fetch=True,
+        conn=conn,
+    )
+    return {row[0] for row in rows}
+
+
+@contextmanager
+def sheets_sync_lock(wait: bool = True):
+    """Hold a Postgres advisory lock while appending expenses to Sheets.
+
+    The background sync and confirm-time appends (bot or CLI process) take it
+    and re-read what is still unsynced, so no expense is appended twice.
+    Yields the connection holding the lock; run the queries made under the
+    lock on it (conn=...) instead of checking out more pooled connections.
+
+    Waits at most SHEETS_SYNC_LOCK_TIMEOUT seconds (psycopg2 raises
+    LockNotAvailable after that). With wait=False, yields None at once if
+    another holder has it.
+    """
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            if wait:
+                cur.execute("SET LOCAL lock_timeout = %s", (f"{int(SHEETS_SYNC_LOCK_TIMEOUT * 1000)}ms",))
+                cur.execute("SELECT pg_advisory_lock(%s)", (SHEETS_SYNC_LOCK_KEY,))
+                acquired = True
+            else:
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (SHEETS_SYNC_LOCK_KEY,))
+                acquired = cur.fetchone()[0]
+        conn.commit()
+        if not acquired:
+            yield None
+            return
+        try:
+            yield conn
+        finally:
+            _safe_rollback(conn)
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (SHEETS_SYNC_LOCK_KEY,))
+                conn.commit()
+            except Exception as e:
+                # Closing the session is what releases a lock we could not unlock
+                logger.warning(f"Could not release the Sheets sync lock: {e}")
+                conn.close()
+
+
+def count_unsynced_expenses() -> int:
+    """Count expenses still waiting for Sheets sync."""
+    row = _execute(
+        "SELECT COUNT(*) FROM expenses WHERE synced_to_sheets = FALSE",
+        fetchone=True,
     )
+    return row[0] if row else 0
 
 
 def mark_synced(expense_id: int, sheets_row_index: int):
@@ -320,6 +1092,21 @@ def mark_synced(expense_id: int, sheets_row_index: int):
     )
 
 
+def mark_synced_bulk(pairs: list[tuple[int, int]], conn=None):
+    """Mark many expenses as synced in one UPDATE. pairs = [(expense_id, row_index)]."""
+    if not pairs:
+        return
+    _execute_values(
+        """UPDATE expenses AS e
+           SET synced_to_sheets = TRUE, sheets_row_index = v.row_index
+           FROM (VALUES %s) AS v(id, row_index)
+           WHERE e.id = v.id""",
+        pairs,
+        template="(%s::integer, %s::integer)",
+        conn=conn,
+    )
+
+
 # --- Budgets ---
 
 def set_budget(user_id: int, category: str | None, monthly_limit: float):
@@ -340,21 +1127,36 @@ def get_budgets(user_id: int) -> list[dict]:
     )
 
 
-def get_budget_usage(user_id: int, category: str | None, month_name: str) -> float:
-    """Get total spending for a category in a given month."""
-    if category is None:
-        row = _execute(
-            "SELECT COALESCE(SUM(amount), 0) FROM expenses WHERE user_id = %s AND month_name = %s",
-            (user_id, month_name),
-            fetchone=True,
-        )
-    else:
-        row = _execute(
-            "SELECT COALESCE(SUM(amount), 0) FROM expenses WHERE user_id = %s AND month_name = %s AND category = %s",
-            (user_id, month_name, category),
-            fetchone=True,
-        )
-    return float(row[0]) if row else 0.0
+def get_budget_status(user_id: int, year: int, month: int) -> list[dict]:
+    """All budgets with their usage in a month (month is 1-12), from one query.
+
+    Returns [{"id", "category", "monthly_limit", "used", "pct"}] ordered like
+    get_budgets() (total budget first). Amounts are floats; pct is 0 when the
+    limit is not positive.
+    """
+    rows = _execute_dict(
+        """SELECT b.id, b.category, b.monthly_limit, COALESCE(SUM(m.total), 0) AS used
+           FROM budgets b
+           LEFT JOIN monthly_category_totals m
+             ON m.user_id = b.user_id AND m.year = %s AND m.month = %s
+            AND (b.category IS NULL OR m.category = b.category)
+           WHERE b.user_id = %s
+           GROUP BY b.id, b.category, b.monthly_limit
+           ORDER BY b.category NULLS FIRST""",
+        (year, month, user_id),
+    )
+    status = []
+    for row in rows:
+        limit_val = float(row["monthly_limit"])
+        used = float(row["used"])
+        status.append({
+            "id": row["id"],
+            "category": row["category"],
+            "monthly_limit": limit_val,
+            "used": used,
+            "pct": (used / limit_val * 100) if limit_val > 0 else 0,
+        })
+    return status
 
 
 def delete_budget(user_id: int, category: str | None):
@@ -365,6 +1167,55 @@ def delete_budget(user_id: int, category: str | None):
     )
 
 
+# --- Monthly rollup ---
+
+_ROLLUP_FROM_EXPENSES = """
+    SELECT user_id, EXTRACT(YEAR FROM date)::int AS year, EXTRACT(MONTH FROM date)::int AS month,
+           category, subcategory, SUM(amount) AS total, COUNT(*) AS count
+    FROM expenses WHERE user_id IS NOT NULL
+    GROUP BY 1, 2, 3, 4, 5"""
+
+
+def rebuild_monthly_totals() -> int:
+    """Recompute monthly_category_totals from expenses. Returns rows written.
+
+    Runs in one transaction holding a SHARE lock on expenses, so concurrent
+    writes wait instead of being lost between the wipe and the recompute.
+    """
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("LOCK TABLE expenses IN SHARE MODE")
+            cur.execute("DELETE FROM monthly_category_totals")
+            cur.execute(
+                "INSERT INTO monthly_category_totals "
+                "(user_id, year, month, category, subcategory, total, count)"
+                + _ROLLUP_FROM_EXPENSES
+            )
+            count = cur.rowcount
+        conn.commit()
+    return count
+
+
+def verify_monthly_totals() -> list[dict]:
+    """Compare the rollup with the raw expenses. Returns mismatching keys
+    with both sides' totals and counts; an empty list means consistent."""
+    return _execute_dict(
+        f"""SELECT COALESCE(r.user_id, t.user_id) AS user_id,
+                   COALESCE(r.year, t.year) AS year,
+                   COALESCE(r.month, t.month) AS month,
+                   COALESCE(r.category, t.category) AS category,
+                   COALESCE(r.subcategory, t.subcategory) AS subcategory,
+                   r.total AS expected_total, t.total AS rollup_total,
+                   r.count AS expected_count, t.count AS rollup_count
+            FROM ({_ROLLUP_FROM_EXPENSES}) r
+            FULL OUTER JOIN monthly_category_totals t
+              ON t.user_id = r.user_id AND t.year = r.year AND t.month = r.month
+             AND t.category = r.category AND t.subcategory = r.subcategory
+            WHERE r.total IS DISTINCT FROM t.total OR r.count IS DISTINCT FROM t.count
+            ORDER BY 1, 2, 3, 4, 5"""
+    )
+
+
 # --- Recurring Expenses ---
 
 def add_recurring(user_id: int, data: dict) -> int:
@@ -431,6 +1282,33 @@ def update_next_due(recurring_id: int, next_due: date):
     )
 
 
+def save_recurring_expenses(items: list[tuple[int, int, dict, str, date]]) -> list[int]:
+    """Book due recurring expenses in one transaction.
+
+    items: (recurring_id, user_id, expense_dict, original_text, next_due).
+    Inserts all expenses and advances every next_due together, so a failure
+    never books an expense without moving its schedule (or vice versa).
+    Returns expense IDs in input order.
+    """
+    import psycopg2.extras
+
+    if not items:
+        return []
+    rows = [_expense_values(user_id, e, text) for _, user_id, e, text, _ in items]
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            ids = _insert_expenses(cur, rows)
+            psycopg2.extras.execute_values(
+                cur,
+                """UPDATE recurring_expenses AS r SET next_due = v.next_due
+                   FROM (VALUES %s) AS v(id, next_due) WHERE r.id = v.id""",
+                [(rid, next_due) for rid, _, _, _, next_due in items],
+                template="(%s::integer, %s::date)",
+            )
+        conn.commit()
+    return ids
+
+
 # --- Income ---
 
 def save_income(user_id: int, amount: float, source: str, date_str: str, description: str | None = None, category: str | None = None) -> int:
@@ -474,6 +1352,17 @@ def get_income_by_month(user_id: int, month_name: str) -> list[dict]:
     )
 
 
+def get_income_total(user_id: int, start_date, end_date) -> float:
+    """Total income in [start_date, end_date)."""
+    row = _execute(
+        """SELECT COALESCE(SUM(amount), 0) FROM income
+           WHERE user_id = %s AND date >= %s AND date < %s""",
+        (user_id, start_date, end_date),
+        fetchone=True,
+    )
+    return float(row[0]) if row else 0.0
+
+
 def delete_income(income_id: int):
     """Delete an income entry."""
     _execute("DELETE FROM income WHERE id = %s", (income_id,))
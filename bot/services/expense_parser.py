@@ -0,0 +1,41 @@
+"""Turns a message into expense dicts using the backend chosen by PARSER_BACKEND.
+
+Every backend tries the rule-based fast path (fast_parser) first. What it
+cannot read goes to:
+- openai: the OpenAI API via ai_parser (default)
+- local:  the same client pointed at an OpenAI-compatible stand-in
+          (OPENAI_BASE_URL, e.g. `python -m benchmarks.fake_openai`), for
+          load tests without network access or paid calls
+- rules:  nowhere; the message counts as containing no expense
+"""
+
+from bot.config import PARSER_BACKEND
+from bot.services import ai_parser, fast_parser
+
+
+def uses_ai() -> bool:
+    return PARSER_BACKEND != "rules"
+
+
+def parse_expenses(user_text: str, dictionary: fast_parser.MerchantDictionary) -> list[dict]:
+    """Blocking parse used by the CLI. Returns [] for non-expense messages."""
+    data = fast_parser.parse_expenses(user_text, dictionary)
+    if data is not None:
+        return data
+    if not uses_ai():
+        return []
+    data = ai_parser.parse_expenses(user_text, dictionary.hints(user_text))
+    fast_parser.apply_learned(data, dictionary)
+    return data
+
+
+async def parse_expenses_async(user_text: str, dictionary: fast_parser.MerchantDictionary) -> list[dict]:
+    """parse_expenses() for the bot; AI calls never block the event loop."""
+    data = fast_parser.parse_expenses(user_text, dictionary)
+    if data is not None:
+        return data
+    if not uses_ai():
+        return []
+    data = await ai_parser.parse_expenses_async(user_text, dictionary.hints(user_text))
+    fast_parser.apply_learned(data, dictionary)
+    return data
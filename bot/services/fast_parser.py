@@ -0,0 +1,364 @@
+"""Deterministic fast-path expense parser.
+
+Handles the common shapes without an OpenAI round-trip:
+
+    biedronka 80
+    80 zł orlen paliwo
+    biedronka 80, apteka 35,50 wczoraj
+
+Each comma/semicolon/newline separated segment must hold exactly one amount,
+optionally a currency word and a relative day word (dziś, wczoraj,
+przedwczoraj), and words that resolve to a single subcategory through the
+MerchantDictionary, learned from the user's confirmed and corrected expenses
+plus a small table of built-in keywords. Anything else returns None and goes
+to ai_parser, whose output is then post-corrected with the same dictionary.
+"""
+
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from datetime import date, timedelta
+
+from bot.categories import CATEGORIES
+from bot.services import storage
+
+logger = logging.getLogger(__name__)
+
+FAST_PARSER_ENABLED = os.environ.get("FAST_PARSER_ENABLED", "1") != "0"
+# Share of a word's past confirmations one subcategory needs to be trusted
+MIN_SHARE = 0.8
+# Weight of a confirmation where the user corrected the suggested category
+CORRECTION_WEIGHT = 3
+MAX_SEGMENTS = 10
+
+_SEGMENT_SPLIT = re.compile(r"\s*(?:[;\n]|,(?!\d))\s*")
+_AMOUNT = re.compile(r"^(\d{1,7}(?:[.,]\d{1,2})?)(?:zł|zl|pln)?$", re.IGNORECASE)
+_WORD = re.compile(r"^[^\W\d_][^\W\d]*(?:[-'&.][^\W\d_]+)*\.?$")
+
+_CURRENCY_WORDS = {"zl", "zł", "pln", "zlotych", "zlote", "zloty", "zeta"}
+_FILLER_WORDS = {"za", "na", "w", "we", "z", "i"}
+_DAY_OFFSETS = {
+    "dzis": 0, "dzisiaj": 0, "today": 0,
+    "wczoraj": -1, "yesterday": -1,
+    "przedwczoraj": -2,
+}
+
+# Built-in category words and well-known merchants: folded word -> (category, subcategory)
+KEYWORDS = {
+    "biedronka": ("Jedzenie", "Jedzenie dom"),
+    "lidl": ("Jedzenie", "Jedzenie dom"),
+    "zabka": ("Jedzenie", "Jedzenie dom"),
+    "auchan": ("Jedzenie", "Jedzenie dom"),
+    "kaufland": ("Jedzenie", "Jedzenie dom"),
+    "carrefour": ("Jedzenie", "Jedzenie dom"),
+    "zakupy": ("Jedzenie", "Jedzenie dom"),
+    "restauracja": ("Jedzenie", "Jedzenie miasto"),
+    "pizza": ("Jedzenie", "Jedzenie miasto"),
+    "kebab": ("Jedzenie", "Jedzenie miasto"),
+    "alkohol": ("Jedzenie", "Alkohol"),
+    "piwo": ("Jedzenie", "Alkohol"),
+    "wino": ("Jedzenie", "Alkohol"),
+    "woda": ("Jedzenie", "Woda"),
+    "czynsz": ("Mieszkanie / dom", "Czynsz"),
+    "prad": ("Mieszkanie / dom", "Prąd"),
+    "paliwo": ("Transport", "Paliwo do auta"),
+    "benzyna": ("Transport", "Paliwo do auta"),
+    "tankowanie": ("Transport", "Paliwo do auta"),
+    "orlen": ("Transport", "Paliwo do auta"),
+    "taxi": ("Transport", "Taxi"),
+    "taksowka": ("Transport", "Taxi"),
+    "uber": ("Transport", "Taxi"),
+    "bolt": ("Transport", "Taxi"),
+    "pkp": ("Transport", "Bilet PKP/PKS"),
+    "pks": ("Transport", "Bilet PKP/PKS"),
+    "pociag": ("Transport", "Bilet PKP/PKS"),
+    "internet": ("Telekomunikacja", "Internet"),
+    "lekarz": ("Opieka zdrowotna", "Lekarz"),
+    "dentysta": ("Opieka zdrowotna", "Lekarz"),
+    "badania": ("Opieka zdrowotna", "Badania"),
+    "apteka": ("Opieka zdrowotna", "Lekarstwa"),
+    "leki": ("Opieka zdrowotna", "Lekarstwa"),
+    "lekarstwa": ("Opieka zdrowotna", "Lekarstwa"),
+    "suplementy": ("Opieka zdrowotna", "Suple"),
+    "buty": ("Ubranie", "Buty"),
+    "kosmetyki": ("Higiena", "Kosmetyki"),
+    "fryzjer": ("Higiena", "Fryzjer"),
+    "silownia": ("Rozrywka", "Siłownia / Basen"),
+    "basen": ("Rozrywka", "Siłownia / Basen"),
+    "kino": ("Rozrywka", "Kino / Teatr / Vod"),
+    "teatr": ("Rozrywka", "Kino / Teatr / Vod"),
+    "netflix": ("Rozrywka", "Kino / Teatr / Vod"),
+    "koncert": ("Rozrywka", "Koncerty"),
+    "ksiazka": ("Rozrywka", "Książki"),
+    "ksiazki": ("Rozrywka", "Książki"),
+    "prezent": ("Inne wydatki", "Prezenty"),
+    "prezenty": ("Inne wydatki", "Prezenty"),
+    "podatek": ("Inne wydatki", "Podatki"),
+    "weterynarz": ("Inne wydatki", "Zwierzęta"),
+}
+
+
+def fold(word: str) -> str:
+    """Lowercase and strip Polish diacritics, so "Żabka" and "zabka" match."""
+    word = word.casefold().replace("ł", "l")
+    return "".join(c for c in unicodedata.normalize("NFKD", word) if not unicodedata.combining(c))
+
+
+def _valid(category: str, subcategory: str) -> bool:
+    return subcategory in CATEGORIES.get(category, ())
+
+
+def _tokens(words: list[str]) -> list[str]:
+    return [w for w in words if len(w) >= 3 and w not in _FILLER_WORDS]
+
+
+def _confident(votes: Counter) -> tuple[str, str] | None:
+    if not votes:
+        return None
+    (best, count), = votes.most_common(1)
+    return best if count / sum(votes.values()) >= MIN_SHARE else None
+
+
+def _terms(description: str) -> list[tuple[str, bool]]:
+    """Index terms of a description: the whole folded phrase plus its words."""
+    words = [fold(w).strip(".,!?") for w in description.split()]
+    phrase = " ".join(w for w in words if w and w not in _FILLER_WORDS)
+    if not phrase:
+        return []
+    return [(phrase, True)] + [(token, False) for token in sorted(set(_tokens(words)))]
+
+
+class MerchantDictionary:
+    """Folded descriptions and their words -> weights of confirmed (category, subcategory).
+
+    Lookups are plain dict hits, one per word. Weights are counts of
+    confirmations; corrections add more (see learn()).
+    """
+
+    def __init__(self):
+        self.phrases: dict[str, Counter] = {}
+        self.tokens: dict[str, Counter] = {}
+
+    def __len__(self) -> int:
+        return len(self.phrases)
+
+    def apply(self, term: str, is_phrase: bool, category: str, subcategory: str, weight: float) -> None:
+        """Add weight (may be negative) to one term; entries at or below zero are dropped."""
+        index = self.phrases if is_phrase else self.tokens
+        votes = index.setdefault(term, Counter())
+        votes[(category, subcategory)] += weight
+        if votes[(category, subcategory)] <= 0:
+            del votes[(category, subcategory)]
+            if not votes:
+                del index[term]
+
+    def add(self, description: str, category: str, subcategory: str, count: float = 1) -> None:
+        if not _valid(category, subcategory):
+            return
+        for term, is_phrase in _terms(description):
+            self.apply(term, is_phrase, category, subcategory, count)
+
+    def learned(self, words: list[str]) -> tuple[str, str] | None:
+        """What the user's own history says about folded words, or None if unsure."""
+        words = [w for w in words if w not in _FILLER_WORDS]
+        phrase = self.phrases.get(" ".join(words))
+        if phrase:
+            return _confident(phrase)
+        votes = Counter()
+        for token in _tokens(words):
+            votes.update(self.tokens.get(token, {}))
+        return _confident(votes)
+
+    def lookup(self, words: list[str]) -> tuple[str, str] | None:
+        """Resolve folded words to (category, subcategory), or None if unsure.
+
+        A learned whole-description match wins, then built-in keywords (an
+        explicit "paliwo" beats whatever the merchant usually is), then the
+        learned votes of the individual words.
+        """
+        words = [w for w in words if w not in _FILLER_WORDS]
+        phrase = self.phrases.get(" ".join(words))
+        if phrase:
+            return _confident(phrase)
+
+        keyword_hits = {KEYWORDS[w] for w in words if w in KEYWORDS}
+        if len(keyword_hits) == 1:
+            return keyword_hits.pop()
+        if keyword_hits:
+            return None
+        return self.learned(words)
+
+    def hints(self, text: str, limit: int = 5) -> list[tuple[str, str, str]]:
+        """(word, category, subcategory) the user has confirmed for words in text."""
+        result = []
+        for raw in text.split():
+            word = fold(raw).strip(".,!?;:")
+            if len(word) < 3 or word in _FILLER_WORDS or any(h[0] == word for h in result):
+                continue
+            resolved = self.learned([word])
+            if resolved:
+                result.append((word, *resolved))
+                if len(result) >= limit:
+                    break
+        return result
+
+
+def parse_segment(segment: str, dictionary: MerchantDictionary, today: date) -> dict | None:
+    amount = None
+    offset = 0
+    description = []
+    lookup_words = []
+    for raw in segment.split():
+        match = _AMOUNT.match(raw)
+        if match:
+            if amount is not None:
+                return None
+            amount = float(match.group(1).replace(",", "."))
+            continue
+        word = fold(raw).rstrip(".")
+        if word in _CURRENCY_WORDS:
+            continue
+        if word in _DAY_OFFSETS:
+            offset = _DAY_OFFSETS[word]
+            continue
+        if not _WORD.match(raw):
+            return None
+        lookup_words.append(word)
+        if word not in _FILLER_WORDS:
+            description.append(raw)
+
+    if not amount or not description:
+        return None
+    resolved = dictionary.lookup(lookup_words)
+    if resolved is None:
+        return None
+    return {
+        "amount": amount,
+        "date": (today + timedelta(days=offset)).strftime("%Y-%m-%d"),
+        "category": resolved[0],
+        "subcategory": resolved[1],
+        "description": " ".join(description),
+    }
+
+
+def parse_expenses(text: str, dictionary: MerchantDictionary, today: date | None = None) -> list[dict] | None:
+    """Parse text into expense dicts like ai_parser.parse_expenses, or return
+    None when any part of it is not one of the simple forms."""
+    if not FAST_PARSER_ENABLED:
+        return None
+    today = today or date.today()
+    segments = [s for s in _SEGMENT_SPLIT.split(text.strip()) if s]
+    if not segments or len(segments) > MAX_SEGMENTS:
+        return None
+    expenses = []
+    for segment in segments:
+        expense = parse_segment(segment, dictionary, today)
+        if expense is None:
+            return None
+        expenses.append(expense)
+    return expenses
+
+
+# --- Per-user dictionaries ---
+#
+# The index lives in the SQLite state DB (storage.merchant_index), keyed by
+# Telegram user id. It is read into a MerchantDictionary once per process and
+# then kept in step by learn(), which writes both. An empty index is seeded
+# from the user's PostgreSQL expense history when there is one.
+
+_dictionaries: dict[int, MerchantDictionary] = {}
+_dictionaries_lock = threading.Lock()
+
+
+def build_dictionary(rows: list[dict]) -> MerchantDictionary:
+    """Build from database.get_description_categories() rows."""
+    dictionary = MerchantDictionary()
+    for row in rows:
+        dictionary.add(row["description"], row["category"], row["subcategory"], row["count"])
+    return dictionary
+
+
+def _history_weights(telegram_id: int) -> list[tuple[str, bool, str, str, float]]:
+    from bot.services import database
+
+    if not database.is_available():
+        return []
+    user_db_id = database.get_or_create_user(telegram_id)
+    deltas = []
+    for row in database.get_description_categories(user_db_id):
+        if _valid(row["category"], row["subcategory"]):
+            deltas += [(term, is_phrase, row["category"], row["subcategory"], row["count"])
+                       for term, is_phrase in _terms(row["description"])]
+    return deltas
+
+
+def get_dictionary(telegram_id: int) -> MerchantDictionary:
+    """The user's dictionary. Without any history only KEYWORDS apply."""
+    with _dictionaries_lock:
+        cached = _dictionaries.get(telegram_id)
+    if cached is not None:
+        return cached
+
+    dictionary = MerchantDictionary()
+    try:
+        rows = storage.get_merchant_index(telegram_id)
+        if not rows:
+            rows = _history_weights(telegram_id)
+            storage.add_merchant_weights(telegram_id, rows)
+        for row in rows:
+            dictionary.apply(*row)
+    except Exception as e:
+        logger.warning(f"Could not load the merchant index: {e}")
+    with _dictionaries_lock:
+        return _dictionaries.setdefault(telegram_id, dictionary)
+
+
+def learn(telegram_id: int, expenses: list[dict], suggested: list | None = None) -> None:
+    """Record confirmed expenses in the user's index.
+
+    suggested holds the (category, subcategory) the bot proposed for each
+    expense. Where the user changed it, the confirmed pair gets
+    CORRECTION_WEIGHT in total and the rejected one loses as much.
+    """
+    deltas = []
+    for i, expense in enumerate(expenses):
+        final = (expense["category"], expense["subcategory"])
+        if not _valid(*final):
+            continue
+        terms = _terms(expense["description"])
+        weight = 1
+        if suggested and i < len(suggested) and tuple(suggested[i]) != final:
+            weight = CORRECTION_WEIGHT
+            deltas += [(term, is_phrase, *suggested[i], -CORRECTION_WEIGHT) for term, is_phrase in terms]
+        deltas += [(term, is_phrase, *final, weight) for term, is_phrase in terms]
+
+    try:
+        storage.add_merchant_weights(telegram_id, deltas)
+    except Exception as e:
+        logger.warning(f"Could not update the merchant index: {e}")
+    with _dictionaries_lock:
+        cached = _dictionaries.get(telegram_id)
+        if cached is not None:
+            for delta in deltas:
+                cached.apply(*delta)
+
+
+def apply_learned(expenses: list[dict], dictionary: MerchantDictionary) -> int:
+    """Overwrite LLM categories the user's history confidently disagrees with.
+    Returns how many expenses were changed."""
+    changed = 0
+    for expense in expenses:
+        words = [fold(w).strip(".,!?") for w in str(expense.get("description", "")).split()]
+        resolved = dictionary.learned(words)
+        if resolved and resolved != (expense.get("category"), expense.get("subcategory")):
+            expense["category"], expense["subcategory"] = resolved
+            changed += 1
+    return changed
+
+
+def reset_dictionaries() -> None:
+    with _dictionaries_lock:
+        _dictionaries.clear()
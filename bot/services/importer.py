@@ -0,0 +1,198 @@
+"""Streaming import of expenses from Google Sheets into PostgreSQL.
+
+The sheet is read in ranged pages and each page is written with one
+multi-row INSERT. Rows already in the database (same content hash) are
+skipped, so re-running an import adds nothing. Progress is checkpointed in
+the local state DB after every page, with the occurrence counts of the
+hashes that page changed; an interrupted import resumes from the next
+unread row. Reading stops at the first page with no values at all.
+"""
+
+import hashlib
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from bot.services import database, sheets, storage
+
+logger = logging.getLogger(__name__)
+
+IMPORT_PAGE_SIZE = int(os.environ.get("IMPORT_PAGE_SIZE", "500"))
+
+# How many skipped rows to report individually
+MAX_SKIPPED_SAMPLES = 20
+
+_CENT = Decimal("0.01")
+_MAX_AMOUNT = Decimal("1e8")  # expenses.amount is DECIMAL(10, 2)
+
+
+class RowError(ValueError):
+    """A sheet row that cannot be imported; reason is a short machine code."""
+
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(detail or reason)
+        self.reason = reason
+
+
+def checkpoint_name(user_id: int) -> str:
+    return f"sheets_import:{user_id}"
+
+
+def content_hash(expense: dict) -> str:
+    """Hash of an expense's content. Must match migrations/006 (md5 over
+    date|amount|category|subcategory|description, date as YYYY-MM-DD,
+    amount with 2 decimals)."""
+    amount = Decimal(str(expense["amount"])).quantize(_CENT, rounding=ROUND_HALF_UP)
+    key = "|".join([
+        expense["date"], str(amount),
+        expense["category"], expense["subcategory"], expense["description"],
+    ])
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+def parse_row(row: list[str]) -> tuple[dict, str]:
+    """Parse a sheet row into (expense_dict, original_text). Raises RowError."""
+    if not any(cell.strip() for cell in row):
+        raise RowError("empty")
+    if len(row) < 5:
+        raise RowError("too_short", f"{len(row)} columns")
+
+    date_str = row[0].strip()
+    try:
+        # Canonical form, so "2024-1-5" hashes like the stored 2024-01-05
+        date_str = datetime.strptime(date_str, "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        raise RowError("bad_date", date_str)
+
+    raw_amount = row[1].replace("\xa0", "").replace(" ", "").replace(",", ".")
+    try:
+        amount = Decimal(raw_amount).quantize(_CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise RowError("bad_amount", row[1])
+    if not amount.is_finite() or abs(amount) >= _MAX_AMOUNT:
+        raise RowError("bad_amount", row[1])
+
+    category = row[2].strip()
+    if not category:
+        raise RowError("missing_category")
+
+    expense = {
+        "amount": float(amount),
+        "date": date_str,
+        "category": category,
+        "subcategory": row[3].strip(),
+        "description": row[4].strip(),
+    }
+    original_text = row[5].strip() if len(row) > 5 else ""
+    return expense, original_text
+
+
+def _is_header(row: list[str]) -> bool:
+    return bool(row) and row[0].strip().lower() in ("date", "data")
+
+
+def import_from_sheets(
+    user_id: int,
+    page_size: int | None = None,
+    resume: bool = True,
+    progress=None,
+) -> dict:
+    """Import the expense sheet for user_id page by page.
+
+    progress, if given, is called with the running result after each page.
+    Returns {"imported", "duplicates", "skipped", "skipped_rows", "rows",
+    "pages", "elapsed", "rows_per_sec", "resumed_from"} where "skipped" maps
+    reason -> count and "skipped_rows" holds up to MAX_SKIPPED_SAMPLES
+    (sheet_row, reason, detail) samples.
+    """
+    page_size = page_size or IMPORT_PAGE_SIZE
+    name = checkpoint_name(user_id)
+    checkpoint = storage.get_checkpoint(name) if resume else None
+    if checkpoint is None:
+        storage.delete_checkpoint(name)
+        checkpoint = {"next_row": 1, "imported": 0, "duplicates": 0, "skipped": {}, "rows": 0}
+    else:
+        logger.info(f"Resuming sheet import at row {checkpoint['next_row']}")
+
+    # Occurrences of each content hash so far (older checkpoints kept them under "seen")
+    seen = Counter(checkpoint.get("seen", {}))
+    seen.update(storage.get_checkpoint_counts(name))
+    skipped = Counter(checkpoint["skipped"])
+    result = {
+        "imported": checkpoint["imported"],
+        "duplicates": checkpoint["duplicates"],
+        "skipped": skipped,
+        "skipped_rows": [],
+        "rows": checkpoint["rows"],
+        "pages": 0,
+        "elapsed": 0.0,
+        "rows_per_sec": 0.0,
+        "resumed_from": checkpoint["next_row"] if checkpoint["next_row"] > 1 else None,
+    }
+
+    def skip(sheet_row: int, reason: str, detail: str = "") -> None:
+        skipped[reason] += 1
+        if len(result["skipped_rows"]) < MAX_SKIPPED_SAMPLES:
+            result["skipped_rows"].append((sheet_row, reason, detail))
+
+    start = time.monotonic()
+    rows_this_run = 0
+    next_row = checkpoint["next_row"]
+    while True:
+        page = sheets.get_rows(next_row, next_row + page_size - 1)
+        if not page:
+            break
+
+        batch = []
+        changed = set()
+        for offset, row in enumerate(page):
+            sheet_row = next_row + offset
+            if sheet_row == 1 and _is_header(row):
+                continue
+            try:
+                expense, original_text = parse_row(row)
+            except RowError as e:
+                if e.reason != "empty":
+                    skip(sheet_row, e.reason, str(e))
+                continue
+            h = content_hash(expense)
+            seen[h] += 1
+            changed.add(h)
+            batch.append((h, seen[h], expense, original_text, sheet_row))
+
+        duplicates = database.import_sheet_expenses(user_id, batch)
+        for sheet_row in duplicates:
+            skip(sheet_row, "duplicate")
+        result["imported"] += len(batch) - len(duplicates)
+        result["duplicates"] += len(duplicates)
+        result["rows"] += len(page)
+        result["pages"] += 1
+        rows_this_run += len(page)
+        next_row += page_size
+
+        storage.save_checkpoint(name, {
+            "next_row": next_row,
+            "imported": result["imported"],
+            "duplicates": result["duplicates"],
+            "skipped": dict(skipped),
+            "rows": result["rows"],
+        }, counts={h: seen[h] for h in changed})
+        result["elapsed"] = time.monotonic() - start
+        if result["elapsed"] > 0:
+            result["rows_per_sec"] = rows_this_run / result["elapsed"]
+        if progress is not None:
+            progress(result)
+
+    storage.delete_checkpoint(name)
+    result["skipped"] = dict(skipped)
+    result["elapsed"] = time.monotonic() - start
+    if result["elapsed"] > 0:
+        result["rows_per_sec"] = rows_this_run / result["elapsed"]
+    logger.info(
+        f"Sheet import done: {result['imported']} imported, {result['duplicates']} duplicates, "
+        f"{sum(skipped.values()) - result['duplicates']} invalid, {result['rows_per_sec']:.0f} rows/s"
+    )
+    return result
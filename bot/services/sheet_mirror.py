@@ -0,0 +1,151 @@
+"""Local mirror of the expense sheet for the Sheets-only mode (no DATABASE_URL).
+
+Summaries are served from the sheet_rows table in the state DB (indexed by
+month) instead of downloading and parsing the whole sheet each time:
+- refresh() fetches only the rows past the last mirrored one, in ranged
+  pages, re-reading that last row to check the sheet did not change above it
+  (if it did, the mirror is rebuilt from one full read);
+- our own appends are added to the mirror as they are written, and deleting
+  rows (undo) drops the mirror from the first deleted row on, so the next
+  refresh re-reads only the tail;
+- every SHEET_MIRROR_MAX_AGE_HOURS the mirror is rebuilt anyway, to pick up
+  hand edits in the middle of the sheet.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from bot.config import SPREADSHEET_ID, SPREADSHEET_NAME, SHEET_TAB_NAME
+from bot.services import storage
+
+logger = logging.getLogger(__name__)
+
+# Full re-read after this many hours; 0 reads the whole sheet on every refresh
+SHEET_MIRROR_MAX_AGE_HOURS = float(os.environ.get("SHEET_MIRROR_MAX_AGE_HOURS", "24"))
+
+_PAGE_ROWS = 500
+_STATE_KEY = "sheets:mirror"
+_SHEET = f"{SPREADSHEET_ID or SPREADSHEET_NAME}/{SHEET_TAB_NAME}"
+
+# Serializes refreshes with the bookkeeping of our own writes
+_lock = threading.Lock()
+
+
+def _parse_amount(value) -> float | None:
+    try:
+        return float(str(value).replace("\xa0", "").replace(" ", "").replace(",", "."))
+    except ValueError:
+        return None
+
+
+def _mirror_row(row_index: int, row: list) -> tuple:
+    """(row_index, date, amount, category, subcategory, description, original_text, month)."""
+    cells = [str(c) for c in row] + [""] * (8 - len(row))
+    # Rows without the month column never count towards a summary
+    month = cells[6].strip() if len(row) >= 7 else None
+    return (row_index, cells[0], _parse_amount(cells[1]), cells[2], cells[3], cells[4], cells[5], month)
+
+
+def _fingerprint(row: list) -> tuple:
+    from bot.services.sheets import _text_fingerprint
+
+    return _text_fingerprint(row[2:6])
+
+
+def _stored_fingerprint(row_index: int) -> tuple:
+    from bot.services.sheets import _text_fingerprint
+
+    return _text_fingerprint(storage.get_sheet_row(row_index) or ())
+
+
+def _state() -> dict | None:
+    state = storage.get_checkpoint(_STATE_KEY)
+    if state is None or state.get("sheet") != _SHEET:
+        return None
+    return state
+
+
+def _rebuild() -> None:
+    from bot.services import sheets
+
+    rows = sheets.get_all_rows()
+    storage.add_sheet_rows([_mirror_row(i, row) for i, row in enumerate(rows, start=1)], replace=True)
+    storage.save_checkpoint(_STATE_KEY, {"sheet": _SHEET, "rows": len(rows), "full_at": time.time()})
+    logger.info(f"Sheet mirror rebuilt: {len(rows)} rows")
+
+
+def _catch_up(state: dict) -> bool:
+    """Mirror the rows past state["rows"]. False if the sheet changed above them."""
+    from bot.services import sheets
+
+    known = state["rows"]
+    start = max(known, 1)
+    new_rows = []
+    while True:
+        page = sheets.get_rows(start, start + _PAGE_ROWS - 1)
+        if start == known:
+            # The page starts with the last row we have; it must still be there
+            if not page or _fingerprint(page[0]) != _stored_fingerprint(known):
+                return False
+            new_rows.extend(_mirror_row(start + i, row) for i, row in enumerate(page[1:], start=1))
+        else:
+            new_rows.extend(_mirror_row(start + i, row) for i, row in enumerate(page))
+        if len(page) < _PAGE_ROWS:
+            break
+        start += _PAGE_ROWS
+
+    if new_rows:
+        storage.add_sheet_rows(new_rows)
+        storage.save_checkpoint(_STATE_KEY, {**state, "rows": new_rows[-1][0]})
+        logger.info(f"Sheet mirror: {len(new_rows)} new row(s)")
+    return True
+
+
+def refresh() -> None:
+    """Bring the mirror up to date with the sheet."""
+    with _lock:
+        state = _state()
+        max_age = SHEET_MIRROR_MAX_AGE_HOURS * 3600
+        if state is None or time.time() - state["full_at"] >= max_age:
+            _rebuild()
+        elif not _catch_up(state):
+            logger.info("Sheet changed above the mirrored rows; rebuilding the mirror")
+            _rebuild()
+
+
+def get_month_totals(month_name: str) -> list[dict]:
+    """Refresh, then return the month's (category, subcategory, total, count)
+    rows for database.fold_category_totals()."""
+    refresh()
+    return storage.get_sheet_month_totals(month_name)
+
+
+def record_append(rows: list[list], row_indices: list[int]) -> None:
+    """Add rows we just appended to the sheet, if they directly follow the
+    mirrored ones; otherwise the next refresh reads them."""
+    try:
+        with _lock:
+            state = _state()
+            if state is None or not row_indices or row_indices[0] != state["rows"] + 1:
+                return
+            storage.add_sheet_rows([_mirror_row(i, row) for i, row in zip(row_indices, rows)])
+            storage.save_checkpoint(_STATE_KEY, {**state, "rows": row_indices[-1]})
+    except sqlite3.Error as e:
+        logger.warning(f"Could not update the sheet mirror: {e}")
+
+
+def record_delete(row_indices: list[int]) -> None:
+    """Drop the mirror from the first deleted row on; rows below it moved up."""
+    try:
+        with _lock:
+            state = _state()
+            if state is None or not row_indices or min(row_indices) > state["rows"]:
+                return
+            first = min(row_indices)
+            storage.truncate_sheet_rows(first)
+            storage.save_checkpoint(_STATE_KEY, {**state, "rows": first - 1})
+    except sqlite3.Error as e:
+        logger.warning(f"Could not update the sheet mirror: {e}")
@@ -1,70 +1,382 @@
-"""Google Sheets read/write operations."""
+"""Google Sheets read/write operations.
 
+Handles are resolved once per process and reused:
+- the spreadsheet is opened by ID, either SPREADSHEET_ID or the ID found by
+  the first by-name Drive search and remembered in the state DB;
+- one metadata fetch loads every worksheet, and the income tab is cached
+  once created;
+- a 404 drops the handles (and the remembered ID), and the call is retried once.
+
+All calls share gspread's single HTTP session, so connections and the OAuth
+token are reused. The token is also kept in the state DB, so short CLI runs
+skip the token exchange. Each public call logs how many API requests it
+made; request_stats() has the totals.
+"""
+
+import functools
 import logging
-from datetime import datetime
-from bot.config import gc, SPREADSHEET_NAME, SHEET_TAB_NAME, INCOME_SHEET_TAB_NAME, MONTHS_MAPPING
+import re
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from bot.config import gc, SPREADSHEET_ID, SPREADSHEET_NAME, SHEET_TAB_NAME, INCOME_SHEET_TAB_NAME, MONTHS_MAPPING
+from bot.services import storage
 
 logger = logging.getLogger(__name__)
 
+_spreadsheet = None
+_worksheets: dict = {}
+_hooked_session = None
+_saved_token = None
+
+# How far past the expected tail to look when recovering an interrupted append
+# whose sheet length before the append was not recorded
+_RECOVERY_TAIL_SLACK = 200
+_SERIAL_EPOCH = date(1899, 12, 30)  # Day 0 of Sheets' date serial numbers
+
+_RANGE_START_ROW = re.compile(r"\$?[A-Z]+\$?(\d+)")
+
+_SPREADSHEET_ID_KEY = f"sheets:spreadsheet_id:{SPREADSHEET_NAME}"
+_TOKEN_KEY = "sheets:oauth_token"
+
+# Requests made by the current thread's outermost public call
+_calls = threading.local()
+_stats_lock = threading.Lock()
+_request_counts: dict[str, int] = {}
+
+
+def _on_response(response, *args, **kwargs):
+    """requests response hook on gspread's session: counts every API request."""
+    _calls.requests = getattr(_calls, "requests", 0) + 1
+    _save_token()
+
+
+def _load_state(key: str) -> dict | None:
+    try:
+        return storage.get_checkpoint(key)
+    except sqlite3.Error as e:
+        logger.warning(f"Could not read {key}: {e}")
+        return None
+
+
+def _save_state(key: str, data: dict | None) -> None:
+    try:
+        if data is None:
+            storage.delete_checkpoint(key)
+        else:
+            storage.save_checkpoint(key, data)
+    except sqlite3.Error as e:
+        logger.warning(f"Could not store {key}: {e}")
+
+
+def _credentials():
+    return getattr(gc.http_client, "auth", None)
+
+
+def _restore_token() -> None:
+    """Reuse a still-valid access token from an earlier run."""
+    creds = _credentials()
+    cached = _load_state(_TOKEN_KEY)
+    if creds is None or not cached or cached.get("account") != getattr(creds, "service_account_email", None):
+        return
+    creds.token = cached["token"]
+    creds.expiry = datetime.fromisoformat(cached["expiry"])
+
+
+def _save_token() -> None:
+    global _saved_token
+    creds = _credentials()
+    token = getattr(creds, "token", None)
+    if not isinstance(token, str) or token == _saved_token:
+        return
+    _saved_token = token
+    if getattr(creds, "expiry", None) is not None:
+        _save_state(_TOKEN_KEY, {
+            "account": creds.service_account_email,
+            "token": token,
+            "expiry": creds.expiry.isoformat(),
+        })
+
+
+def _prepare_session() -> None:
+    global _hooked_session
+    session = gc.http_client.session
+    if session is _hooked_session:
+        return
+    _hooked_session = session
+    session.hooks["response"].append(_on_response)
+    _restore_token()
+
+
+def _get_spreadsheet():
+    """Open the spreadsheet once (by ID when known) and load its worksheets."""
+    global _spreadsheet
+    if _spreadsheet is None:
+        _prepare_session()
+        known = _load_state(_SPREADSHEET_ID_KEY)
+        spreadsheet_id = SPREADSHEET_ID or (known or {}).get("id")
+        if spreadsheet_id:
+            spreadsheet = gc.open_by_key(spreadsheet_id)
+        else:
+            spreadsheet = gc.open(SPREADSHEET_NAME)  # Drive search by name
+            if isinstance(spreadsheet.id, str):
+                _save_state(_SPREADSHEET_ID_KEY, {"id": spreadsheet.id})
+        for ws in spreadsheet.worksheets():
+            _worksheets[ws.title] = ws
+        _spreadsheet = spreadsheet
+    return _spreadsheet
+
+
+def _get_worksheet(title: str = SHEET_TAB_NAME):
+    """Return a cached worksheet handle."""
+    if title not in _worksheets:
+        spreadsheet = _get_spreadsheet()
+        if title not in _worksheets:
+            _worksheets[title] = spreadsheet.worksheet(title)
+    return _worksheets[title]
+
+
+def reset_handles(forget_id: bool = False) -> None:
+    """Forget cached spreadsheet/worksheet handles (and the remembered ID)."""
+    global _spreadsheet
+    _spreadsheet = None
+    _worksheets.clear()
+    if forget_id:
+        _save_state(_SPREADSHEET_ID_KEY, None)
+
+
+def _is_not_found(e: Exception) -> bool:
+    from gspread.exceptions import APIError, SpreadsheetNotFound, WorksheetNotFound
+
+    if isinstance(e, (SpreadsheetNotFound, WorksheetNotFound)):
+        return True
+    return isinstance(e, APIError) and e.code == 404
+
+
+def _api_call(func=None, *, retry: bool = True):
+    """Log the API requests a public call makes. On 404, reopen the handles
+    and, unless retry=False (calls that are not safe to repeat), retry once."""
+    if func is None:
+        return functools.partial(_api_call, retry=retry)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        outermost = not getattr(_calls, "depth", 0)
+        if outermost:
+            _calls.requests = 0
+        _calls.depth = getattr(_calls, "depth", 0) + 1
+        try:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not outermost or not _is_not_found(e):
+                    raise
+                logger.warning(f"Sheets {func.__name__}: {e!r}; reopening the spreadsheet")
+                reset_handles(forget_id=True)
+                if not retry:
+                    raise
+                return func(*args, **kwargs)
+        finally:
+            _calls.depth -= 1
+            if outermost:
+                requests = _calls.requests
+                with _stats_lock:
+                    _request_counts[func.__name__] = _request_counts.get(func.__name__, 0) + requests
+                logger.info(f"Sheets {func.__name__}: {requests} API request(s)")
+    return wrapper
+
+
+def request_stats() -> dict[str, int]:
+    """API requests made by each public function in this process."""
+    with _stats_lock:
+        return dict(_request_counts)
+
 
+def build_expense_row(data: dict, original_text: str) -> list:
+    """Build a sheet row for one expense."""
+    expense_date_obj = datetime.strptime(data["date"], "%Y-%m-%d")
+    return [
+        data["date"],
+        str(data["amount"]).replace(".", ","),
+        data["category"],
+        data["subcategory"],
+        data["description"],
+        original_text,
+        MONTHS_MAPPING[expense_date_obj.month],
+        expense_date_obj.day,
+    ]
+
+
+def _row_indices_from_response(response: dict, count: int) -> list[int]:
+    """Read the appended row numbers from the API's updatedRange.
+
+    e.g. "'Bot_Data'!A101:H103" -> [101, 102, 103]
+    """
+    updated_range = response["updates"]["updatedRange"]
+    cells = updated_range.rsplit("!", 1)[-1]
+    match = _RANGE_START_ROW.match(cells)
+    if match is None:
+        raise ValueError(f"Unexpected updatedRange: {updated_range!r}")
+    start = int(match.group(1))
+    return list(range(start, start + count))
+
+
+@_api_call
+def append_expense_rows(rows: list[list]) -> list[int]:
+    """Append rows in a single API call. Returns their row indices."""
+    if not rows:
+        return []
+    from bot.services import sheet_mirror
+
+    worksheet = _get_worksheet()
+    response = worksheet.append_rows(rows, value_input_option="USER_ENTERED")
+    row_indices = _row_indices_from_response(response, len(rows))
+    sheet_mirror.record_append(rows, row_indices)
+    return row_indices
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """True for quota errors (429): the request was rejected, nothing was written."""
+    from gspread.exceptions import APIError  # Deferred: importing gspread takes ~0.2 s
+
+    return isinstance(e, APIError) and e.code == 429
+
+
+def is_ambiguous_write_error(e: Exception) -> bool:
+    """True for errors after which a write may still have been applied:
+    server errors (5xx), timeouts and dropped connections."""
+    from gspread.exceptions import APIError
+    from requests.exceptions import ConnectionError, Timeout
+
+    if isinstance(e, APIError):
+        return e.code >= 500
+    return isinstance(e, (TimeoutError, Timeout, ConnectionError))
+
+
+def _text_fingerprint(cells) -> tuple:
+    """Category, subcategory, description, original text — columns the sheet
+    stores verbatim (dates and amounts may be reformatted by USER_ENTERED)."""
+    cells = list(cells) + [""] * 4
+    return tuple(str(c).strip() for c in cells[:4])
+
+
+def _cell_date(value) -> str:
+    """A date cell as YYYY-MM-DD, from an unformatted serial number or text."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (_SERIAL_EPOCH + timedelta(days=int(value))).isoformat()
+    text = str(value).strip()
+    try:
+        return datetime.strptime(text, "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        return text
+
+
+def _cell_amount(value) -> str:
+    """An amount cell with two decimals: 12.5, "12,5" and "12,50" all give "12.50"."""
+    text = str(value).replace("\xa0", "").replace(" ", "").replace(",", ".")
+    try:
+        return str(Decimal(text).quantize(Decimal("0.01")))
+    except InvalidOperation:
+        return text
+
+
+def _row_fingerprint(cells) -> tuple:
+    """Date, amount (normalized) and the text columns of a row's A:F cells."""
+    cells = list(cells) + [""] * 2
+    return (_cell_date(cells[0]), _cell_amount(cells[1])) + _text_fingerprint(cells[2:6])
+
+
+@_api_call
+def sheet_length() -> int:
+    """The last row with a value in column A."""
+    return len(_get_worksheet().col_values(1))
+
+
+@_api_call
+def find_appended_rows(rows: list[list], after_row: int | None = None) -> list[int] | None:
+    """Locate rows written by an interrupted append near the end of the sheet.
+
+    after_row is the sheet_length() recorded before the append; only rows
+    past it are searched, so an identical earlier row (a recurring expense)
+    is never taken for the append. Returns their row indices, or None if
+    they are not in the sheet.
+    """
+    if not rows:
+        return []
+    worksheet = _get_worksheet()
+    last_row = len(worksheet.col_values(1))
+    if after_row is None:
+        after_row = last_row - len(rows) - _RECOVERY_TAIL_SLACK
+    first_row = max(1, after_row + 1)
+    if last_row - first_row + 1 < len(rows):
+        return None
+    # Unformatted: dates as serial numbers and amounts as numbers, whatever the sheet's locale
+    window = [_row_fingerprint(r) for r in worksheet.get(
+        f"A{first_row}:F{last_row}", value_render_option="UNFORMATTED_VALUE")]
+    wanted = [_row_fingerprint(r[:6]) for r in rows]
+
+    # Newest match first — the interrupted append is the latest one
+    for offset in range(len(window) - len(wanted), -1, -1):
+        if window[offset:offset + len(wanted)] == wanted:
+            start = first_row + offset
+            return list(range(start, start + len(wanted)))
+    return None
+
+
+@_api_call
 def save_expenses_to_sheet(expenses: list[dict], original_text: str) -> list[int]:
     """Append expenses to Google Sheets. Returns list of row indices."""
-    sh = gc.open(SPREADSHEET_NAME)
-    worksheet = sh.worksheet(SHEET_TAB_NAME)
-    saved_row_indices: list[int] = []
-
-    for data in expenses:
-        expense_date_obj = datetime.strptime(data["date"], "%Y-%m-%d")
-        expense_month_name = MONTHS_MAPPING[expense_date_obj.month]
-        expense_day_number = expense_date_obj.day
-        amount_str = str(data["amount"]).replace(".", ",")
-
-        row_to_append = [
-            data["date"],
-            amount_str,
-            data["category"],
-            data["subcategory"],
-            data["description"],
-            original_text,
-            expense_month_name,
-            expense_day_number,
-        ]
-        worksheet.append_row(row_to_append, value_input_option="USER_ENTERED")
-        saved_row_indices.append(len(worksheet.get_all_values()))
-
-    return saved_row_indices
+    return append_expense_rows([build_expense_row(e, original_text) for e in expenses])
 
 
+@_api_call(retry=False)
 def delete_rows(row_indices: list[int]) -> None:
     """Delete rows by indices (in reverse order to preserve indices)."""
-    sh = gc.open(SPREADSHEET_NAME)
-    worksheet = sh.worksheet(SHEET_TAB_NAME)
-    for row_idx in sorted(row_indices, reverse=True):
-        worksheet.delete_rows(row_idx)
+    from bot.services import sheet_mirror
+
+    worksheet = _get_worksheet()
+    try:
+        for row_idx in sorted(row_indices, reverse=True):
+            worksheet.delete_rows(row_idx)
+    finally:
+        # Even a partial delete has shifted rows
+        sheet_mirror.record_delete(row_indices)
 
 
+@_api_call
 def get_all_rows() -> list[list[str]]:
     """Fetch all rows from the sheet."""
-    sh = gc.open(SPREADSHEET_NAME)
-    worksheet = sh.worksheet(SHEET_TAB_NAME)
-    return worksheet.get_all_values()
+    return _get_worksheet().get_all_values()
+
+
+@_api_call
+def get_rows(start_row: int, end_row: int) -> list[list[str]]:
+    """Fetch one ranged page (A:H, 1-based inclusive rows) of the sheet.
+
+    Blank rows inside the range come back as []; trailing blank rows are
+    omitted by the API.
+    """
+    return list(_get_worksheet().get(f"A{start_row}:H{end_row}"))
 
 
 def _ensure_income_worksheet(sh):
     """Return the income worksheet, creating it with headers if it doesn't exist."""
-    try:
-        return sh.worksheet(INCOME_SHEET_TAB_NAME)
-    except Exception:
-        ws = sh.add_worksheet(title=INCOME_SHEET_TAB_NAME, rows=1000, cols=6)
-        ws.append_row(["data", "kwota", "kategoria", "opis", "miesiac", "dzien"],
-                      value_input_option="USER_ENTERED")
+    ws = _worksheets.get(INCOME_SHEET_TAB_NAME)
+    if ws is not None:
         return ws
+    # Every existing tab was loaded with the spreadsheet, so this one is missing
+    ws = sh.add_worksheet(title=INCOME_SHEET_TAB_NAME, rows=1000, cols=6)
+    ws.append_row(["data", "kwota", "kategoria", "opis", "miesiac", "dzien"],
+                  value_input_option="USER_ENTERED")
+    _worksheets[INCOME_SHEET_TAB_NAME] = ws
+    return ws
 
 
+@_api_call
 def save_income_to_sheet(income_data: dict) -> None:
     """Append an income entry to the income sheet."""
-    sh = gc.open(SPREADSHEET_NAME)
-    worksheet = _ensure_income_worksheet(sh)
+    worksheet = _ensure_income_worksheet(_get_spreadsheet())
 
     income_date_obj = datetime.strptime(income_data["date"], "%Y-%m-%d")
     month_name = MONTHS_MAPPING[income_date_obj.month]
@@ -1,48 +1,100 @@
 """Persistent state storage using SQLite for pending expenses and undo history.
 
-Survives bot restarts on Railway. Auto-cleans expired pending expenses.
+Survives bot restarts on Railway. Also holds the AI parse cache (see
+ai_parser), bounded by TTL and size, the per-user merchant -> category index
+(see fast_parser) and the local mirror of the expense sheet (see
+sheet_mirror). sweep_expired() deletes rows past their table's TTL (pending
+entries, undo history, parse cache) and keeps the file compact.
+
+Each thread keeps one long-lived connection (WAL, synchronous=NORMAL, busy
+timeout), so sqlite3's per-connection statement cache is reused instead of
+every call opening the file and preparing its query again. Writes run in
+``with conn:`` blocks: committed on success, rolled back on error.
+``storage.aio`` has awaitable versions of the functions.
 """
 
 import json
 import sqlite3
+import threading
 import time
 import os
 import logging
+from collections import OrderedDict
+
+from bot.utils.aio import AsyncFacade
 
 logger = logging.getLogger(__name__)
 
 DB_PATH = os.environ.get("STATE_DB_PATH", "state.db")
 PENDING_TTL_SECONDS = 3600  # 1 hour
-
-_conn_cache: sqlite3.Connection | None = None
+# How long /undo can take back the last save
+LAST_SAVED_TTL_SECONDS = int(os.environ.get("LAST_SAVED_TTL_SECONDS", str(7 * 86400)))
+PARSE_CACHE_TTL_SECONDS = int(os.environ.get("PARSE_CACHE_TTL_SECONDS", str(30 * 86400)))
+# Least recently used entries beyond this many are evicted; 0 disables the cache
+PARSE_CACHE_MAX_ENTRIES = int(os.environ.get("PARSE_CACHE_MAX_ENTRIES", "2000"))
+# Decoded pending expenses/income kept in memory; 0 disables the cache
+PENDING_CACHE_MAX_ENTRIES = int(os.environ.get("PENDING_CACHE_MAX_ENTRIES", "256"))
+# How long a write waits for another connection's lock before "database is locked"
+STATE_DB_BUSY_TIMEOUT_MS = int(os.environ.get("STATE_DB_BUSY_TIMEOUT_MS", "5000"))
+# Minimum time between VACUUMs run by sweep_expired()
+STATE_DB_VACUUM_HOURS = float(os.environ.get("STATE_DB_VACUUM_HOURS", "24"))
+
+_local = threading.local()
+_generation = 0  # Bumped by _init_db(); threads then reopen their connection
+_memory_conn: sqlite3.Connection | None = None
+# (table, id) -> (data, version) of pending entries, least recently used first
+_pending_cache: OrderedDict[tuple[str, str], tuple[dict, int]] = OrderedDict()
+_pending_lock = threading.RLock()
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # The shared in-memory connection is used from whichever thread calls
+    conn = sqlite3.connect(path, timeout=STATE_DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=path != ":memory:")
+    if path != ":memory:":
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Under WAL, NORMAL only risks the last commits on an OS crash or power loss
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
 
 
 def _get_conn() -> sqlite3.Connection:
-    global _conn_cache
-    # For in-memory DBs, reuse the same connection (new connection = new empty DB)
+    """The calling thread's connection to DB_PATH, opened on first use."""
+    global _memory_conn
+    # For in-memory DBs, all threads share one connection (new connection = new empty DB)
     if DB_PATH == ":memory:":
-        if _conn_cache is None:
-            _conn_cache = sqlite3.connect(":memory:")
-        return _conn_cache
-    return sqlite3.connect(DB_PATH)
-
-
-def _close_conn(conn: sqlite3.Connection) -> None:
-    """Close connection unless it's a cached in-memory connection."""
-    if conn is not _conn_cache:
+        if _memory_conn is None:
+            _memory_conn = _connect(DB_PATH)
+        return _memory_conn
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.key != (DB_PATH, _generation):
+        if conn is not None:
+            conn.close()
+        conn = _connect(DB_PATH)
+        _local.conn, _local.key = conn, (DB_PATH, _generation)
+    return conn
+
+
+def close() -> None:
+    """Close the calling thread's connection; the next call reopens it."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
         conn.close()
+        _local.conn = None
 
 
 def _init_db():
-    global _conn_cache
-    _conn_cache = None  # Reset cached connection
+    global _generation, _memory_conn
+    _generation += 1
+    _memory_conn = None  # Reset the shared in-memory database
+    _pending_cache.clear()
     conn = _get_conn()
     conn.executescript("""
         CREATE TABLE IF NOT EXISTS pending_expenses (
             expense_id TEXT PRIMARY KEY,
             user_id INTEGER NOT NULL,
             data_json TEXT NOT NULL,
-            created_at REAL NOT NULL
+            created_at REAL NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0
         );
         CREATE TABLE IF NOT EXISTS last_saved (
             user_id INTEGER PRIMARY KEY,
@@ -53,66 +105,239 @@ def _init_db():
             income_id TEXT PRIMARY KEY,
             user_id INTEGER NOT NULL,
             data_json TEXT NOT NULL,
-            created_at REAL NOT NULL
+            created_at REAL NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS checkpoints (
+            name TEXT PRIMARY KEY,
+            data_json TEXT NOT NULL,
+            updated_at REAL NOT NULL
         );
+        CREATE TABLE IF NOT EXISTS checkpoint_counts (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (name, key)
+        );
+        CREATE TABLE IF NOT EXISTS parse_cache (
+            cache_key TEXT PRIMARY KEY,
+            data_json TEXT NOT NULL,
+            cost_seconds REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_parse_cache_last_used ON parse_cache(last_used);
+        CREATE INDEX IF NOT EXISTS idx_parse_cache_created_at ON parse_cache(created_at);
+        CREATE INDEX IF NOT EXISTS idx_pending_expenses_created_at ON pending_expenses(created_at);
+        CREATE INDEX IF NOT EXISTS idx_pending_income_created_at ON pending_income(created_at);
+        CREATE INDEX IF NOT EXISTS idx_last_saved_created_at ON last_saved(created_at);
+        CREATE TABLE IF NOT EXISTS merchant_index (
+            user_id INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            is_phrase INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            subcategory TEXT NOT NULL,
+            weight REAL NOT NULL,
+            PRIMARY KEY (user_id, is_phrase, term, category, subcategory)
+        );
+        CREATE TABLE IF NOT EXISTS sheet_rows (
+            row_index INTEGER NOT NULL,
+            date TEXT,
+            amount REAL,
+            category TEXT,
+            subcategory TEXT,
+            description TEXT,
+            original_text TEXT,
+            month TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_sheet_rows_row_index ON sheet_rows(row_index);
+        CREATE INDEX IF NOT EXISTS idx_sheet_rows_month
+            ON sheet_rows(month, category, subcategory, amount);
     """)
-    if DB_PATH != ":memory:":
-        conn.execute("PRAGMA journal_mode=WAL")
-    _close_conn(conn)
+    # State DBs created before pending entries were versioned
+    for table in ("pending_expenses", "pending_income"):
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if "version" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
 
 
 _init_db()
 
 
-# --- Pending Expenses ---
+# --- Pending expenses and income ---
+#
+# Entries carry a version, bumped by every write. Two taps on "confirm" (or
+# two bot replicas) race on pop_*: one DELETE ... RETURNING wins, the other
+# gets None. Edits read an entry with its version and write it back with
+# replace_*, which fails if anything changed it in between.
+#
+# Decoded entries are kept in a bounded LRU, written through on every change,
+# so the taps of a category edit are served from memory. In this process all
+# pending-entry operations hold _pending_lock; writes by other processes (or
+# other connections) change PRAGMA data_version, which empties the cache.
+
+
+def _clone(value):
+    """Copy of a JSON-shaped value; callers may modify what they get."""
+    if isinstance(value, dict):
+        return {k: _clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_clone(v) for v in value]
+    return value
+
+
+def _cache_check(conn: sqlite3.Connection) -> None:
+    """Empty the cache if another connection wrote since this thread last looked."""
+    data_version = (id(conn), conn.execute("PRAGMA data_version").fetchone()[0])
+    if getattr(_local, "data_version", None) != data_version:
+        _local.data_version = data_version
+        _pending_cache.clear()
+
+
+def _cache_put(cache_key: tuple[str, str], data: dict, version: int) -> None:
+    if PENDING_CACHE_MAX_ENTRIES <= 0:
+        return
+    _pending_cache[cache_key] = (data, version)
+    _pending_cache.move_to_end(cache_key)
+    while len(_pending_cache) > PENDING_CACHE_MAX_ENTRIES:
+        _pending_cache.popitem(last=False)
+
+
+def _save_entry(table: str, key: str, entry_id: str, data: dict) -> None:
+    data_json = json.dumps(data)
+    with _pending_lock:
+        conn = _get_conn()
+        _cache_check(conn)
+        with conn:
+            rows = conn.execute(
+                f"""INSERT INTO {table} ({key}, user_id, data_json, created_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT ({key}) DO UPDATE SET user_id = excluded.user_id, data_json = excluded.data_json,
+                        created_at = excluded.created_at, version = version + 1
+                    RETURNING version""",
+                (entry_id, data["user_id"], data_json, time.time()),
+            ).fetchall()
+        # Cache what a read would return, not the caller's object
+        _cache_put((table, entry_id), json.loads(data_json), rows[0][0])
+
+
+def _get_entry(table: str, key: str, entry_id: str) -> tuple[dict, int] | None:
+    with _pending_lock:
+        conn = _get_conn()
+        _cache_check(conn)
+        cached = _pending_cache.get((table, entry_id))
+        if cached is not None:
+            _pending_cache.move_to_end((table, entry_id))
+        else:
+            row = conn.execute(
+                f"SELECT data_json, version FROM {table} WHERE {key} = ?",
+                (entry_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            cached = json.loads(row[0]), row[1]
+            _cache_put((table, entry_id), *cached)
+        return _clone(cached[0]), cached[1]
+
+
+def _replace_entry(table: str, key: str, entry_id: str, data: dict, version: int) -> bool:
+    data_json = json.dumps(data)
+    with _pending_lock:
+        conn = _get_conn()
+        _cache_check(conn)
+        with conn:
+            cursor = conn.execute(
+                f"UPDATE {table} SET data_json = ?, version = version + 1 WHERE {key} = ? AND version = ?",
+                (data_json, entry_id, version),
+            )
+        if cursor.rowcount != 1:
+            _pending_cache.pop((table, entry_id), None)
+            return False
+        _cache_put((table, entry_id), json.loads(data_json), version + 1)
+        return True
+
+
+def _pop_entry(table: str, key: str, entry_id: str, user_id: int | None) -> dict | None:
+    query = f"DELETE FROM {table} WHERE {key} = ?"
+    params: tuple = (entry_id,)
+    if user_id is not None:
+        query += " AND user_id = ?"
+        params += (user_id,)
+    with _pending_lock:
+        conn = _get_conn()
+        _cache_check(conn)
+        with conn:
+            # fetchall(): the DELETE must run to completion before the commit
+            rows = conn.execute(query + " RETURNING data_json", params).fetchall()
+        if rows:
+            _pending_cache.pop((table, entry_id), None)
+    if not rows:
+        return None
+    return json.loads(rows[0][0])
+
 
 def save_pending(expense_id: str, data: dict) -> None:
-    conn = _get_conn()
-    conn.execute(
-        "INSERT OR REPLACE INTO pending_expenses (expense_id, user_id, data_json, created_at) VALUES (?, ?, ?, ?)",
-        (expense_id, data["user_id"], json.dumps(data), time.time()),
-    )
-    conn.commit()
-    _close_conn(conn)
+    _save_entry("pending_expenses", "expense_id", expense_id, data)
 
 
 def get_pending(expense_id: str) -> dict | None:
-    conn = _get_conn()
-    row = conn.execute(
-        "SELECT data_json FROM pending_expenses WHERE expense_id = ?",
-        (expense_id,),
-    ).fetchone()
-    _close_conn(conn)
-    if row is None:
-        return None
-    return json.loads(row[0])
+    entry = _get_entry("pending_expenses", "expense_id", expense_id)
+    return None if entry is None else entry[0]
+
+
+def get_pending_entry(expense_id: str) -> tuple[dict, int] | None:
+    """(data, version) of a pending expense, for replace_pending()."""
+    return _get_entry("pending_expenses", "expense_id", expense_id)
+
+
+def replace_pending(expense_id: str, data: dict, version: int) -> bool:
+    """Compare-and-swap: store data only if the entry is still at version.
+    False if it changed or is gone (confirmed, cancelled, expired)."""
+    return _replace_entry("pending_expenses", "expense_id", expense_id, data, version)
 
 
 def delete_pending(expense_id: str) -> None:
-    conn = _get_conn()
-    conn.execute("DELETE FROM pending_expenses WHERE expense_id = ?", (expense_id,))
-    conn.commit()
-    _close_conn(conn)
+    pop_pending(expense_id)
+
+
+def pop_pending(expense_id: str, user_id: int | None = None) -> dict | None:
+    """Get and delete a pending expense atomically; only one caller gets it.
+    With user_id, only that user's entry is taken."""
+    return _pop_entry("pending_expenses", "expense_id", expense_id, user_id)
+
+
+def save_pending_income(income_id: str, data: dict) -> None:
+    _save_entry("pending_income", "income_id", income_id, data)
+
+
+def get_pending_income(income_id: str) -> dict | None:
+    entry = _get_entry("pending_income", "income_id", income_id)
+    return None if entry is None else entry[0]
+
+
+def get_pending_income_entry(income_id: str) -> tuple[dict, int] | None:
+    """(data, version) of a pending income, for replace_pending_income()."""
+    return _get_entry("pending_income", "income_id", income_id)
+
+
+def replace_pending_income(income_id: str, data: dict, version: int) -> bool:
+    """Compare-and-swap, like replace_pending()."""
+    return _replace_entry("pending_income", "income_id", income_id, data, version)
 
 
-def pop_pending(expense_id: str) -> dict | None:
-    """Get and delete a pending expense atomically."""
-    data = get_pending(expense_id)
-    if data is not None:
-        delete_pending(expense_id)
-    return data
+def pop_pending_income(income_id: str, user_id: int | None = None) -> dict | None:
+    """Get and delete a pending income atomically, like pop_pending()."""
+    return _pop_entry("pending_income", "income_id", income_id, user_id)
 
 
 # --- Last Saved (for undo) ---
 
 def save_last_saved(user_id: int, data: dict) -> None:
-    conn = _get_conn()
-    conn.execute(
-        "INSERT OR REPLACE INTO last_saved (user_id, data_json, created_at) VALUES (?, ?, ?)",
-        (user_id, json.dumps(data), time.time()),
-    )
-    conn.commit()
-    _close_conn(conn)
+    with _get_conn() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO last_saved (user_id, data_json, created_at) VALUES (?, ?, ?)",
+            (user_id, json.dumps(data), time.time()),
+        )
 
 
 def get_last_saved(user_id: int) -> dict | None:
@@ -121,69 +346,284 @@ def get_last_saved(user_id: int) -> dict | None:
         "SELECT data_json FROM last_saved WHERE user_id = ?",
         (user_id,),
     ).fetchone()
-    _close_conn(conn)
     if row is None:
         return None
     return json.loads(row[0])
 
 
 def delete_last_saved(user_id: int) -> None:
+    with _get_conn() as conn:
+        conn.execute("DELETE FROM last_saved WHERE user_id = ?", (user_id,))
+
+
+# --- Checkpoints (resumable background jobs) ---
+
+def save_checkpoint(name: str, data: dict, counts: dict[str, int] | None = None) -> None:
+    """Save a checkpoint. counts, if given, are upserted into the checkpoint's
+    counters in the same transaction — for per-key state that grows with the
+    job, so each save writes only the keys that changed."""
+    with _get_conn() as conn:
+        if counts:
+            conn.executemany(
+                """INSERT INTO checkpoint_counts (name, key, count) VALUES (?, ?, ?)
+                   ON CONFLICT(name, key) DO UPDATE SET count = excluded.count""",
+                [(name, key, count) for key, count in counts.items()],
+            )
+        conn.execute(
+            "INSERT OR REPLACE INTO checkpoints (name, data_json, updated_at) VALUES (?, ?, ?)",
+            (name, json.dumps(data), time.time()),
+        )
+
+
+def get_checkpoint(name: str) -> dict | None:
     conn = _get_conn()
-    conn.execute("DELETE FROM last_saved WHERE user_id = ?", (user_id,))
-    conn.commit()
-    _close_conn(conn)
+    row = conn.execute(
+        "SELECT data_json FROM checkpoints WHERE name = ?",
+        (name,),
+    ).fetchone()
+    if row is None:
+        return None
+    return json.loads(row[0])
 
 
-# --- Pending Income ---
+def get_checkpoint_counts(name: str) -> dict[str, int]:
+    """All counters saved with a checkpoint (see save_checkpoint)."""
+    conn = _get_conn()
+    rows = conn.execute("SELECT key, count FROM checkpoint_counts WHERE name = ?", (name,)).fetchall()
+    return dict(rows)
+
+
+def delete_checkpoint(name: str) -> None:
+    with _get_conn() as conn:
+        conn.execute("DELETE FROM checkpoints WHERE name = ?", (name,))
+        conn.execute("DELETE FROM checkpoint_counts WHERE name = ?", (name,))
+
+
+# --- Parse cache ---
+
+def get_cached_parse(cache_key: str) -> tuple[list, float] | None:
+    """Return (data, cost_seconds) for a fresh entry and mark it used, else None."""
+    now = time.time()
+    with _get_conn() as conn:
+        row = conn.execute(
+            "SELECT data_json, cost_seconds FROM parse_cache WHERE cache_key = ? AND created_at >= ?",
+            (cache_key, now - PARSE_CACHE_TTL_SECONDS),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE parse_cache SET hits = hits + 1, last_used = ? WHERE cache_key = ?",
+            (now, cache_key),
+        )
+    return json.loads(row[0]), row[1]
+
+
+def save_cached_parse(cache_key: str, data: list, cost_seconds: float) -> None:
+    """Store a parse result, then drop expired and least recently used entries over the cap."""
+    if PARSE_CACHE_MAX_ENTRIES <= 0:
+        return
+    now = time.time()
+    with _get_conn() as conn:
+        conn.execute(
+            """INSERT OR REPLACE INTO parse_cache
+               (cache_key, data_json, cost_seconds, hits, created_at, last_used)
+               VALUES (?, ?, ?, 0, ?, ?)""",
+            (cache_key, json.dumps(data), cost_seconds, now, now),
+        )
+        conn.execute("DELETE FROM parse_cache WHERE created_at < ?", (now - PARSE_CACHE_TTL_SECONDS,))
+        conn.execute(
+            """DELETE FROM parse_cache WHERE cache_key IN (
+                   SELECT cache_key FROM parse_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)""",
+            (PARSE_CACHE_MAX_ENTRIES,),
+        )
+
+
+def parse_cache_stats() -> dict:
+    """Entries, hits and API time saved (seconds) by the entries currently cached."""
+    conn = _get_conn()
+    row = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(hits), 0), COALESCE(SUM(hits * cost_seconds), 0) FROM parse_cache"
+    ).fetchone()
+    return {"entries": row[0], "hits": row[1], "saved_seconds": row[2]}
 
-def save_pending_income(income_id: str, data: dict) -> None:
+
+# --- Merchant index ---
+
+def get_merchant_index(user_id: int) -> list[tuple[str, bool, str, str, float]]:
+    """All (term, is_phrase, category, subcategory, weight) rows for a user."""
     conn = _get_conn()
-    conn.execute(
-        "INSERT OR REPLACE INTO pending_income (income_id, user_id, data_json, created_at) VALUES (?, ?, ?, ?)",
-        (income_id, data["user_id"], json.dumps(data), time.time()),
-    )
-    conn.commit()
-    _close_conn(conn)
+    rows = conn.execute(
+        "SELECT term, is_phrase, category, subcategory, weight FROM merchant_index WHERE user_id = ?",
+        (user_id,),
+    ).fetchall()
+    return [(term, bool(is_phrase), cat, sub, weight) for term, is_phrase, cat, sub, weight in rows]
 
 
-def get_pending_income(income_id: str) -> dict | None:
+def add_merchant_weights(user_id: int, deltas: list[tuple[str, bool, str, str, float]]) -> None:
+    """Add weight deltas to (term, is_phrase, category, subcategory) rows in one
+    transaction; rows that drop to zero or below are removed."""
+    if not deltas:
+        return
+    with _get_conn() as conn:
+        conn.executemany(
+            """INSERT INTO merchant_index (user_id, term, is_phrase, category, subcategory, weight)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (user_id, is_phrase, term, category, subcategory)
+               DO UPDATE SET weight = weight + excluded.weight""",
+            [(user_id, term, int(is_phrase), cat, sub, delta) for term, is_phrase, cat, sub, delta in deltas],
+        )
+        conn.execute("DELETE FROM merchant_index WHERE user_id = ? AND weight <= 0", (user_id,))
+
+
+# --- Sheet mirror ---
+
+_SHEET_ROW_COLUMNS = "row_index, date, amount, category, subcategory, description, original_text, month"
+
+
+def add_sheet_rows(rows: list[tuple], replace: bool = False) -> None:
+    """Insert mirrored sheet rows, as
+    (row_index, date, amount, category, subcategory, description, original_text, month).
+    With replace=True the previous mirror is dropped in the same transaction."""
+    with _get_conn() as conn:
+        if replace:
+            conn.execute("DELETE FROM sheet_rows")
+        conn.executemany(f"INSERT INTO sheet_rows ({_SHEET_ROW_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def truncate_sheet_rows(from_row: int) -> None:
+    """Forget mirrored rows from from_row on."""
+    with _get_conn() as conn:
+        conn.execute("DELETE FROM sheet_rows WHERE row_index >= ?", (from_row,))
+
+
+def get_sheet_row(row_index: int) -> tuple | None:
+    """The mirrored (category, subcategory, description, original_text) of a row."""
     conn = _get_conn()
     row = conn.execute(
-        "SELECT data_json FROM pending_income WHERE income_id = ?",
-        (income_id,),
+        "SELECT category, subcategory, description, original_text FROM sheet_rows WHERE row_index = ?",
+        (row_index,),
     ).fetchone()
-    _close_conn(conn)
-    if row is None:
-        return None
-    return json.loads(row[0])
+    return row
 
 
-def pop_pending_income(income_id: str) -> dict | None:
-    """Get and delete a pending income atomically."""
+def get_sheet_month_totals(month: str) -> list[dict]:
+    """Per (category, subcategory) totals of the mirrored rows of a month,
+    shaped like database.get_category_totals() leaf rows."""
     conn = _get_conn()
-    row = conn.execute(
-        "SELECT data_json FROM pending_income WHERE income_id = ?",
-        (income_id,),
-    ).fetchone()
-    if row is None:
-        _close_conn(conn)
-        return None
-    conn.execute("DELETE FROM pending_income WHERE income_id = ?", (income_id,))
-    conn.commit()
-    _close_conn(conn)
-    return json.loads(row[0])
+    rows = conn.execute(
+        """SELECT category, COALESCE(subcategory, ''), SUM(amount), COUNT(*) FROM sheet_rows
+           WHERE month = ? AND amount IS NOT NULL AND category IS NOT NULL
+           GROUP BY category, COALESCE(subcategory, '')""",
+        (month,),
+    ).fetchall()
+    return [{"category": cat, "subcategory": sub, "total": total, "count": count}
+            for cat, sub, total, count in rows]
 
 
-# --- Cleanup ---
+# --- Expiry ---
 
-def cleanup_expired() -> int:
-    """Remove pending expenses older than TTL. Returns count of removed entries."""
-    cutoff = time.time() - PENDING_TTL_SECONDS
+# Rows deleted per transaction, so a sweep never holds the write lock for long
+SWEEP_BATCH_SIZE = 500
+_SWEEP_HISTORY_KEY = "storage:sweeps"
+_SWEEP_HISTORY_LENGTH = 48  # One day of half-hourly sweeps
+_VACUUM_KEY = "storage:vacuum"
+
+_expired_totals: dict[str, int] = {}
+
+
+def _ttl_policies() -> dict[str, tuple[str, float]]:
+    """table -> (indexed expiry column, TTL in seconds). Checkpoints, the
+    merchant index and the sheet mirror are long-lived state and never expire."""
+    return {
+        "pending_expenses": ("created_at", PENDING_TTL_SECONDS),
+        "pending_income": ("created_at", PENDING_TTL_SECONDS),
+        "last_saved": ("created_at", LAST_SAVED_TTL_SECONDS),
+        "parse_cache": ("created_at", PARSE_CACHE_TTL_SECONDS),
+    }
+
+
+def _delete_expired(table: str, column: str, cutoff: float) -> int:
+    conn = _get_conn()
+    count = 0
+    while True:
+        with conn:
+            deleted = conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {column} < ? LIMIT ?)",
+                (cutoff, SWEEP_BATCH_SIZE),
+            ).rowcount
+        count += deleted
+        if deleted < SWEEP_BATCH_SIZE:
+            return count
+
+
+def _file_sizes() -> tuple[int, int]:
+    """Bytes in the DB file and its write-ahead log."""
+    if DB_PATH == ":memory:":
+        return 0, 0
+    wal = DB_PATH + "-wal"
+    return os.path.getsize(DB_PATH), os.path.getsize(wal) if os.path.exists(wal) else 0
+
+
+def _maintain(now: float) -> None:
+    """Fold the WAL back into the DB file; VACUUM when due and worth it."""
+    if DB_PATH == ":memory:":
+        return
     conn = _get_conn()
-    cursor = conn.execute("DELETE FROM pending_expenses WHERE created_at < ?", (cutoff,))
-    count = cursor.rowcount
-    conn.commit()
-    _close_conn(conn)
-    if count > 0:
-        logger.info(f"Cleaned up {count} expired pending expenses")
-    return count
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        last = get_checkpoint(_VACUUM_KEY)
+        if last is not None and now - last["at"] < STATE_DB_VACUUM_HOURS * 3600:
+            return
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        # Only rewrite the file when at least a fifth of it is free pages
+        if free * 5 >= pages:
+            conn.execute("VACUUM")
+            logger.info(f"State DB vacuumed: {free} of {pages} pages were free")
+        save_checkpoint(_VACUUM_KEY, {"at": now})
+    except sqlite3.OperationalError as e:  # e.g. locked past the busy timeout; next sweep retries
+        logger.warning(f"State DB maintenance skipped: {e}")
+
+
+def sweep_expired() -> dict[str, int]:
+    """Delete expired rows from every table with a TTL policy, in bounded
+    batches, then checkpoint the WAL (and VACUUM when due). Returns rows
+    expired per table; each sweep is also recorded for sweep_stats()."""
+    now = time.time()
+    expired = {
+        table: _delete_expired(table, column, now - ttl)
+        for table, (column, ttl) in _ttl_policies().items()
+    }
+    for table, count in expired.items():
+        _expired_totals[table] = _expired_totals.get(table, 0) + count
+    if expired["pending_expenses"] or expired["pending_income"]:
+        # This connection's own deletes do not change its data_version
+        with _pending_lock:
+            _pending_cache.clear()
+    _maintain(now)
+
+    db_bytes, wal_bytes = _file_sizes()
+    history = (get_checkpoint(_SWEEP_HISTORY_KEY) or {}).get("sweeps", [])
+    history.append({"at": now, "expired": expired, "db_bytes": db_bytes, "wal_bytes": wal_bytes})
+    save_checkpoint(_SWEEP_HISTORY_KEY, {"sweeps": history[-_SWEEP_HISTORY_LENGTH:]})
+
+    total = sum(expired.values())
+    if total > 0:
+        logger.info(f"Expired {total} state rows: {expired}")
+    logger.info(f"State DB size: {db_bytes / 1e6:.2f} MB (+{wal_bytes / 1e6:.2f} MB WAL)")
+    return expired
+
+
+def sweep_stats() -> dict:
+    """Rows expired per table since start, and the recent sweeps
+    ({at, expired, db_bytes, wal_bytes}, oldest first) to follow the DB size."""
+    return {
+        "expired": dict(_expired_totals),
+        "history": (get_checkpoint(_SWEEP_HISTORY_KEY) or {}).get("sweeps", []),
+    }
+
+
+# --- Async facade ---
+
+# ``await storage.aio.get_pending(eid)``: each call runs in a worker thread, on its own connection
+aio = AsyncFacade(globals())
@@ -1,51 +1,215 @@
 """Google Sheets background sync service.
 
 Handles reconciliation between PostgreSQL and Google Sheets:
-- sync_unsynced_to_sheets: pushes unsynced expenses to Sheets
+- run_sync: pushes the unsynced backlog in chunks (one Sheets append and
+  one DB UPDATE per chunk), checkpointing each chunk so a crash between the
+  append and the UPDATE never produces duplicate rows
+- sync_unsynced_to_sheets: run_sync wrapper returning the synced count
+- sync_saved_expenses: confirm-time append of just-saved expenses
 - full_reconciliation: verifies DB vs Sheets consistency
+
+Appends run under database.sheets_sync_lock(), so the background sync and
+a confirm never both append the same unsynced rows.
 """
 
 import logging
-from bot.services import database, sheets
+import os
+import random
+import time
+from bot.services import database, sheets, storage
 
 logger = logging.getLogger(__name__)
 
+SYNC_CHUNK_SIZE = int(os.environ.get("SYNC_CHUNK_SIZE", "200"))
+SYNC_MAX_RETRIES = int(os.environ.get("SYNC_MAX_RETRIES", "5"))
+SYNC_BACKOFF_BASE = float(os.environ.get("SYNC_BACKOFF_BASE", "2.0"))
+SYNC_BACKOFF_MAX = 60.0
+
+CHECKPOINT_NAME = "sheets_sync"
+
+_sleep = time.sleep
+
+
+def _expense_row(expense: dict) -> list:
+    return sheets.build_expense_row(
+        {
+            "date": str(expense["date"]),
+            "amount": float(expense["amount"]),
+            "category": expense["category"],
+            "subcategory": expense["subcategory"],
+            "description": expense["description"],
+        },
+        expense.get("original_text") or "",
+    )
+
+
+def _claimed_ids() -> set[int]:
+    """Ids of the chunk a sync run is still appending (its checkpoint)."""
+    checkpoint = storage.get_checkpoint(CHECKPOINT_NAME)
+    return set(checkpoint["ids"]) if checkpoint else set()
+
+
+def _backoff_delay(attempt: int) -> float:
+    delay = min(SYNC_BACKOFF_MAX, SYNC_BACKOFF_BASE * 2 ** attempt)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _recover_checkpoint(conn) -> int:
+    """Finish a chunk interrupted by a crash. Returns rows marked synced."""
+    checkpoint = storage.get_checkpoint(CHECKPOINT_NAME)
+    if checkpoint is None:
+        return 0
+
+    ids = checkpoint["ids"]
+    row_indices = checkpoint.get("row_indices")
+    if row_indices is None:
+        # Crashed during the append: check whether the rows made it to the sheet
+        row_indices = sheets.find_appended_rows(checkpoint["rows"], checkpoint.get("sheet_length"))
+        if row_indices is None:
+            logger.info("Interrupted sync chunk was not written to Sheets, will resend")
+            storage.delete_checkpoint(CHECKPOINT_NAME)
+            return 0
+
+    database.mark_synced_bulk(list(zip(ids, row_indices)), conn=conn)
+    storage.delete_checkpoint(CHECKPOINT_NAME)
+    logger.info(f"Recovered interrupted sync chunk of {len(ids)} expenses")
+    return len(ids)
+
+
+def _sync_chunk(chunk_size: int, seen_ids: set[int]) -> int:
+    """Append the next chunk of the backlog and mark it synced. Returns its size.
+
+    Each attempt holds the sync lock; the backoff (with jitter) on 429/5xx/
+    timeouts sleeps outside it, with the checkpoint telling confirms to keep
+    off the chunk meanwhile. Only 429 is retried blindly: after a 5xx or a
+    timeout the append may still have landed, so the sheet is checked first,
+    as in checkpoint recovery, and the rows found there are used instead.
+    """
+    ids = rows = sheet_length = None
+    ambiguous = False
+    attempt = 0
+    while True:
+        with database.sheets_sync_lock() as conn:
+            if ids is None:
+                batch = database.get_unsynced_expenses(limit=chunk_size, conn=conn)
+                if not batch:
+                    return 0
+                ids = [e["id"] for e in batch]
+                if seen_ids.intersection(ids):
+                    # Rows we already pushed are still unsynced — don't loop forever
+                    raise RuntimeError("synced expenses were not marked, aborting")
+                seen_ids.update(ids)
+                rows = [_expense_row(e) for e in batch]
+
+            row_indices = sheets.find_appended_rows(rows, sheet_length) if ambiguous else None
+            if row_indices is not None:
+                logger.info(f"Failed Sheets append had landed in rows {row_indices[0]}-{row_indices[-1]}")
+            else:
+                # Where the sheet ended, so recovery never matches rows from before this append
+                sheet_length = sheets.sheet_length()
+                storage.save_checkpoint(CHECKPOINT_NAME, {"ids": ids, "rows": rows, "sheet_length": sheet_length})
+                try:
+                    row_indices = sheets.append_expense_rows(rows)
+                except Exception as e:
+                    ambiguous = sheets.is_ambiguous_write_error(e)
+                    if not (ambiguous or sheets.is_rate_limit_error(e)) or attempt >= SYNC_MAX_RETRIES:
+                        raise
+                    error = e
+
+            if row_indices is not None:
+                storage.save_checkpoint(CHECKPOINT_NAME, {"ids": ids, "row_indices": row_indices})
+                database.mark_synced_bulk(list(zip(ids, row_indices)), conn=conn)
+                storage.delete_checkpoint(CHECKPOINT_NAME)
+                return len(ids)
+
+        delay = _backoff_delay(attempt)
+        attempt += 1
+        logger.warning(f"Sheets append failed ({error}), retry {attempt} in {delay:.1f}s")
+        _sleep(delay)
+
+
+def run_sync(chunk_size: int | None = None, max_chunks: int | None = None) -> dict:
+    """Push unsynced expenses to Sheets chunk by chunk.
+
+    Returns {"synced", "recovered", "chunks", "elapsed", "rows_per_sec",
+    "remaining", "error"}.
+    """
+    chunk_size = chunk_size or SYNC_CHUNK_SIZE
+    result = {
+        "synced": 0,
+        "recovered": 0,
+        "chunks": 0,
+        "elapsed": 0.0,
+        "rows_per_sec": 0.0,
+        "remaining": 0,
+        "error": None,
+    }
+    if not database.is_available():
+        return result
+
+    start = time.monotonic()
+    seen_ids: set[int] = set()
+    try:
+        with database.sheets_sync_lock() as conn:
+            result["recovered"] = _recover_checkpoint(conn)
+
+        while max_chunks is None or result["chunks"] < max_chunks:
+            # Locked per append attempt, so confirms are not held up for a whole backlog
+            synced = _sync_chunk(chunk_size, seen_ids)
+            if not synced:
+                break
+            result["synced"] += synced
+            result["chunks"] += 1
+            if synced < chunk_size:
+                break
+    except Exception as e:
+        logger.error(f"Sheets sync stopped after {result['synced']} expenses: {e}")
+        result["error"] = str(e)
+
+    result["elapsed"] = time.monotonic() - start
+    if result["elapsed"] > 0:
+        result["rows_per_sec"] = result["synced"] / result["elapsed"]
+    try:
+        result["remaining"] = database.count_unsynced_expenses()
+    except Exception:
+        result["remaining"] = None
+
+    if result["synced"]:
+        logger.info(
+            f"Synced {result['synced']} expenses to Google Sheets in {result['chunks']} chunks "
+            f"({result['rows_per_sec']:.1f} rows/s, {result['remaining']} remaining)"
+        )
+    return result
+
 
 def sync_unsynced_to_sheets() -> int:
     """Find expenses with synced_to_sheets=FALSE, append to Sheets, mark synced.
 
     Returns the number of expenses synced.
     """
-    if not database.is_available():
-        return 0
+    result = run_sync()
+    return result["synced"] + result["recovered"]
 
-    unsynced = database.get_unsynced_expenses()
-    if not unsynced:
-        return 0
 
-    synced_count = 0
-    for expense in unsynced:
-        try:
-            expense_dict = {
-                "date": str(expense["date"]),
-                "amount": float(expense["amount"]),
-                "category": expense["category"],
-                "subcategory": expense["subcategory"],
-                "description": expense["description"],
-            }
-            row_indices = sheets.save_expenses_to_sheet(
-                [expense_dict], expense.get("original_text", "")
-            )
-            if row_indices:
-                database.mark_synced(expense["id"], row_indices[0])
-                synced_count += 1
-        except Exception as e:
-            logger.error(f"Failed to sync expense {expense['id']} to Sheets: {e}")
-            continue
-
-    if synced_count:
-        logger.info(f"Synced {synced_count} expenses to Google Sheets")
-    return synced_count
+def sync_saved_expenses(expense_ids: list[int], expenses: list[dict], original_text: str) -> list[int]:
+    """Append just-saved expenses to Sheets and mark them synced.
+
+    Skips those a background sync appended (or is appending) since they
+    were saved, and leaves everything to it when it holds the sync lock,
+    rather than keeping the confirm waiting. Returns the sheet row indices
+    of the rows appended here.
+    """
+    with database.sheets_sync_lock(wait=False) as conn:
+        if conn is None:
+            logger.info("Sheets sync in progress, leaving saved expenses to it")
+            return []
+        unsynced = database.filter_unsynced(expense_ids, conn=conn) - _claimed_ids()
+        pending = [(eid, e) for eid, e in zip(expense_ids, expenses) if eid in unsynced]
+        if not pending:
+            return []
+        row_indices = sheets.save_expenses_to_sheet([e for _, e in pending], original_text)
+        database.mark_synced_bulk(list(zip([eid for eid, _ in pending], row_indices)), conn=conn)
+    return row_indices
 
 
 def full_reconciliation() -> dict:
@@ -60,12 +224,11 @@ def full_reconciliation() -> dict:
     }
 
     try:
-        unsynced = database.get_unsynced_expenses()
-        result["unsynced_count"] = len(unsynced)
+        result["unsynced_count"] = database.count_unsynced_expenses()
 
-        if unsynced:
+        if result["unsynced_count"]:
             result["synced_count"] = sync_unsynced_to_sheets()
-            result["unsynced_count"] = len(database.get_unsynced_expenses())
+            result["unsynced_count"] = database.count_unsynced_expenses()
     except Exception as e:
         logger.error(f"Reconciliation error: {e}")
         result["status"] = "error"
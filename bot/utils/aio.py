@@ -0,0 +1,31 @@
+"""Awaitable wrappers for the blocking service modules (database, storage)."""
+
+
+async def run_async(func, *args, **kwargs):
+    """Run a blocking call in a worker thread."""
+    import asyncio  # Only the bot needs it; keeps CLI startup lean
+
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+class AsyncFacade:
+    """Awaitable versions of a module's functions: a module sets
+    ``aio = AsyncFacade(globals())``, callers ``await module.aio.name(...)``.
+
+    Functions are looked up at call time, so patching ``module.<name>`` in
+    tests also affects the async variant.
+    """
+
+    def __init__(self, namespace: dict):
+        self._namespace = namespace
+
+    def __getattr__(self, name):
+        namespace = self._namespace
+        if name.startswith("_") or not callable(namespace.get(name)):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await run_async(namespace[name], *args, **kwargs)
+
+        call.__name__ = name
+        return call
@@ -82,6 +82,19 @@ def generate_pie_chart(categories_data: dict[str, float], title: str) -> BytesIO
     return buf
 
 
+def bar_chart_data(trend: dict) -> dict[str, dict[str, float]]:
+    """Turn a database.get_monthly_trend() matrix into generate_bar_chart()
+    input: {month name: {category: total}}, newest month first."""
+    from bot.config import MONTHS_MAPPING
+
+    return {
+        MONTHS_MAPPING[month.month]: {
+            cat: amt for cat, amt in zip(trend["categories"], values) if amt
+        }
+        for month, values in reversed(list(zip(trend["months"], trend["matrix"])))
+    }
+
+
 def generate_bar_chart(months_data: dict[str, dict[str, float]], title: str) -> BytesIO:
     """Generate a grouped bar chart comparing months. Returns PNG BytesIO."""
     import matplotlib
@@ -0,0 +1,23 @@
+-- Content hash of an expense, used to deduplicate sheet imports.
+-- Must match bot.services.importer.content_hash().
+ALTER TABLE expenses ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+CREATE OR REPLACE FUNCTION expense_content_hash() RETURNS trigger AS $$
+BEGIN
+    NEW.content_hash := md5(concat_ws('|',
+        NEW.date::text, NEW.amount::numeric(10, 2)::text,
+        NEW.category, NEW.subcategory, NEW.description));
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS expenses_content_hash ON expenses;
+CREATE TRIGGER expenses_content_hash
+    BEFORE INSERT OR UPDATE OF date, amount, category, subcategory, description
+    ON expenses FOR EACH ROW EXECUTE FUNCTION expense_content_hash();
+
+UPDATE expenses SET content_hash = md5(concat_ws('|',
+    date::text, amount::numeric(10, 2)::text, category, subcategory, description))
+WHERE content_hash IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_expenses_user_hash ON expenses(user_id, content_hash);
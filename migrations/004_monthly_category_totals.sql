@@ -0,0 +1,86 @@
+-- Per-month category totals, kept in step with expenses by statement-level
+-- triggers (one aggregated upsert per statement, so bulk inserts stay cheap).
+-- Reports read O(categories) rows from here instead of scanning expenses.
+CREATE TABLE IF NOT EXISTS monthly_category_totals (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    subcategory TEXT NOT NULL,
+    total DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, year, month, category, subcategory)
+);
+
+-- Adds (direction = 1) or subtracts (direction = -1) a set of expense rows, given as
+-- a JSON array, from the totals.
+CREATE OR REPLACE FUNCTION monthly_category_totals_add(expense_rows jsonb, direction int) RETURNS void AS $$
+BEGIN
+    INSERT INTO monthly_category_totals
+        (user_id, year, month, category, subcategory, total, count)
+    SELECT r.user_id, EXTRACT(YEAR FROM r.date)::int, EXTRACT(MONTH FROM r.date)::int,
+           r.category, r.subcategory, direction * SUM(r.amount), direction * COUNT(*)
+      FROM jsonb_to_recordset(expense_rows)
+           AS r(user_id int, amount numeric, date date, category text, subcategory text)
+     WHERE r.user_id IS NOT NULL
+     GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT (user_id, year, month, category, subcategory) DO UPDATE
+        SET total = monthly_category_totals.total + EXCLUDED.total,
+            count = monthly_category_totals.count + EXCLUDED.count;
+    IF direction < 0 THEN
+        DELETE FROM monthly_category_totals
+         WHERE count <= 0
+           AND user_id IN (SELECT (e ->> 'user_id')::int FROM jsonb_array_elements(expense_rows) e);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION monthly_category_totals_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM monthly_category_totals_add(
+            (SELECT COALESCE(jsonb_agg(to_jsonb(n)), '[]') FROM new_rows n), 1);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM monthly_category_totals_add(
+            (SELECT COALESCE(jsonb_agg(to_jsonb(o)), '[]') FROM old_rows o), -1);
+    ELSE
+        -- Only rows whose totals-relevant columns changed (not e.g. sync flags)
+        PERFORM monthly_category_totals_add(
+            (SELECT COALESCE(jsonb_agg(to_jsonb(o)), '[]')
+               FROM old_rows o JOIN new_rows n ON n.id = o.id
+              WHERE (n.user_id, n.amount, n.date, n.category, n.subcategory)
+                    IS DISTINCT FROM (o.user_id, o.amount, o.date, o.category, o.subcategory)),
+            -1);
+        PERFORM monthly_category_totals_add(
+            (SELECT COALESCE(jsonb_agg(to_jsonb(n)), '[]')
+               FROM old_rows o JOIN new_rows n ON n.id = o.id
+              WHERE (n.user_id, n.amount, n.date, n.category, n.subcategory)
+                    IS DISTINCT FROM (o.user_id, o.amount, o.date, o.category, o.subcategory)),
+            1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS expenses_monthly_totals_insert ON expenses;
+CREATE TRIGGER expenses_monthly_totals_insert
+    AFTER INSERT ON expenses REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION monthly_category_totals_apply();
+
+DROP TRIGGER IF EXISTS expenses_monthly_totals_update ON expenses;
+CREATE TRIGGER expenses_monthly_totals_update
+    AFTER UPDATE ON expenses REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION monthly_category_totals_apply();
+
+DROP TRIGGER IF EXISTS expenses_monthly_totals_delete ON expenses;
+CREATE TRIGGER expenses_monthly_totals_delete
+    AFTER DELETE ON expenses REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION monthly_category_totals_apply();
+
+DELETE FROM monthly_category_totals;
+INSERT INTO monthly_category_totals (user_id, year, month, category, subcategory, total, count)
+SELECT user_id, EXTRACT(YEAR FROM date)::int, EXTRACT(MONTH FROM date)::int,
+       category, subcategory, SUM(amount), COUNT(*)
+  FROM expenses
+ WHERE user_id IS NOT NULL
+ GROUP BY 1, 2, 3, 4, 5;
@@ -0,0 +1,18 @@
+-- Full-text search over expenses (see database.search_expenses).
+-- Text is folded to lower case without Polish diacritics, so "zabka" finds
+-- "Żabka". The built-in 'simple' configuration is used: PostgreSQL ships no
+-- Polish stemmer, and the fold needs no contrib extension (unaccent/pg_trgm).
+CREATE OR REPLACE FUNCTION expense_search_fold(value text) RETURNS text AS $$
+    SELECT translate(lower(value), 'ąćęłńóśźżĄĆĘŁŃÓŚŹŻ', 'acelnoszzacelnoszz');
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+-- Description weighs most, then category names, then the original message
+ALTER TABLE expenses ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', expense_search_fold(coalesce(description, ''))), 'A')
+        || setweight(to_tsvector('simple', expense_search_fold(
+               coalesce(category, '') || ' ' || coalesce(subcategory, ''))), 'B')
+        || setweight(to_tsvector('simple', expense_search_fold(coalesce(original_text, ''))), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_expenses_search ON expenses USING GIN (search_vector);
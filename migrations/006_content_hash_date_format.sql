@@ -0,0 +1,15 @@
+-- Hash the date as YYYY-MM-DD whatever the session DateStyle is (date::text
+-- follows it). Must match bot.services.importer.content_hash().
+CREATE OR REPLACE FUNCTION expense_content_hash() RETURNS trigger AS $$
+BEGIN
+    NEW.content_hash := md5(concat_ws('|',
+        to_char(NEW.date, 'YYYY-MM-DD'), NEW.amount::numeric(10, 2)::text,
+        NEW.category, NEW.subcategory, NEW.description));
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+UPDATE expenses SET content_hash = md5(concat_ws('|',
+    to_char(date, 'YYYY-MM-DD'), amount::numeric(10, 2)::text, category, subcategory, description))
+WHERE content_hash IS DISTINCT FROM md5(concat_ws('|',
+    to_char(date, 'YYYY-MM-DD'), amount::numeric(10, 2)::text, category, subcategory, description));
@@ -1,88 +1,117 @@
 """Tests for AI parser service."""
 
+import asyncio
 import json
+import httpx2
+import openai
 import pytest
+from benchmarks.fake_openai import FakeOpenAI
 from unittest.mock import patch, MagicMock
-from bot.services.ai_parser import parse_expenses, build_system_prompt
+from datetime import date
+from bot.categories import SUBCATEGORY_CODES
+from bot.services import ai_parser, storage
+from bot.services.ai_parser import parse_expenses, parse_expenses_async, build_system_prompt, parser_stats
+
+
+@pytest.fixture(autouse=True)
+def reset_parser_stats():
+    storage.DB_PATH = ":memory:"
+    storage._init_db()
+    ai_parser._reset_stats()
+    with patch.object(ai_parser, "AI_RETRY_BASE", 0), patch.object(ai_parser, "AI_BATCH_WINDOW_MS", 0):
+        yield
+
+
+def _response(content):
+    response = MagicMock()
+    response.choices[0].message.content = content
+    return response
+
+
+def _reply(*expenses):
+    """A structured reply; expenses are (amount, date, code, description)."""
+    return json.dumps({"expenses": [
+        {"amount": amount, "date": day, "code": code, "description": description}
+        for amount, day, code, description in expenses
+    ]})
+
+
+def _status_error(code):
+    response = httpx2.Response(code, request=httpx2.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    cls = openai.RateLimitError if code == 429 else openai.APIStatusError
+    return cls(f"HTTP {code}", response=response, body=None)
 
 
 class TestBuildSystemPrompt:
     def test_contains_current_date(self):
         prompt = build_system_prompt()
-        assert "Dzisiejsza data to:" in prompt
+        assert f"Dzisiejsza data: {date.today()}" in prompt
 
-    def test_contains_categories(self):
+    def test_contains_category_codes(self):
         prompt = build_system_prompt()
-        assert "Jedzenie" in prompt
+        assert "1.1 Jedzenie dom" in prompt
         assert "Transport" in prompt
 
-    def test_contains_json_format_instruction(self):
+    def test_date_comes_after_static_prefix(self):
         prompt = build_system_prompt()
-        assert "JSON array" in prompt
+        assert prompt.startswith(ai_parser.STATIC_PROMPT)
+        assert str(date.today().year) not in ai_parser.STATIC_PROMPT
+
+    def test_user_hints(self):
+        assert "dino → 1.1" in build_system_prompt([("dino", "Jedzenie", "Jedzenie dom")])
+        assert "przypisuje zwykle" not in build_system_prompt()
+
+    @patch("bot.services.ai_parser.client_ai")
+    def test_request_uses_static_prefix_and_schema(self, mock_client):
+        mock_client.chat.completions.create.return_value = _response(_reply())
+
+        parse_expenses("pierwsza wiadomość")
+        parse_expenses("druga", [("dino", "Jedzenie", "Jedzenie dom")])
+
+        first, second = (c.kwargs for c in mock_client.chat.completions.create.call_args_list)
+        assert first["messages"][0] == second["messages"][0] == {"role": "system", "content": ai_parser.STATIC_PROMPT}
+        assert "dino" in second["messages"][1]["content"]
+        assert first["response_format"]["json_schema"]["strict"] is True
+        item = first["response_format"]["json_schema"]["schema"]["properties"]["expenses"]["items"]
+        assert item["properties"]["code"]["enum"] == list(SUBCATEGORY_CODES)
 
 
 class TestParseExpenses:
     @patch("bot.services.ai_parser.client_ai")
     def test_single_expense(self, mock_client):
-        mock_response = MagicMock()
-        mock_response.choices[0].message.content = json.dumps([{
-            "amount": 50.0,
-            "date": "2026-02-26",
-            "category": "Jedzenie",
-            "subcategory": "Jedzenie dom",
-            "description": "biedronka",
-        }])
-        mock_client.chat.completions.create.return_value = mock_response
+        mock_client.chat.completions.create.return_value = _response(
+            _reply((50.0, "2026-02-26", "1.1", "biedronka")))
 
         result = parse_expenses("50 zł biedronka")
-        assert len(result) == 1
-        assert result[0]["amount"] == 50.0
-        assert result[0]["category"] == "Jedzenie"
+        assert result == [{
+            "amount": 50.0, "date": "2026-02-26", "category": "Jedzenie",
+            "subcategory": "Jedzenie dom", "description": "biedronka",
+        }]
 
     @patch("bot.services.ai_parser.client_ai")
     def test_multiple_expenses(self, mock_client):
-        mock_response = MagicMock()
-        mock_response.choices[0].message.content = json.dumps([
-            {"amount": 50.0, "date": "2026-02-26", "category": "Jedzenie",
-             "subcategory": "Jedzenie dom", "description": "biedronka"},
-            {"amount": 120.0, "date": "2026-02-26", "category": "Rozrywka",
-             "subcategory": "Siłownia / Basen", "description": "silownia"},
-        ])
-        mock_client.chat.completions.create.return_value = mock_response
+        mock_client.chat.completions.create.return_value = _response(_reply(
+            (50.0, "2026-02-26", "1.1", "biedronka"),
+            (120.0, "2026-02-26", "8.1", "silownia"),
+        ))
 
         result = parse_expenses("biedronka 50, silownia 120")
         assert len(result) == 2
+        assert (result[1]["category"], result[1]["subcategory"]) == ("Rozrywka", "Siłownia / Basen")
 
     @patch("bot.services.ai_parser.client_ai")
     def test_non_expense_returns_empty(self, mock_client):
-        mock_response = MagicMock()
-        mock_response.choices[0].message.content = "[]"
-        mock_client.chat.completions.create.return_value = mock_response
+        mock_client.chat.completions.create.return_value = _response(_reply())
 
         result = parse_expenses("cześć, jak się masz?")
         assert result == []
 
     @patch("bot.services.ai_parser.client_ai")
-    def test_strips_markdown_code_blocks(self, mock_client):
-        mock_response = MagicMock()
-        mock_response.choices[0].message.content = '```json\n[{"amount": 50.0, "date": "2026-02-26", "category": "Jedzenie", "subcategory": "Jedzenie dom", "description": "test"}]\n```'
-        mock_client.chat.completions.create.return_value = mock_response
-
-        result = parse_expenses("test 50")
-        assert len(result) == 1
-
-    @patch("bot.services.ai_parser.client_ai")
-    def test_wraps_single_dict_in_list(self, mock_client):
-        mock_response = MagicMock()
-        mock_response.choices[0].message.content = json.dumps({
-            "amount": 50.0, "date": "2026-02-26", "category": "Jedzenie",
-            "subcategory": "Jedzenie dom", "description": "test"
-        })
-        mock_client.chat.completions.create.return_value = mock_response
+    def test_unknown_code_raises(self, mock_client):
+        mock_client.chat.completions.create.return_value = _response(_reply((50.0, "2026-02-26", "99.9", "test")))
 
-        result = parse_expenses("test 50")
-        assert isinstance(result, list)
-        assert len(result) == 1
+        with pytest.raises(ValueError):
+            parse_expenses("test 50")
 
     @patch("bot.services.ai_parser.client_ai")
     def test_invalid_json_raises(self, mock_client):
@@ -92,3 +121,300 @@ class TestParseExpenses:
 
         with pytest.raises(json.JSONDecodeError):
             parse_expenses("test")
+
+    @patch("bot.services.ai_parser.client_ai")
+    def test_token_usage_is_tracked(self, mock_client):
+        response = _response(_reply())
+        response.usage.prompt_tokens = 800
+        response.usage.completion_tokens = 20
+        response.usage.prompt_tokens_details.cached_tokens = 600
+        mock_client.chat.completions.create.return_value = response
+
+        parse_expenses("pierwsza")
+        parse_expenses("druga")
+
+        stats = parser_stats()
+        assert stats["prompt_tokens"] == 1600
+        assert stats["prompt_tokens_avg"] == 800
+        assert stats["completion_tokens_avg"] == 20
+        assert stats["prompt_cache_ratio"] == 0.75
+
+
+class TestRetryPolicy:
+    def test_retryable_errors(self):
+        assert ai_parser.is_retryable_error(_status_error(429))
+        assert ai_parser.is_retryable_error(_status_error(503))
+        assert ai_parser.is_retryable_error(TimeoutError())
+        assert not ai_parser.is_retryable_error(_status_error(400))
+        assert not ai_parser.is_retryable_error(ValueError())
+
+    def test_jitter_stays_under_cap(self):
+        with patch.object(ai_parser, "AI_RETRY_BASE", 1.0):
+            delays = [ai_parser._retry_delay(10, ValueError()) for _ in range(50)]
+        assert all(0 <= d <= ai_parser.AI_RETRY_MAX for d in delays)
+        assert len(set(delays)) > 1
+
+    @patch("bot.services.ai_parser.time.sleep")
+    @patch("bot.services.ai_parser.client_ai")
+    def test_sync_wrapper_retries_rate_limit(self, mock_client, mock_sleep):
+        mock_client.chat.completions.create.side_effect = [_status_error(429), _response(_reply())]
+        assert parse_expenses("test") == []
+        assert mock_client.chat.completions.create.call_count == 2
+        assert parser_stats()["retries"] == 1
+
+    @patch("bot.services.ai_parser.client_ai")
+    def test_client_error_is_not_retried(self, mock_client):
+        mock_client.chat.completions.create.side_effect = _status_error(400)
+        with pytest.raises(openai.APIStatusError):
+            parse_expenses("test")
+        assert mock_client.chat.completions.create.call_count == 1
+        assert parser_stats()["failures"] == 1
+
+
+class TestParseExpensesAsync:
+    def test_parses_response(self):
+        async def create(**kwargs):
+            assert kwargs["timeout"] == ai_parser.AI_TIMEOUT
+            return _response(_reply((50.0, "2026-02-26", "1.1", "biedronka")))
+
+        with patch("bot.services.ai_parser.client_ai_async") as mock_client:
+            mock_client.chat.completions.create = create
+            result = asyncio.run(parse_expenses_async("50 zł biedronka"))
+        assert result[0]["amount"] == 50.0
+
+    def test_concurrency_is_limited(self):
+        running = 0
+        peak = 0
+
+        async def create(**kwargs):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return _response(_reply())
+
+        async def run():
+            depths = []
+
+            async def sample():
+                await asyncio.sleep(0.005)
+                depths.append(parser_stats()["queue_depth"])
+
+            await asyncio.gather(sample(), *(parse_expenses_async(f"t{i}") for i in range(8)))
+            return depths
+
+        with patch("bot.services.ai_parser.client_ai_async") as mock_client, \
+                patch.object(ai_parser, "AI_MAX_CONCURRENCY", 2):
+            mock_client.chat.completions.create = create
+            depths = asyncio.run(run())
+
+        assert peak == 2
+        assert depths == [6]
+        stats = parser_stats()
+        assert stats["requests"] == 8
+        assert stats["queue_depth"] == 0
+        assert stats["in_flight"] == 0
+        assert 0.01 <= stats["latency_p50"] <= stats["latency_p99"]
+
+    def test_timeout_is_retried_then_raised(self):
+        calls = 0
+
+        async def create(**kwargs):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(1)
+
+        with patch("bot.services.ai_parser.client_ai_async") as mock_client, \
+                patch.object(ai_parser, "AI_TIMEOUT", 0.01), \
+                patch.object(ai_parser, "AI_MAX_RETRIES", 1):
+            mock_client.chat.completions.create = create
+            with pytest.raises(TimeoutError):
+                asyncio.run(parse_expenses_async("test"))
+
+        assert calls == 2
+        stats = parser_stats()
+        assert stats["timeouts"] == 2
+        assert stats["retries"] == 1
+        assert stats["failures"] == 1
+
+    def test_server_error_then_success(self):
+        outcomes = [_status_error(502), _response(_reply())]
+
+        async def create(**kwargs):
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        with patch("bot.services.ai_parser.client_ai_async") as mock_client:
+            mock_client.chat.completions.create = create
+            assert asyncio.run(parse_expenses_async("test")) == []
+        assert parser_stats()["retries"] == 1
+
+
+class TestParseCache:
+    def _reply(self, day):
+        return _response(_reply((45.0, day, "8.2", "netflix")))
+
+    @patch("bot.services.ai_parser.client_ai")
+    def test_normalized_repeat_is_served_from_cache(self, mock_client):
+        mock_client.chat.completions.create.return_value = self._reply(str(date.today()))
+
+        first = parse_expenses("Netflix 45")
+        second = parse_expenses("  netflix   45 ")
+
+        assert second == first
+        assert mock_client.chat.completions.create.call_count == 1
+        stats = parser_stats()
+        assert (stats["cache_hits"], stats["cache_misses"]) == (1, 1)
+        assert stats["cache_hit_ratio"] == 0.5
+        assert storage.parse_cache_stats()["hits"] == 1
+
+    @patch("bot.services.ai_parser.client_ai")
+    def test_relative_date_is_reanchored(self, mock_client):
+        mock_client.chat.completions.create.return_value = self._reply("2026-02-09")
+
+        with patch("bot.services.ai_parser._today", return_value=date(2026, 2, 10)):
+            assert parse_expenses("netflix 45 wczoraj")[0]["date"] == "2026-02-09"
+        with patch("bot.services.ai_parser._today", return_value=date(2026, 3, 1)):
+            assert parse_expenses("netflix 45 wczoraj")[0]["date"] == "2026-02-28"
+        assert mock_client.chat.completions.create.call_count == 1
+
+    @patch("bot.services.ai_parser.client_ai")
+    def test_calendar_dates_bypass_cache(self, mock_client):
+        mock_client.chat.completions.create.return_value = self._reply("2026-02-15")
+
+        parse_expenses("netflix 45 15.02")
+        parse_expenses("netflix 45 15.02")
+
+        assert mock_client.chat.completions.create.call_count == 2
+        assert parser_stats()["cache_bypassed"] == 2
+
+    @patch("bot.services.ai_parser.client_ai")
+    def test_prompt_version_is_part_of_key(self, mock_client):
+        mock_client.chat.completions.create.return_value = self._reply(str(date.today()))
+
+        parse_expenses("netflix 45")
+        with patch.object(ai_parser, "PROMPT_VERSION", "next"):
+            parse_expenses("netflix 45")
+
+        assert mock_client.chat.completions.create.call_count == 2
+
+    @patch("bot.services.ai_parser.client_ai")
+    def test_hints_are_part_of_key(self, mock_client):
+        mock_client.chat.completions.create.return_value = self._reply(str(date.today()))
+        hints = [("netflix", "Rozrywka", "Subskrypcje")]
+
+        parse_expenses("netflix 45")
+        parse_expenses("netflix 45", hints)
+        parse_expenses("netflix 45", list(hints))
+
+        assert mock_client.chat.completions.create.call_count == 2
+
+    def test_async_hit_skips_client(self):
+        calls = 0
+
+        async def create(**kwargs):
+            nonlocal calls
+            calls += 1
+            return self._reply(str(date.today()))
+
+        async def run():
+            await parse_expenses_async("netflix 45")
+            return await parse_expenses_async("netflix 45")
+
+        with patch("bot.services.ai_parser.client_ai_async") as mock_client:
+            mock_client.chat.completions.create = create
+            result = asyncio.run(run())
+
+        assert calls == 1
+        assert result[0]["description"] == "netflix"
+
+
+class TestBatching:
+    @pytest.fixture
+    def server(self):
+        with FakeOpenAI(latency=0.05) as server, \
+                patch.object(ai_parser, "AI_BATCH_WINDOW_MS", 50), \
+                patch.object(ai_parser, "AI_BATCH_MAX_SIZE", 4):
+            client = openai.AsyncOpenAI(base_url=server.base_url, api_key="test", max_retries=0)
+            with patch("bot.services.ai_parser.client_ai_async", client):
+                yield server
+
+    def test_burst_is_sent_as_one_request(self, server):
+        async def run():
+            return await asyncio.gather(
+                parse_expenses_async("biedronka 10"),
+                parse_expenses_async("lidl 20", [("lidl", "Jedzenie", "Jedzenie dom")]),
+                parse_expenses_async("cześć"),
+            )
+
+        results = asyncio.run(run())
+
+        assert len(server.requests) == 1
+        request = server.requests[0]
+        assert request["response_format"]["json_schema"]["name"] == "expense_batch"
+        assert request["messages"][0]["content"] == ai_parser.STATIC_PROMPT
+        assert "lidl" not in request["messages"][1]["content"]
+        payload = json.loads(request["messages"][2]["content"])
+        assert [m.get("hints") for m in payload] == [None, "lidl → 1.1", None]
+        assert [[e["amount"] for e in r] for r in results] == [[10.0], [20.0], []]
+        assert results[1][0]["description"] == "lidl"
+        stats = parser_stats()
+        assert (stats["batches"], stats["batched_messages"], stats["requests"]) == (1, 3, 1)
+
+    def test_full_batch_is_sent_early(self, server):
+        async def run():
+            return await asyncio.gather(*(parse_expenses_async(f"sklep {i}") for i in range(1, 7)))
+
+        results = asyncio.run(run())
+
+        assert [len(r) for r in results] == [1] * 6
+        sizes = sorted(len(json.loads(r["messages"][-1]["content"])) for r in server.requests)
+        assert sizes == [2, 4]
+
+    def test_lone_message_uses_single_request(self, server):
+        result = asyncio.run(parse_expenses_async("biedronka 10"))
+
+        assert result[0]["amount"] == 10.0
+        assert server.requests[0]["response_format"]["json_schema"]["name"] == "expenses"
+        assert parser_stats()["batches"] == 0
+
+    def test_missing_result_fails_only_that_message(self, server):
+        original = server.reply
+
+        def drop_second(body):
+            content, count = original(body)
+            data = json.loads(content)
+            data["results"] = [r for r in data["results"] if r["id"] != 1]
+            return json.dumps(data), count
+
+        server.reply = drop_second
+
+        async def run():
+            return await asyncio.gather(
+                parse_expenses_async("biedronka 10"),
+                parse_expenses_async("lidl 20"),
+                return_exceptions=True,
+            )
+
+        first, second = asyncio.run(run())
+        assert first[0]["amount"] == 10.0
+        assert isinstance(second, ValueError)
+
+    def test_request_error_reaches_every_caller(self, server):
+        server.rate_limit = 0
+
+        async def run():
+            return await asyncio.gather(
+                parse_expenses_async("biedronka 10"),
+                parse_expenses_async("lidl 20"),
+                return_exceptions=True,
+            )
+
+        with patch.object(ai_parser, "AI_MAX_RETRIES", 1):
+            results = asyncio.run(run())
+
+        assert all(isinstance(r, openai.RateLimitError) for r in results)
+        assert len(server.requests) == 2
@@ -0,0 +1,142 @@
+"""Tests for the confirm/cancel/edit callback handler."""
+
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from bot.categories import CATEGORIES, CATEGORY_NAMES
+from bot.handlers.callbacks import handle_callback
+from bot.i18n import t
+from bot.services import storage
+
+USER_ID = 12345
+EXPENSE = {"amount": 20.0, "date": "2026-02-15", "category": "Jedzenie",
+           "subcategory": "Jedzenie dom", "description": "chleb"}
+
+
+@pytest.fixture(autouse=True)
+def file_storage(tmp_path):
+    # A file, so parallel threads really use separate connections
+    storage.DB_PATH = str(tmp_path / "state.db")
+    storage._init_db()
+    yield
+    storage.close()
+    storage.DB_PATH = ":memory:"
+    storage._init_db()
+
+
+class _Query:
+    def __init__(self, data: str, user_id: int = USER_ID):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id, full_name="Test")
+        self.texts = []
+        self.alerts = []
+
+    async def answer(self, text=None, show_alert=False):
+        if text:
+            self.alerts.append(text)
+
+    async def edit_message_text(self, text, reply_markup=None, parse_mode=None):
+        self.texts.append(text)
+
+
+def _tap(query: _Query) -> _Query:
+    asyncio.run(handle_callback(SimpleNamespace(callback_query=query), SimpleNamespace()))
+    return query
+
+
+def _tap_in_parallel(queries: list[_Query]) -> None:
+    """Each tap in its own thread and event loop, like separate bot replicas."""
+    barrier = threading.Barrier(len(queries))
+
+    def worker(query):
+        barrier.wait()
+        _tap(query)
+        storage.close()
+
+    threads = [threading.Thread(target=worker, args=(q,)) for q in queries]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _pending(items: int = 1) -> dict:
+    return {"user_id": USER_ID, "expenses": [dict(EXPENSE) for _ in range(items)], "original_text": "chleb 20"}
+
+
+@patch("bot.services.fast_parser.learn")
+@patch("bot.services.database.is_available", return_value=False)
+class TestConfirm:
+    def test_parallel_confirms_save_once(self, mock_db, mock_learn):
+        saves = []
+        with patch("bot.services.sheets.save_expenses_to_sheet",
+                   side_effect=lambda expenses, text: saves.append(expenses) or [2]):
+            for round_no in range(10):
+                storage.save_pending(f"e{round_no}", _pending())
+                queries = [_Query(f"confirm:e{round_no}") for _ in range(6)]
+                _tap_in_parallel(queries)
+
+                assert len(saves) == round_no + 1
+                outcomes = [q.texts[-1] for q in queries]
+                assert outcomes.count(t("expense_expired")) == 5
+
+    def test_learns_only_after_save(self, mock_db, mock_learn):
+        storage.save_pending("e", _pending())
+        with patch("bot.services.sheets.save_expenses_to_sheet", side_effect=Exception("quota")):
+            query = _tap(_Query("confirm:e"))
+
+        assert query.texts == [t("save_error")]
+        mock_learn.assert_not_called()
+
+        storage.save_pending("e", _pending())
+        with patch("bot.services.sheets.save_expenses_to_sheet", return_value=[2]):
+            _tap(_Query("confirm:e"))
+        mock_learn.assert_called_once()
+
+    def test_sheets_only_save_runs_off_the_event_loop(self, mock_db, mock_learn):
+        storage.save_pending("e", _pending())
+        threads = []
+        with patch("bot.services.sheets.save_expenses_to_sheet",
+                   side_effect=lambda expenses, text: threads.append(threading.current_thread()) or [2]):
+            _tap(_Query("confirm:e"))
+
+        assert threads and threads[0] is not threading.current_thread()
+
+    def test_other_user_does_not_consume(self, mock_db, mock_learn):
+        storage.save_pending("e", _pending())
+
+        query = _tap(_Query("confirm:e", user_id=999))
+
+        assert query.alerts == [t("not_your_expense")]
+        assert storage.get_pending("e") is not None
+
+
+@patch("bot.handlers.callbacks.build_preview_text", return_value="preview")
+class TestCategoryEdit:
+    def _sub_data(self, item_idx: int, cat_idx: int) -> str:
+        return f"sub:e:{item_idx}:{cat_idx}:0"
+
+    def test_parallel_edits_of_different_items_all_kept(self, mock_preview):
+        items = 6
+        storage.save_pending("e", _pending(items))
+        cat_idx = CATEGORY_NAMES.index("Rozrywka")
+
+        _tap_in_parallel([_Query(self._sub_data(i, cat_idx)) for i in range(items)])
+
+        expenses = storage.get_pending("e")["expenses"]
+        assert [e["category"] for e in expenses] == ["Rozrywka"] * items
+        assert {e["subcategory"] for e in expenses} == {CATEGORIES["Rozrywka"][0]}
+
+    def test_edit_after_confirm_does_not_resurrect(self, mock_preview):
+        storage.save_pending("e", _pending())
+        _, version = storage.get_pending_entry("e")
+        storage.pop_pending("e")
+
+        with patch("bot.services.storage.get_pending_entry", side_effect=[(_pending(), version), None]):
+            query = _tap(_Query(self._sub_data(0, 0)))
+
+        assert query.texts == [t("expense_expired")]
+        assert storage.get_pending("e") is None
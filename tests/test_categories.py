@@ -5,9 +5,11 @@ from bot.categories import (
     CATEGORY_NAMES,
     CATEGORY_EMOJIS,
     CATEGORIES_CONTEXT,
+    CATEGORIES_CODES_CONTEXT,
     CATEGORIES_DISPLAY,
     build_categories_context,
     build_categories_display,
+    SUBCATEGORY_CODES,
 )
 
 
@@ -37,3 +39,13 @@ class TestCategories:
         for cat in CATEGORY_NAMES:
             assert cat in CATEGORIES_CONTEXT
             assert cat in CATEGORIES_DISPLAY
+
+    def test_every_subcategory_has_a_code(self):
+        pairs = {(cat, sub) for cat, subs in CATEGORIES.items() for sub in subs}
+        assert set(SUBCATEGORY_CODES.values()) == pairs
+        assert len(SUBCATEGORY_CODES) == len(pairs)
+        assert SUBCATEGORY_CODES["1.1"] == (CATEGORY_NAMES[0], CATEGORIES[CATEGORY_NAMES[0]][0])
+
+    def test_codes_context_lists_codes(self):
+        for code, (cat, sub) in SUBCATEGORY_CODES.items():
+            assert f"{code} {sub}" in CATEGORIES_CODES_CONTEXT
@@ -1,7 +1,8 @@
 """Tests for chart generation."""
 
+from datetime import date
 from io import BytesIO
-from bot.utils.formatting import generate_pie_chart, generate_bar_chart
+from bot.utils.formatting import generate_pie_chart, generate_bar_chart, bar_chart_data
 
 
 class TestPieChart:
@@ -41,3 +42,17 @@ class TestBarChart:
         buf = generate_bar_chart(data, "Partial")
         content = buf.read()
         assert content[:4] == b"\x89PNG"
+
+
+class TestBarChartData:
+    def test_newest_month_first_and_zeros_dropped(self):
+        trend = {
+            "months": [date(2025, 12, 1), date(2026, 1, 1)],
+            "categories": ["Jedzenie", "Transport"],
+            "matrix": [[100.0, 0.0], [50.0, 20.0]],
+            "totals": [100.0, 70.0],
+        }
+        assert bar_chart_data(trend) == {
+            "Styczeń": {"Jedzenie": 50.0, "Transport": 20.0},
+            "Grudzień": {"Jedzenie": 100.0},
+        }
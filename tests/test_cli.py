@@ -1,5 +1,6 @@
 """Tests for the CLI interface."""
 
+import json
 import sys
 from datetime import date, datetime
 from unittest.mock import patch, MagicMock
@@ -20,6 +21,7 @@ from bot.cli import (
     _resolve_month,
     _build_progress_bar,
     _calculate_next_due,
+    _check_budgets,
     _format_expense_list,
     cmd_categories,
     cmd_add,
@@ -31,8 +33,11 @@ from bot.cli import (
     cmd_undo,
     cmd_lang,
     cmd_sync,
+    cmd_import_sheets,
     cmd_income,
     cmd_balance,
+    cmd_stats,
+    cmd_rollup,
     main,
 )
 
@@ -339,6 +344,48 @@ class TestCmdAdd:
         out = capsys.readouterr().out
         assert "Saved 1 expense" in out
 
+    @patch("bot.services.ai_parser.parse_expenses")
+    @patch("bot.services.database.is_available", return_value=False)
+    @patch("bot.services.sheets.save_expenses_to_sheet", return_value=[10])
+    @patch("bot.services.storage.save_last_saved")
+    def test_simple_text_skips_ai(self, mock_save_last, mock_sheets_save, mock_db_avail, mock_parse, capsys):
+        parser = build_parser()
+        args = parser.parse_args(["add", "-y", "biedronka", "50"])
+        result = cmd_add(args)
+
+        assert result == 0
+        mock_parse.assert_not_called()
+        saved = mock_sheets_save.call_args[0][0]
+        assert saved[0]["subcategory"] == "Jedzenie dom"
+
+    @patch("bot.services.database.get_budget_status", return_value=[])
+    @patch("bot.services.sync.sync_saved_expenses", return_value=[10])
+    @patch("bot.services.database.save_expenses", return_value=[7])
+    @patch("bot.services.database.get_or_create_user", return_value=1)
+    @patch("bot.services.database.is_available", return_value=True)
+    @patch("bot.services.storage.save_last_saved")
+    def test_db_save_syncs_saved_ids(
+        self, mock_save_last, mock_db_avail, mock_user, mock_save, mock_sync, mock_budget, capsys
+    ):
+        args = build_parser().parse_args(["add", "-y", "biedronka", "50"])
+        result = cmd_add(args)
+
+        assert result == 0
+        ids, expenses, text = mock_sync.call_args[0]
+        assert ids == [7]
+        assert expenses[0]["description"] == "biedronka"
+        assert text == "biedronka 50"
+
+    @patch("bot.services.fast_parser.learn")
+    @patch("bot.services.database.is_available", return_value=False)
+    @patch("bot.services.sheets.save_expenses_to_sheet", side_effect=Exception("quota"))
+    def test_failed_save_is_not_learned(self, mock_sheets_save, mock_db_avail, mock_learn, capsys):
+        args = build_parser().parse_args(["add", "-y", "biedronka", "50"])
+        result = cmd_add(args)
+
+        assert result == 1
+        mock_learn.assert_not_called()
+
     @patch("bot.services.ai_parser.parse_expenses", return_value=[])
     def test_add_no_expense_found(self, mock_parse, capsys):
         parser = build_parser()
@@ -349,6 +396,10 @@ class TestCmdAdd:
 
 
 class TestCmdSummary:
+    @pytest.fixture(autouse=True)
+    def fresh_state(self):
+        bot.services.storage._init_db()
+
     @patch("bot.services.database.is_available", return_value=False)
     @patch(
         "bot.services.sheets.get_all_rows",
@@ -373,6 +424,28 @@ class TestCmdSummary:
         assert "Luty" in out
         assert "170.00" in out
 
+    @patch("bot.services.database.is_available", return_value=True)
+    @patch("bot.services.database.get_or_create_user", return_value=1)
+    @patch(
+        "bot.services.database.get_category_totals",
+        return_value=[
+            {"category": "Rozrywka", "subcategory": "Siłownia / Basen", "total": 120.0, "count": 1},
+            {"category": "Jedzenie", "subcategory": "Jedzenie dom", "total": 50.0, "count": 2},
+        ],
+    )
+    def test_summary_from_database_aggregates(self, mock_totals, mock_user, mock_avail, capsys):
+        parser = build_parser()
+        args = parser.parse_args(["--json", "summary", "luty"])
+        result = cmd_summary(args)
+
+        assert result == 0
+        data = json.loads(capsys.readouterr().out)
+        assert data["total"] == 170.0
+        assert data["count"] == 3
+        assert data["categories"][0]["name"] == "Rozrywka"
+        _, start, end = mock_totals.call_args[0]
+        assert (start.month, end.month) == (2, 3)
+
     @patch("bot.services.database.is_available", return_value=False)
     @patch("bot.services.sheets.get_all_rows", return_value=[])
     def test_summary_no_data(self, mock_sheets, mock_db, capsys):
@@ -434,6 +507,7 @@ class TestCmdSearch:
                 "category": "Jedzenie",
                 "subcategory": "Jedzenie dom",
                 "description": "biedronka zakupy",
+                "total_count": 1,
             }
         ],
     )
@@ -446,6 +520,24 @@ class TestCmdSearch:
         out = capsys.readouterr().out
         assert "biedronka" in out
 
+    @patch("bot.services.database.is_available", return_value=True)
+    @patch("bot.services.database.get_or_create_user", return_value=1)
+    @patch("bot.services.database.search_expenses", return_value=[])
+    def test_search_filters_and_page_passed_to_sql(self, mock_search, mock_user, mock_avail):
+        parser = build_parser()
+        args = parser.parse_args(["search", "kino", "--min", "20", "--from", "2026-01-01", "--page", "3"])
+        assert cmd_search(args) == 0
+
+        mock_search.assert_called_once_with(
+            1, "kino", limit=20, offset=40, min_amount=20.0, max_amount=None,
+            start="2026-01-01", end=None,
+        )
+
+    def test_search_bad_date(self, capsys):
+        with patch("bot.services.database.is_available", return_value=True):
+            args = build_parser().parse_args(["search", "kino", "--to", "jutro"])
+            assert cmd_search(args) == 1
+
     @patch("bot.services.database.is_available", return_value=True)
     @patch("bot.services.database.get_or_create_user", return_value=1)
     @patch("bot.services.database.search_expenses", return_value=[])
@@ -602,9 +694,17 @@ class TestCmdLang:
         assert "Polski" in out
 
 
+def _sync_result(synced, remaining=0, error=None):
+    return {
+        "synced": synced, "recovered": 0, "chunks": 1 if synced else 0,
+        "elapsed": 0.1, "rows_per_sec": synced * 10.0,
+        "remaining": remaining, "error": error,
+    }
+
+
 class TestCmdSync:
     @patch("bot.services.database.is_available", return_value=True)
-    @patch("bot.services.sync.sync_unsynced_to_sheets", return_value=3)
+    @patch("bot.services.sync.run_sync", return_value=_sync_result(3))
     def test_sync_with_data(self, mock_sync, mock_avail, capsys):
         parser = build_parser()
         args = parser.parse_args(["sync"])
@@ -613,9 +713,10 @@ class TestCmdSync:
         assert result == 0
         out = capsys.readouterr().out
         assert "Synced 3 expenses" in out
+        assert "30.0 rows/s" in out
 
     @patch("bot.services.database.is_available", return_value=True)
-    @patch("bot.services.sync.sync_unsynced_to_sheets", return_value=0)
+    @patch("bot.services.sync.run_sync", return_value=_sync_result(0))
     def test_sync_nothing(self, mock_sync, mock_avail, capsys):
         parser = build_parser()
         args = parser.parse_args(["sync"])
@@ -625,6 +726,45 @@ class TestCmdSync:
         out = capsys.readouterr().out
         assert "Nothing to sync" in out
 
+    @patch("bot.services.database.is_available", return_value=True)
+    @patch("bot.services.sync.run_sync", return_value=_sync_result(2, remaining=5, error="429"))
+    def test_sync_reports_backlog_and_error(self, mock_sync, mock_avail, capsys):
+        parser = build_parser()
+        args = parser.parse_args(["--json", "sync", "--chunk-size", "2"])
+        result = cmd_sync(args)
+
+        assert result == 1
+        data = json.loads(capsys.readouterr().out)
+        assert data["remaining"] == 5
+        assert data["error"] == "429"
+        mock_sync.assert_called_once_with(chunk_size=2)
+
+
+class TestCmdImportSheets:
+    @patch("bot.services.database.is_available", return_value=True)
+    @patch("bot.services.database.get_or_create_user", return_value=1)
+    @patch("bot.services.importer.import_from_sheets")
+    def test_reports_throughput_and_reasons(self, mock_import, mock_user, mock_avail, capsys):
+        mock_import.return_value = {
+            "imported": 120, "duplicates": 3, "skipped": {"duplicate": 3, "bad_date": 1},
+            "skipped_rows": [(7, "bad_date", "15.02.2026")], "rows": 125, "pages": 1,
+            "elapsed": 0.5, "rows_per_sec": 250.0, "resumed_from": None,
+        }
+        parser = build_parser()
+        args = parser.parse_args(["--json", "import-sheets", "--page-size", "100", "--restart"])
+        result = cmd_import_sheets(args)
+
+        assert result == 0
+        mock_import.assert_called_once()
+        _, kwargs = mock_import.call_args
+        assert kwargs["page_size"] == 100
+        assert kwargs["resume"] is False
+        data = json.loads(capsys.readouterr().out)
+        assert data["imported"] == 120
+        assert data["skipped"] == 4
+        assert data["skipped_reasons"]["bad_date"] == 1
+        assert data["skipped_rows"][0]["row"] == 7
+
 
 class TestCmdIncome:
     @patch("bot.services.sheets.save_income_to_sheet")
@@ -650,8 +790,8 @@ class TestCmdIncome:
 class TestCmdBalance:
     @patch("bot.services.database.is_available", return_value=True)
     @patch("bot.services.database.get_or_create_user", return_value=1)
-    @patch("bot.services.database.get_expenses_by_month", return_value=[])
-    @patch("bot.services.database.get_income_by_month", return_value=[])
+    @patch("bot.services.database.get_category_totals", return_value=[])
+    @patch("bot.services.database.get_income_total", return_value=0.0)
     def test_balance_no_data(self, mock_inc, mock_exp, mock_user, mock_avail, capsys):
         parser = build_parser()
         args = parser.parse_args(["balance"])
@@ -664,13 +804,10 @@ class TestCmdBalance:
     @patch("bot.services.database.is_available", return_value=True)
     @patch("bot.services.database.get_or_create_user", return_value=1)
     @patch(
-        "bot.services.database.get_expenses_by_month",
-        return_value=[{"amount": 1000.0}],
-    )
-    @patch(
-        "bot.services.database.get_income_by_month",
-        return_value=[{"amount": 5000.0}],
+        "bot.services.database.get_category_totals",
+        return_value=[{"category": "Dom", "subcategory": "Czynsz", "total": 1000.0, "count": 1}],
     )
+    @patch("bot.services.database.get_income_total", return_value=5000.0)
     def test_balance_with_data(self, mock_inc, mock_exp, mock_user, mock_avail, capsys):
         parser = build_parser()
         args = parser.parse_args(["balance"])
@@ -683,6 +820,82 @@ class TestCmdBalance:
         assert "4000.00" in out
 
 
+class TestCmdStats:
+    @patch("bot.services.database.is_available", return_value=True)
+    @patch("bot.services.database.get_or_create_user", return_value=1)
+    @patch("bot.services.database.get_monthly_trend")
+    def test_single_trend_query(self, mock_trend, mock_user, mock_avail, capsys):
+        mock_trend.return_value = {
+            "months": [date(2025, 12, 1), date(2026, 1, 1)],
+            "categories": ["Jedzenie"],
+            "matrix": [[100.0], [60.0]],
+            "totals": [100.0, 60.0],
+        }
+        parser = build_parser()
+        args = parser.parse_args(["--json", "stats", "2"])
+        result = cmd_stats(args)
+
+        assert result == 0
+        mock_trend.assert_called_once()
+        _, first, last = mock_trend.call_args[0]
+        assert first.day == 1 and last.day == 1
+        data = json.loads(capsys.readouterr().out)
+        trend = data["monthly_trend"]
+        assert [(m["month"], m["year"]) for m in trend] == [("Grudzień", 2025), ("Styczeń", 2026)]
+        assert trend[1]["vs_previous"] == -40.0
+
+
+class TestCheckBudgets:
+    @patch("bot.services.database.get_budget_status")
+    def test_one_status_query_for_all_budgets(self, mock_status):
+        mock_status.return_value = [
+            {"id": 1, "category": None, "monthly_limit": 1000.0, "used": 500.0, "pct": 50.0},
+            {"id": 2, "category": "Jedzenie", "monthly_limit": 200.0, "used": 170.0, "pct": 85.0},
+            {"id": 3, "category": "Transport", "monthly_limit": 100.0, "used": 120.0, "pct": 120.0},
+        ]
+        warnings = _check_budgets(1, [{"date": "2026-02-15"}])
+
+        mock_status.assert_called_once_with(1, 2026, 2)
+        assert len(warnings) == 2
+        assert "Jedzenie" in warnings[0]
+        assert "Transport" in warnings[1]
+
+    @patch("bot.services.database.get_budget_status", return_value=[])
+    def test_uses_the_expense_year(self, mock_status):
+        _check_budgets(1, [{"date": "2025-12-30"}])
+        mock_status.assert_called_once_with(1, 2025, 12)
+
+
+class TestCmdRollup:
+    @patch("bot.services.database.is_available", return_value=True)
+    @patch("bot.services.database.verify_monthly_totals", return_value=[])
+    @patch("bot.services.database.rebuild_monthly_totals", return_value=12)
+    def test_rebuild_then_verify(self, mock_rebuild, mock_verify, mock_avail, capsys):
+        args = build_parser().parse_args(["--json", "rollup", "rebuild"])
+        assert cmd_rollup(args) == 0
+        mock_rebuild.assert_called_once()
+        data = json.loads(capsys.readouterr().out)
+        assert data["status"] == "ok"
+        assert data["rows"] == 12
+
+    @patch("bot.services.database.is_available", return_value=True)
+    @patch("bot.services.database.rebuild_monthly_totals")
+    @patch("bot.services.database.verify_monthly_totals")
+    def test_verify_reports_mismatches(self, mock_verify, mock_rebuild, mock_avail, capsys):
+        from decimal import Decimal
+        mock_verify.return_value = [{
+            "user_id": 1, "year": 2026, "month": 2, "category": "Jedzenie",
+            "subcategory": "Jedzenie dom", "expected_total": Decimal("50.00"),
+            "rollup_total": Decimal("1.00"), "expected_count": 1, "rollup_count": 1,
+        }]
+        args = build_parser().parse_args(["--json", "rollup", "verify"])
+        assert cmd_rollup(args) == 1
+        mock_rebuild.assert_not_called()
+        data = json.loads(capsys.readouterr().out)
+        assert data["status"] == "error"
+        assert data["mismatches"][0]["expected_total"] == 50.0
+
+
 class TestMain:
     @patch("bot.services.database.is_available", return_value=False)
     def test_no_args_shows_help(self, mock_avail, capsys):
@@ -700,3 +913,22 @@ class TestMain:
             assert exc.value.code == 0
         out = capsys.readouterr().out
         assert "Jedzenie" in out
+
+    def test_profile_startup(self, capsys):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:      2000 |       2000 | logging\n"
+            "import time:      5000 |       5000 |   rich.text\n"
+            "import time:      3000 |       8000 | rich.console\n"
+        )
+        finished = MagicMock(returncode=0, stdout="No expenses.\n", stderr=stderr)
+        with patch("sys.argv", ["budzet", "--profile-startup", "last"]), \
+                patch("subprocess.run", return_value=finished) as mock_run:
+            with pytest.raises(SystemExit) as exc:
+                main()
+        assert exc.value.code == 0
+        assert mock_run.call_args[0][0][-3:] == ["-m", "bot.cli", "last"]
+        out = capsys.readouterr().out
+        assert "10 ms importing modules" in out
+        assert "8.0 ms  rich.console" in out
+        assert "8.0 ms  rich\n" in out
@@ -0,0 +1,61 @@
+"""Tests for lazy client construction in bot.config."""
+
+import base64
+import os
+import subprocess
+import sys
+import tempfile
+from unittest.mock import MagicMock, patch
+
+from bot import config
+
+
+class TestLazyClients:
+    def test_import_does_not_load_client_libraries(self):
+        code = "import sys, bot.config; print('openai' in sys.modules, 'gspread' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        assert result.stdout.split() == ["False", "False"]
+
+    def test_client_is_built_on_first_use(self):
+        factory = MagicMock()
+        client = config._LazyClient(factory)
+        factory.assert_not_called()
+
+        client.chat.completions.create(model="x")
+
+        factory.return_value.chat.completions.create.assert_called_once_with(model="x")
+
+    def test_private_probes_do_not_build_client(self):
+        factory = MagicMock()
+        client = config._LazyClient(factory)
+
+        assert not hasattr(client, "_is_coroutine")
+        assert not hasattr(client, "__func__")
+        factory.assert_not_called()
+
+    def test_patching_sheets_client_needs_no_credentials(self, monkeypatch, tmp_path):
+        from bot.services import sheets
+
+        monkeypatch.delenv("GOOGLE_CREDENTIALS_BASE64", raising=False)
+        monkeypatch.chdir(tmp_path)  # No credentials.json here
+        config.get_gspread_client.cache_clear()
+        with patch("bot.services.sheets.gc") as mock_gc:
+            assert sheets.gc is mock_gc
+        assert config.get_gspread_client.cache_info().currsize == 0
+
+
+class TestCredentialsFile:
+    def test_base64_credentials_are_written_once(self, monkeypatch):
+        monkeypatch.setenv("GOOGLE_CREDENTIALS_BASE64", base64.b64encode(b'{"type": "service_account"}').decode())
+        with tempfile.TemporaryDirectory() as tmp, patch.object(tempfile, "tempdir", tmp):
+            path = config.credentials_file()
+            with open(path) as f:
+                assert f.read() == '{"type": "service_account"}'
+            with patch("os.replace") as mock_replace:
+                assert config.credentials_file() == path
+            mock_replace.assert_not_called()
+            assert os.listdir(tmp) == [os.path.basename(path)]
+
+    def test_falls_back_to_local_file(self, monkeypatch):
+        monkeypatch.delenv("GOOGLE_CREDENTIALS_BASE64", raising=False)
+        assert config.credentials_file() == "credentials.json"
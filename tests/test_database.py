@@ -19,13 +19,14 @@ def setup_db():
     from bot.services import database
 
     database.DATABASE_URL = os.environ["TEST_DATABASE_URL"]
-    database._pool.clear()
+    database.close_pool()
 
     # Drop all tables and recreate
     conn = database._get_conn()
     try:
         with conn.cursor() as cur:
             cur.execute("""
+                DROP TABLE IF EXISTS monthly_category_totals CASCADE;
                 DROP TABLE IF EXISTS income CASCADE;
                 DROP TABLE IF EXISTS recurring_expenses CASCADE;
                 DROP TABLE IF EXISTS budgets CASCADE;
@@ -40,7 +41,7 @@ def setup_db():
     database.init_db()
     yield
 
-    database._pool.clear()
+    database.close_pool()
 
 
 @pytest.fixture
@@ -124,6 +125,34 @@ class TestExpenses:
         results = database.search_expenses(user_id, "biedronka")
         assert len(results) == 1
 
+    def test_search_ranking_folding_filters_and_paging(self, user_id):
+        from bot.services import database
+        database.save_expenses(user_id, [
+            {"amount": 12.0, "date": "2026-01-10", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "Żabka"},
+            {"amount": 80.0, "date": "2026-02-10", "category": "Jedzenie",
+             "subcategory": "Jedzenie miasto", "description": "obiad"},
+            {"amount": 30.0, "date": "2026-02-12", "category": "Rozrywka",
+             "subcategory": "Kino", "description": "bilety"},
+        ], "zakupy w żabce i obiad")
+
+        # Diacritics and case folded; words match as prefixes
+        assert [r["description"] for r in database.search_expenses(user_id, "ZABK")] == ["Żabka"]
+        # A description match ranks above a match in the original message only
+        ranked = database.search_expenses(user_id, "obiad")
+        assert ranked[0]["description"] == "obiad"
+        assert ranked[0]["rank"] > ranked[-1]["rank"]
+        # Category names are searched too
+        assert [r["description"] for r in database.search_expenses(user_id, "kino")] == ["bilety"]
+
+        filtered = database.search_expenses(user_id, "jedzenie", min_amount=50, start="2026-02-01")
+        assert [r["description"] for r in filtered] == ["obiad"]
+
+        page = database.search_expenses(user_id, "zakupy", limit=2, offset=2)
+        assert len(page) == 1
+        assert page[0]["total_count"] == 3
+        assert database.search_expenses(user_id, "!!") == []
+
     def test_get_recent_expenses(self, user_id):
         from bot.services import database
         for i in range(15):
@@ -148,6 +177,177 @@ class TestExpenses:
         unsynced = database.get_unsynced_expenses()
         assert not any(r["id"] == eid for r in unsynced)
 
+    def test_bulk_sync_marking(self, user_id):
+        from bot.services import database
+        ids = [
+            database.save_expense(user_id, {
+                "amount": 10.0 + i, "date": "2026-02-15", "category": "Jedzenie",
+                "subcategory": "Jedzenie dom", "description": f"bulk {i}",
+            }, "test")
+            for i in range(3)
+        ]
+        first = database.get_unsynced_expenses(limit=2)
+        assert [r["id"] for r in first] == ids[:2]
+        assert database.count_unsynced_expenses() == 3
+
+        database.mark_synced_bulk([(ids[0], 100), (ids[1], 101)])
+        assert database.count_unsynced_expenses() == 1
+        assert [r["id"] for r in database.get_unsynced_expenses()] == [ids[2]]
+
+    def test_sheets_sync_lock_and_filter_unsynced(self, user_id):
+        import threading
+        import time
+        from bot.services import database
+        ids = database.save_expenses(user_id, [
+            {"amount": 10.0 + i, "date": "2026-02-15", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": f"lock {i}"}
+            for i in range(2)
+        ], "test")
+        database.mark_synced_bulk([(ids[0], 5)])
+        assert database.filter_unsynced(ids) == {ids[1]}
+        assert database.filter_unsynced([]) == set()
+
+        entered = threading.Event()
+
+        def other_holder():
+            with database.sheets_sync_lock():
+                entered.set()
+
+        with database.sheets_sync_lock():
+            thread = threading.Thread(target=other_holder)
+            thread.start()
+            time.sleep(0.2)
+            assert not entered.is_set()
+        thread.join(timeout=5)
+        assert entered.is_set()
+
+        with database.sheets_sync_lock() as conn:
+            assert database.filter_unsynced(ids, conn=conn) == {ids[1]}
+            busy = []
+
+            def try_lock():
+                with database.sheets_sync_lock(wait=False) as other:
+                    busy.append(other)
+
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join(timeout=5)
+            assert busy == [None]
+
+        with database.sheets_sync_lock(wait=False) as conn:
+            assert conn is not None
+
+    def test_save_expenses_keeps_input_order(self, user_id):
+        from bot.services import database
+        expenses = [
+            {"amount": float(a), "date": "2026-02-15", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": f"item {a}"}
+            for a in (30, 10, 20)
+        ]
+        ids = database.save_expenses(user_id, expenses, "batch")
+        assert len(ids) == 3
+        rows = {r["id"]: r for r in database.get_recent_expenses(user_id, limit=10)}
+        assert [rows[i]["description"] for i in ids] == ["item 30", "item 10", "item 20"]
+
+    def test_save_expenses_is_atomic(self, user_id):
+        from bot.services import database
+        expenses = [
+            {"amount": 10.0, "date": "2026-02-15", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "ok"},
+            {"amount": "not a number", "date": "2026-02-15", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "bad"},
+        ]
+        with pytest.raises(Exception):
+            database.save_expenses(user_id, expenses, "batch")
+        assert database.get_recent_expenses(user_id, limit=10) == []
+
+    def test_content_hash_matches_importer(self, user_id):
+        from bot.services import database
+        from bot.services.importer import content_hash
+        expense = {"amount": 50.5, "date": "2026-02-15", "category": "Jedzenie",
+                   "subcategory": "Jedzenie dom", "description": "żabka"}
+        eid = database.save_expense(user_id, expense, "test")
+        row = database._execute("SELECT content_hash FROM expenses WHERE id = %s", (eid,), fetchone=True)
+        assert row[0] == content_hash(expense)
+
+    def test_content_hash_ignores_datestyle(self, user_id):
+        from bot.services import database
+        from bot.services.importer import content_hash
+        expense = {"amount": 7.0, "date": "2026-02-05", "category": "Jedzenie",
+                   "subcategory": "Jedzenie dom", "description": "bułki"}
+        with database._connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL DateStyle = 'SQL, DMY'")
+                cur.execute(
+                    """INSERT INTO expenses (user_id, amount, date, category, subcategory, description)
+                       VALUES (%s, %s, %s, %s, %s, %s) RETURNING content_hash""",
+                    (user_id, expense["amount"], expense["date"], expense["category"],
+                     expense["subcategory"], expense["description"]),
+                )
+                stored = cur.fetchone()[0]
+            conn.commit()
+        assert stored == content_hash(expense)
+
+    def test_import_sheet_expenses_dedups(self, user_id):
+        from bot.services import database
+        from bot.services.importer import content_hash
+        coffee = {"amount": 12.0, "date": "2026-02-15", "category": "Jedzenie",
+                  "subcategory": "Jedzenie miasto", "description": "kawa"}
+        database.save_expense(user_id, coffee, "kawa 12")
+        h = content_hash(coffee)
+        rows = [(h, 1, coffee, "", 2), (h, 2, coffee, "", 3)]
+
+        assert database.import_sheet_expenses(user_id, rows) == [2]
+        assert database.import_sheet_expenses(user_id, rows) == [2, 3]
+        assert len(database.get_recent_expenses(user_id, limit=10)) == 2
+        assert database.count_unsynced_expenses() == 1
+
+    def test_category_totals(self, user_id):
+        from bot.services import database
+        database.save_expenses(user_id, [
+            {"amount": 50.0, "date": "2026-02-15", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "a"},
+            {"amount": 20.0, "date": "2026-02-16", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "b"},
+            {"amount": 30.0, "date": "2026-02-28", "category": "Jedzenie",
+             "subcategory": "Jedzenie miasto", "description": "c"},
+            {"amount": 99.0, "date": "2026-03-01", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "march"},
+            {"amount": 77.0, "date": "2025-02-10", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "last year"},
+        ], "test")
+
+        rows = database.get_category_totals(user_id, date(2026, 2, 1), date(2026, 3, 1))
+        assert [(r["subcategory"], r["total"], r["count"]) for r in rows] == [
+            ("Jedzenie dom", 70.0, 2), ("Jedzenie miasto", 30.0, 1),
+        ]
+
+        rolled = database.get_category_totals(user_id, date(2026, 2, 1), date(2026, 3, 1), rollup=True)
+        grand = [r for r in rolled if r["category"] is None]
+        per_cat = [r for r in rolled if r["category"] and r["subcategory"] is None]
+        assert grand[0]["total"] == 100.0 and grand[0]["count"] == 3
+        assert per_cat[0]["total"] == 100.0
+        assert database.fold_category_totals(rolled)[:2] == (100.0, 3)
+
+    def test_monthly_trend_is_dense_and_year_exact(self, user_id):
+        from bot.services import database
+        database.save_expenses(user_id, [
+            {"amount": 10.0, "date": "2025-12-05", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "a"},
+            {"amount": 40.0, "date": "2026-02-15", "category": "Transport",
+             "subcategory": "Paliwo", "description": "b"},
+            {"amount": 5.0, "date": "2026-02-16", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "c"},
+            {"amount": 999.0, "date": "2025-02-16", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "previous year"},
+        ], "test")
+
+        trend = database.get_monthly_trend(user_id, date(2025, 12, 1), date(2026, 2, 20))
+        assert trend["months"] == [date(2025, 12, 1), date(2026, 1, 1), date(2026, 2, 1)]
+        assert trend["categories"] == ["Transport", "Jedzenie"]
+        assert trend["matrix"] == [[0.0, 10.0], [0.0, 0.0], [40.0, 5.0]]
+        assert trend["totals"] == [10.0, 0.0, 45.0]
+
     def test_get_expenses_by_date_range(self, user_id):
         from bot.services import database
         database.save_expense(user_id, {
@@ -184,14 +384,34 @@ class TestBudgets:
         budgets = database.get_budgets(user_id)
         assert any(b["category"] is None for b in budgets)
 
-    def test_budget_usage(self, user_id):
+    def test_budget_status(self, user_id):
         from bot.services import database
-        database.save_expense(user_id, {
-            "amount": 100.0, "date": "2026-02-15", "category": "Jedzenie",
-            "subcategory": "Jedzenie dom", "description": "test",
-        }, "test")
-        usage = database.get_budget_usage(user_id, "Jedzenie", "Luty")
-        assert usage == 100.0
+        database.set_budget(user_id, None, 1000.0)
+        database.set_budget(user_id, "Jedzenie", 200.0)
+        database.set_budget(user_id, "Transport", 0)
+        database.save_expenses(user_id, [
+            {"amount": 150.0, "date": "2026-02-15", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "a"},
+            {"amount": 50.0, "date": "2026-02-16", "category": "Jedzenie",
+             "subcategory": "Restauracje", "description": "b"},
+            {"amount": 100.0, "date": "2026-02-17", "category": "Rozrywka",
+             "subcategory": "Kino", "description": "c"},
+            {"amount": 999.0, "date": "2026-01-17", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "d"},
+        ], "test")
+
+        status = database.get_budget_status(user_id, 2026, 2)
+        assert [(b["category"], b["monthly_limit"], b["used"], b["pct"]) for b in status] == [
+            (None, 1000.0, 300.0, 30.0),
+            ("Jedzenie", 200.0, 200.0, 100.0),
+            ("Transport", 0.0, 0.0, 0),
+        ]
+        # Same month of another year is not counted
+        assert [b["used"] for b in database.get_budget_status(user_id, 2025, 2)] == [0.0, 0.0, 0.0]
+
+    def test_budget_status_without_budgets(self, user_id):
+        from bot.services import database
+        assert database.get_budget_status(user_id, 2026, 2) == []
 
     def test_delete_budget(self, user_id):
         from bot.services import database
@@ -262,6 +482,28 @@ class TestRecurring:
         assert len(due) == 0
 
 
+    def test_save_recurring_expenses_advances_next_due(self, user_id):
+        from bot.services import database
+        rid = database.add_recurring(user_id, {
+            "amount": 120.0,
+            "category": "Rozrywka",
+            "subcategory": "Siłownia / Basen",
+            "description": "silownia",
+            "frequency": "monthly",
+            "day_of_month": 1,
+            "next_due": "2026-02-01",
+        })
+        ids = database.save_recurring_expenses([(
+            rid, user_id,
+            {"amount": 120.0, "date": "2026-02-26", "category": "Rozrywka",
+             "subcategory": "Siłownia / Basen", "description": "silownia"},
+            "recurring: silownia", date(2026, 3, 1),
+        )])
+        assert len(ids) == 1
+        assert database.get_due_recurring(date(2026, 2, 26)) == []
+        assert len(database.get_recent_expenses(user_id, limit=10)) == 1
+
+
 class TestIncome:
     def test_save_income(self, user_id):
         from bot.services import database
@@ -275,9 +517,129 @@ class TestIncome:
         assert len(income) == 1
         assert float(income[0]["amount"]) == 5000.0
 
+    def test_get_income_total(self, user_id):
+        from bot.services import database
+        database.save_income(user_id, 5000.0, "wyplata", "2026-02-15", "pensja")
+        database.save_income(user_id, 300.0, "zwrot", "2026-02-20", "zwrot")
+        database.save_income(user_id, 100.0, "inne", "2026-03-01", "marzec")
+        assert database.get_income_total(user_id, date(2026, 2, 1), date(2026, 3, 1)) == 5300.0
+
     def test_delete_income(self, user_id):
         from bot.services import database
         iid = database.save_income(user_id, 5000.0, "wyplata", "2026-02-15", "pensja")
         database.delete_income(iid)
         income = database.get_income_by_month(user_id, "Luty")
         assert len(income) == 0
+
+
+class TestMonthRange:
+    def test_past_month_is_this_year(self):
+        from bot.services import database
+        assert database.month_range("Luty", date(2026, 10, 17)) == (date(2026, 2, 1), date(2026, 3, 1))
+
+    def test_later_month_is_last_year(self):
+        from bot.services import database
+        assert database.month_range("Grudzień", date(2026, 10, 17)) == (date(2025, 12, 1), date(2026, 1, 1))
+
+
+class TestShiftMonth:
+    def test_across_year_boundaries(self):
+        from bot.services import database
+        assert database.shift_month(date(2026, 1, 1), -1) == date(2025, 12, 1)
+        assert database.shift_month(date(2026, 11, 1), 3) == date(2027, 2, 1)
+        assert database.shift_month(date(2026, 3, 1), -23) == date(2024, 4, 1)
+
+
+class TestMonthlyRollup:
+    def _rollup(self, user_id):
+        from bot.services import database
+        return database._execute(
+            """SELECT year, month, category, subcategory, total::float, count
+               FROM monthly_category_totals WHERE user_id = %s ORDER BY 1, 2, 3, 4""",
+            (user_id,), fetch=True,
+        )
+
+    def test_maintained_on_write(self, user_id):
+        from bot.services import database
+        ids = database.save_expenses(user_id, [
+            {"amount": 50.0, "date": "2026-02-15", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "a"},
+            {"amount": 20.0, "date": "2026-02-16", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "b"},
+            {"amount": 30.0, "date": "2026-03-01", "category": "Transport",
+             "subcategory": "Paliwo", "description": "c"},
+        ], "test")
+        assert self._rollup(user_id) == [
+            (2026, 2, "Jedzenie", "Jedzenie dom", 70.0, 2),
+            (2026, 3, "Transport", "Paliwo", 30.0, 1),
+        ]
+
+        database.mark_synced_bulk([(ids[0], 10), (ids[1], 11)])
+        database._execute("UPDATE expenses SET date = '2026-03-20' WHERE id = %s", (ids[1],))
+        database.delete_expenses([ids[2]])
+
+        assert self._rollup(user_id) == [
+            (2026, 2, "Jedzenie", "Jedzenie dom", 50.0, 1),
+            (2026, 3, "Jedzenie", "Jedzenie dom", 20.0, 1),
+        ]
+        assert database.verify_monthly_totals() == []
+
+    def test_rebuild_repairs_drift(self, user_id):
+        from bot.services import database
+        database.save_expense(user_id, {
+            "amount": 50.0, "date": "2026-02-15", "category": "Jedzenie",
+            "subcategory": "Jedzenie dom", "description": "a",
+        }, "test")
+        database._execute("UPDATE monthly_category_totals SET total = 1")
+        mismatches = database.verify_monthly_totals()
+        assert len(mismatches) == 1
+        assert float(mismatches[0]["expected_total"]) == 50.0
+
+        assert database.rebuild_monthly_totals() == 1
+        assert database.verify_monthly_totals() == []
+
+    def test_budget_status_reads_rollup(self, user_id):
+        from bot.services import database
+        database.save_expense(user_id, {
+            "amount": 50.0, "date": str(date.today()), "category": "Jedzenie",
+            "subcategory": "Jedzenie dom", "description": "a",
+        }, "test")
+        for category in (None, "Jedzenie", "Transport"):
+            database.set_budget(user_id, category, 100.0)
+        # Rows the rollup does not know about are not counted
+        database._execute("ALTER TABLE expenses DISABLE TRIGGER USER")
+        database.save_expense(user_id, {
+            "amount": 7.0, "date": str(date.today()), "category": "Jedzenie",
+            "subcategory": "Jedzenie dom", "description": "b",
+        }, "test")
+        database._execute("ALTER TABLE expenses ENABLE TRIGGER USER")
+        today = date.today()
+        status = database.get_budget_status(user_id, today.year, today.month)
+        assert [(b["category"], b["used"]) for b in status] == [
+            (None, 50.0), ("Jedzenie", 50.0), ("Transport", 0.0),
+        ]
+
+
+class TestParseHistory:
+    def test_description_categories_and_history(self, user_id):
+        from bot.services import database
+        database.save_expenses(user_id, [
+            {"amount": 80.0, "date": "2026-02-15", "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "Biedronka"},
+            {"amount": 35.0, "date": "2026-02-15", "category": "Opieka zdrowotna",
+             "subcategory": "Lekarstwa", "description": "apteka"},
+        ], "biedronka 80, apteka 35")
+        database.save_expense(user_id, {
+            "amount": 20.0, "date": "2026-02-16", "category": "Jedzenie",
+            "subcategory": "Jedzenie dom", "description": "biedronka",
+        }, "biedronka 20")
+
+        rows = database.get_description_categories(user_id)
+        counts = {(r["description"], r["subcategory"]): r["count"] for r in rows}
+        assert counts == {("biedronka", "Jedzenie dom"): 2, ("apteka", "Lekarstwa"): 1}
+
+        history = database.get_parse_history(user_id)
+        assert [h["original_text"] for h in history] == ["biedronka 20", "biedronka 80, apteka 35"]
+        assert history[1]["expenses"] == [("Jedzenie", "Jedzenie dom"), ("Opieka zdrowotna", "Lekarstwa")]
+
+        assert database.get_description_categories(user_id, before=history[1]["created_at"]) == []
@@ -0,0 +1,123 @@
+"""Tests for the database circuit breaker and cached is_available()."""
+
+from unittest.mock import patch
+
+import pytest
+from bot.services import database
+from bot.services.database import CircuitBreaker, DatabaseUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(threshold=2, cooldown=30.0, health_ttl=15.0, clock=clock)
+
+
+class TestCircuitBreaker:
+    def test_starts_closed_but_not_healthy(self, breaker):
+        assert breaker.state == "closed"
+        assert not breaker.is_healthy()
+        assert breaker.allow_request()
+
+    def test_success_is_healthy_until_ttl(self, breaker, clock):
+        breaker.record_success()
+        assert breaker.is_healthy()
+        clock.now += 16
+        assert not breaker.is_healthy()
+
+    def test_opens_after_threshold(self, breaker):
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow_request()
+        assert breaker.stats()["fast_failures"] == 1
+
+    def test_half_open_allows_single_probe(self, breaker, clock):
+        breaker.record_failure()
+        breaker.record_failure()
+        clock.now += 31
+        assert breaker.allow_request()
+        assert breaker.state == "half_open"
+        assert not breaker.allow_request()
+
+    def test_probe_success_closes(self, breaker, clock):
+        breaker.record_failure()
+        breaker.record_failure()
+        clock.now += 31
+        breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == "closed"
+        assert breaker.is_healthy()
+
+    def test_probe_failure_reopens(self, breaker, clock):
+        breaker.record_failure()
+        breaker.record_failure()
+        clock.now += 31
+        breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow_request()
+        assert breaker.stats()["opened"] == 2
+
+    def test_success_resets_failure_count(self, breaker):
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == "closed"
+
+    def test_transitions_counted(self, breaker, clock):
+        breaker.record_failure()
+        breaker.record_failure()
+        clock.now += 31
+        breaker.allow_request()
+        breaker.record_success()
+        stats = breaker.stats()
+        assert stats["transitions"] == 3
+        assert stats["state"] == "closed"
+
+
+class TestIsAvailable:
+    @pytest.fixture(autouse=True)
+    def isolated(self, breaker):
+        with patch.object(database, "DATABASE_URL", "postgresql://test"), \
+                patch.object(database, "_breaker", breaker):
+            yield
+
+    def test_healthy_path_skips_query(self, breaker):
+        breaker.record_success()
+        with patch.object(database, "_get_conn") as mock_conn:
+            assert database.is_available() is True
+        mock_conn.assert_not_called()
+
+    def test_connect_failures_open_breaker_and_fail_fast(self, breaker):
+        with patch.object(database, "_get_conn", side_effect=Exception("connection refused")) as mock_conn:
+            assert database.is_available() is False
+            assert database.is_available() is False
+            assert breaker.state == "open"
+            assert database.is_available() is False
+        assert mock_conn.call_count == 2
+
+    def test_queries_fail_fast_when_open(self, breaker):
+        breaker.record_failure()
+        breaker.record_failure()
+        with patch.object(database, "_get_conn") as mock_conn:
+            with pytest.raises(DatabaseUnavailable):
+                database.get_budgets(1)
+        mock_conn.assert_not_called()
+
+    def test_not_configured(self):
+        with patch.object(database, "DATABASE_URL", None):
+            assert database.is_available() is False
@@ -0,0 +1,188 @@
+"""Tests for the PostgreSQL connection pool (no real database needed)."""
+
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from bot.services import database
+from bot.services.database import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if self.conn.broken:
+            raise Exception("server closed the connection unexpectedly")
+        self.conn.queries.append(query)
+
+
+class FakeConn:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.queries = []
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.broken:
+            raise Exception("connection already closed")
+
+    def close(self):
+        self.closed = 1
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def connect(dsn):
+        conn = FakeConn()
+        created.append(conn)
+        return conn
+
+    params = {"minconn": 1, "maxconn": 2, "timeout": 0.2, "idle_check": 30.0}
+    params.update(kwargs)
+    return ConnectionPool("fake://", connect=connect, **params), created
+
+
+class TestCheckout:
+    def test_reuses_released_connection(self):
+        pool, created = make_pool()
+        conn = pool.getconn()
+        pool.putconn(conn)
+        assert pool.getconn() is conn
+        assert len(created) == 1
+
+    def test_no_liveness_check_for_recently_used(self):
+        pool, _ = make_pool()
+        conn = pool.getconn()
+        pool.putconn(conn)
+        pool.getconn()
+        assert conn.queries == []
+        assert pool.stats()["liveness_checks"] == 0
+
+    def test_liveness_check_after_idle(self):
+        pool, created = make_pool(idle_check=0.0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.broken = True
+        fresh = pool.getconn()
+        assert fresh is not conn
+        assert conn.closed
+        stats = pool.stats()
+        assert stats["liveness_failures"] == 1
+        assert stats["size"] == 1
+
+    def test_broken_connection_discarded_on_release(self):
+        pool, _ = make_pool()
+        conn = pool.getconn()
+        conn.closed = 2
+        pool.putconn(conn)
+        assert pool.stats()["size"] == 0
+        assert pool.getconn() is not conn
+
+    def test_connect_failure_frees_slot(self):
+        def connect(dsn):
+            raise Exception("connection refused")
+
+        pool = ConnectionPool("fake://", maxconn=1, timeout=0.1, connect=connect)
+        with pytest.raises(Exception, match="refused"):
+            pool.getconn()
+        assert pool.stats()["size"] == 0
+
+
+class TestBounds:
+    def test_times_out_when_exhausted(self):
+        pool, created = make_pool(maxconn=2, timeout=0.05)
+        pool.getconn()
+        pool.getconn()
+        with pytest.raises(PoolTimeout):
+            pool.getconn()
+        stats = pool.stats()
+        assert len(created) == 2
+        assert stats["exhausted"] == 1
+        assert stats["timeouts"] == 1
+
+    def test_waiter_gets_released_connection(self):
+        pool, _ = make_pool(maxconn=1, timeout=2.0)
+        conn = pool.getconn()
+        result = {}
+
+        def worker():
+            result["conn"] = pool.getconn()
+
+        t = threading.Thread(target=worker)
+        t.start()
+        time.sleep(0.05)
+        pool.putconn(conn)
+        t.join(timeout=2)
+        assert result["conn"] is conn
+        stats = pool.stats()
+        assert stats["exhausted"] == 1
+        assert stats["wait_seconds_max"] > 0
+
+    def test_concurrent_checkouts_never_exceed_max(self):
+        pool, created = make_pool(maxconn=3, timeout=5.0)
+        in_use = []
+        peak = []
+        lock = threading.Lock()
+
+        def worker():
+            for _ in range(20):
+                conn = pool.getconn()
+                with lock:
+                    in_use.append(conn)
+                    peak.append(len(in_use))
+                time.sleep(0.001)
+                with lock:
+                    in_use.remove(conn)
+                pool.putconn(conn)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert max(peak) <= 3
+        assert len(created) <= 3
+        assert pool.stats()["checkouts"] == 160
+
+    def test_idle_connections_shrink_to_min(self):
+        pool, _ = make_pool(minconn=1, maxconn=3, max_idle=0.0)
+        conns = [pool.getconn() for _ in range(3)]
+        for conn in conns:
+            time.sleep(0.001)
+            pool.putconn(conn)
+        assert pool.stats()["size"] == 1
+
+    def test_closeall(self):
+        pool, created = make_pool()
+        conn = pool.getconn()
+        pool.putconn(conn)
+        pool.closeall()
+        assert conn.closed
+        with pytest.raises(PoolTimeout):
+            pool.getconn()
+
+
+class TestAsyncFacade:
+    def test_aio_resolves_patched_function(self):
+        with patch("bot.services.database.get_budgets", return_value=[{"id": 1}]) as mock:
+            result = asyncio.run(database.aio.get_budgets(7))
+        assert result == [{"id": 1}]
+        mock.assert_called_once_with(7)
+
+    def test_aio_rejects_private_names(self):
+        with pytest.raises(AttributeError):
+            database.aio._execute
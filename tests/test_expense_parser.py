@@ -0,0 +1,66 @@
+"""Tests for parser backend selection."""
+
+import asyncio
+from unittest.mock import patch
+
+import openai
+import pytest
+from benchmarks.fake_openai import FakeOpenAI
+from bot.services import ai_parser, expense_parser, fast_parser, storage
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    storage.DB_PATH = ":memory:"
+    storage._init_db()
+    ai_parser._reset_stats()
+    with patch.object(ai_parser, "AI_BATCH_WINDOW_MS", 0):
+        yield
+
+
+AI_RESULT = [{"amount": 30.0, "date": "2026-02-26", "category": "Jedzenie",
+              "subcategory": "Jedzenie miasto", "description": "kebab"}]
+
+
+class TestParseExpenses:
+    @patch("bot.services.ai_parser.parse_expenses")
+    def test_rules_hit_skips_backend(self, mock_ai):
+        result = expense_parser.parse_expenses("biedronka 45", fast_parser.MerchantDictionary())
+        assert result[0]["subcategory"] == "Jedzenie dom"
+        mock_ai.assert_not_called()
+
+    @patch("bot.services.ai_parser.parse_expenses", return_value=AI_RESULT)
+    def test_openai_backend_gets_hints(self, mock_ai):
+        dictionary = fast_parser.MerchantDictionary()
+        dictionary.add("kebab", "Jedzenie", "Jedzenie miasto", 1)
+
+        with patch.object(expense_parser, "PARSER_BACKEND", "openai"):
+            result = expense_parser.parse_expenses("kebab za trzydzieści złotych", dictionary)
+
+        assert result == AI_RESULT
+        mock_ai.assert_called_once_with("kebab za trzydzieści złotych", [("kebab", "Jedzenie", "Jedzenie miasto")])
+
+    @patch("bot.services.ai_parser.parse_expenses")
+    def test_rules_backend_never_calls_ai(self, mock_ai):
+        with patch.object(expense_parser, "PARSER_BACKEND", "rules"):
+            assert expense_parser.parse_expenses("cześć, jak się masz?", fast_parser.MerchantDictionary()) == []
+        mock_ai.assert_not_called()
+
+
+class TestParseExpensesAsync:
+    def test_rules_backend_never_calls_ai(self):
+        with patch("bot.services.ai_parser.client_ai_async") as mock_client, \
+                patch.object(expense_parser, "PARSER_BACKEND", "rules"):
+            result = asyncio.run(expense_parser.parse_expenses_async("paragon 15 i coś", fast_parser.MerchantDictionary()))
+        assert result == []
+        mock_client.chat.completions.create.assert_not_called()
+
+    def test_local_backend_against_stand_in(self):
+        with FakeOpenAI() as server, patch.object(expense_parser, "PARSER_BACKEND", "local"):
+            client = openai.AsyncOpenAI(base_url=server.base_url, api_key="local", max_retries=0)
+            with patch("bot.services.ai_parser.client_ai_async", client):
+                result = asyncio.run(expense_parser.parse_expenses_async("paragon 15", fast_parser.MerchantDictionary()))
+
+        assert len(server.requests) == 1
+        assert result[0]["amount"] == 15.0
+        assert result[0]["description"] == "paragon"
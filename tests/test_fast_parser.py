@@ -0,0 +1,167 @@
+"""Tests for the rule-based fast-path parser."""
+
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+from bot.categories import CATEGORIES
+from bot.services import fast_parser, storage
+from bot.services.fast_parser import KEYWORDS, MerchantDictionary, build_dictionary, parse_expenses
+
+TODAY = date(2026, 2, 26)
+
+
+@pytest.fixture(autouse=True)
+def reset_dictionaries():
+    storage.DB_PATH = ":memory:"
+    storage._init_db()
+    fast_parser.reset_dictionaries()
+    yield
+    fast_parser.reset_dictionaries()
+
+
+@pytest.fixture
+def dictionary():
+    return build_dictionary([
+        {"description": "dino", "category": "Jedzenie", "subcategory": "Jedzenie dom", "count": 5},
+        {"description": "pizza hut", "category": "Jedzenie", "subcategory": "Jedzenie miasto", "count": 2},
+        {"description": "rossmann", "category": "Higiena", "subcategory": "Kosmetyki", "count": 3},
+        {"description": "rossmann", "category": "Opieka zdrowotna", "subcategory": "Suple", "count": 3},
+        {"description": "allegro", "category": "Nieistniejąca", "subcategory": "X", "count": 9},
+    ])
+
+
+def test_keywords_point_at_real_subcategories():
+    for category, subcategory in KEYWORDS.values():
+        assert subcategory in CATEGORIES[category]
+
+
+class TestParseExpenses:
+    def test_merchant_amount(self, dictionary):
+        assert parse_expenses("Dino 80", dictionary, TODAY) == [{
+            "amount": 80.0, "date": "2026-02-26", "category": "Jedzenie",
+            "subcategory": "Jedzenie dom", "description": "Dino",
+        }]
+
+    def test_amount_currency_merchant_category_word(self, dictionary):
+        result = parse_expenses("80 zł stacja paliwo", dictionary, TODAY)
+        assert result[0]["amount"] == 80.0
+        assert (result[0]["category"], result[0]["subcategory"]) == ("Transport", "Paliwo do auta")
+        assert result[0]["description"] == "stacja paliwo"
+
+    def test_comma_list_with_decimal_comma_and_day_word(self, dictionary):
+        result = parse_expenses("biedronka 80, apteka 35,50 wczoraj", dictionary, TODAY)
+        assert [(e["amount"], e["subcategory"], e["date"]) for e in result] == [
+            (80.0, "Jedzenie dom", "2026-02-26"),
+            (35.5, "Lekarstwa", "2026-02-25"),
+        ]
+
+    def test_diacritics_are_folded(self, dictionary):
+        assert parse_expenses("żabka 12zł", dictionary, TODAY)[0]["subcategory"] == "Jedzenie dom"
+        assert parse_expenses("siłownia 120", dictionary, TODAY)[0]["category"] == "Rozrywka"
+
+    def test_learned_phrase_beats_token_votes(self, dictionary):
+        assert parse_expenses("pizza hut 60", dictionary, TODAY)[0]["subcategory"] == "Jedzenie miasto"
+
+    @pytest.mark.parametrize("text", [
+        "cześć, jak się masz?",
+        "rossmann 40",                  # history split between two subcategories
+        "allegro 99",                   # learned category no longer exists
+        "obiad z Kasią 50",             # unknown words
+        "biedronka 80 15.02",           # calendar date
+        "biedronka 80 20",              # two amounts
+        "biedronka",                    # no amount
+        "paliwo piwo 50",               # conflicting keywords
+        "biedronka 80, coś innego 10",  # one ambiguous segment sends everything to the LLM
+    ])
+    def test_ambiguous_text_falls_through(self, dictionary, text):
+        assert parse_expenses(text, dictionary, TODAY) is None
+
+    def test_disabled(self, dictionary):
+        with patch.object(fast_parser, "FAST_PARSER_ENABLED", False):
+            assert parse_expenses("dino 80", dictionary, TODAY) is None
+
+
+class TestMerchantDictionary:
+    def test_share_threshold(self):
+        d = MerchantDictionary()
+        d.add("kawiarnia", "Jedzenie", "Jedzenie miasto", 4)
+        assert d.lookup(["kawiarnia"]) == ("Jedzenie", "Jedzenie miasto")
+        d.add("kawiarnia", "Jedzenie", "Jedzenie praca", 2)
+        assert d.lookup(["kawiarnia"]) is None
+
+    def test_token_votes_for_unseen_phrase(self):
+        d = MerchantDictionary()
+        d.add("kebab u Aliego", "Jedzenie", "Jedzenie praca")
+        assert d.lookup(["aliego", "duzy"]) == ("Jedzenie", "Jedzenie praca")
+
+
+class TestUserDictionaries:
+    KWIACIARNIA = {"description": "Kwiaciarnia", "category": "Inne wydatki",
+                   "subcategory": "Prezenty", "amount": 40.0}
+
+    @patch("bot.services.database.is_available", return_value=True)
+    @patch("bot.services.database.get_or_create_user", return_value=7)
+    @patch("bot.services.database.get_description_categories")
+    def test_seeded_from_history_once(self, mock_history, mock_user, mock_avail):
+        mock_history.return_value = [
+            {"description": "dino", "category": "Jedzenie", "subcategory": "Jedzenie dom", "count": 2},
+        ]
+        d = fast_parser.get_dictionary(123)
+        assert fast_parser.get_dictionary(123) is d
+        assert d.lookup(["dino"]) == ("Jedzenie", "Jedzenie dom")
+
+        fast_parser.reset_dictionaries()
+        assert fast_parser.get_dictionary(123).lookup(["dino"]) == ("Jedzenie", "Jedzenie dom")
+        mock_history.assert_called_once_with(7)
+
+    @patch("bot.services.database.is_available", return_value=False)
+    def test_learn_updates_memory_and_storage(self, mock_avail):
+        d = fast_parser.get_dictionary(123)
+        fast_parser.learn(123, [self.KWIACIARNIA])
+        assert parse_expenses("kwiaciarnia 40", d, TODAY)[0]["subcategory"] == "Prezenty"
+
+        fast_parser.reset_dictionaries()
+        reloaded = fast_parser.get_dictionary(123)
+        assert reloaded.lookup(["kwiaciarnia"]) == ("Inne wydatki", "Prezenty")
+
+    @patch("bot.services.database.is_available", return_value=False)
+    def test_correction_outweighs_past_confirmations(self, mock_avail):
+        d = fast_parser.get_dictionary(123)
+        wrong = dict(self.KWIACIARNIA, category="Jedzenie", subcategory="Jedzenie dom")
+        fast_parser.learn(123, [wrong, wrong])
+        assert d.lookup(["kwiaciarnia"]) == ("Jedzenie", "Jedzenie dom")
+
+        fast_parser.learn(123, [self.KWIACIARNIA], suggested=[["Jedzenie", "Jedzenie dom"]])
+
+        assert d.lookup(["kwiaciarnia"]) == ("Inne wydatki", "Prezenty")
+        assert d.phrases["kwiaciarnia"] == {("Inne wydatki", "Prezenty"): 3}
+        stored = {(r[0], r[1], r[3]): r[4] for r in storage.get_merchant_index(123)}
+        assert stored == {("kwiaciarnia", True, "Prezenty"): 3, ("kwiaciarnia", False, "Prezenty"): 3}
+
+    @patch("bot.services.database.is_available", return_value=True)
+    @patch("bot.services.database.get_or_create_user", side_effect=Exception("db down"))
+    def test_database_errors_leave_keywords(self, mock_user, mock_avail):
+        d = fast_parser.get_dictionary(123)
+        assert len(d) == 0
+        assert parse_expenses("biedronka 80", d, TODAY) is not None
+
+
+class TestLlmAssist:
+    def test_apply_learned_overrides_llm_category(self, dictionary):
+        expenses = [
+            {"description": "Dino", "category": "Jedzenie", "subcategory": "Jedzenie miasto"},
+            {"description": "obiad", "category": "Jedzenie", "subcategory": "Jedzenie miasto"},
+            {"description": "rossmann", "category": "Higiena", "subcategory": "Inne"},
+        ]
+        assert fast_parser.apply_learned(expenses, dictionary) == 1
+        assert expenses[0]["subcategory"] == "Jedzenie dom"
+        assert expenses[1]["subcategory"] == "Jedzenie miasto"
+        assert expenses[2]["subcategory"] == "Inne"
+
+    def test_hints_only_cover_words_in_message(self, dictionary):
+        assert dictionary.hints("Dino i pizza, 80 zł, kino") == [
+            ("dino", "Jedzenie", "Jedzenie dom"),
+            ("pizza", "Jedzenie", "Jedzenie miasto"),
+        ]
+        assert dictionary.hints("cześć") == []
@@ -0,0 +1,171 @@
+"""Tests for the streaming Sheets importer."""
+
+from unittest.mock import patch
+
+import pytest
+from bot.services import importer, storage
+from bot.services.importer import RowError, content_hash, parse_row
+
+
+@pytest.fixture(autouse=True)
+def reset_storage():
+    storage.DB_PATH = ":memory:"
+    storage._init_db()
+    yield
+
+
+def _row(day, amount, description="biedronka"):
+    return [f"2026-02-{day:02d}", amount, "Jedzenie", "Jedzenie dom", description, "txt"]
+
+
+class FakeSheet:
+    """Serves ranged pages from an in-memory list of rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.requests = []
+
+    def get_rows(self, start_row, end_row):
+        self.requests.append((start_row, end_row))
+        return self.rows[start_row - 1:end_row]
+
+
+class TestParseRow:
+    def test_valid_row(self):
+        expense, original = parse_row(["2026-02-15", "1\xa0250,5", "Jedzenie", "Jedzenie dom", " biedronka ", "txt"])
+        assert expense == {
+            "amount": 1250.5, "date": "2026-02-15", "category": "Jedzenie",
+            "subcategory": "Jedzenie dom", "description": "biedronka",
+        }
+        assert original == "txt"
+
+    def test_date_is_zero_padded(self):
+        expense, _ = parse_row(["2024-1-5", "10", "Jedzenie", "Jedzenie dom", "x"])
+        assert expense["date"] == "2024-01-05"
+        assert content_hash(expense) == content_hash(dict(expense, date="2024-01-05"))
+
+    @pytest.mark.parametrize("row, reason", [
+        (["", "", ""], "empty"),
+        (["2026-02-15", "10", "Jedzenie"], "too_short"),
+        (["15.02.2026", "10", "Jedzenie", "Jedzenie dom", "x"], "bad_date"),
+        (["2026-02-15", "dziesięć", "Jedzenie", "Jedzenie dom", "x"], "bad_amount"),
+        (["2026-02-15", "NaN", "Jedzenie", "Jedzenie dom", "x"], "bad_amount"),
+        (["2026-02-15", "999999999", "Jedzenie", "Jedzenie dom", "x"], "bad_amount"),
+        (["2026-02-15", "10", " ", "Jedzenie dom", "x"], "missing_category"),
+    ])
+    def test_invalid_rows(self, row, reason):
+        with pytest.raises(RowError) as exc:
+            parse_row(row)
+        assert exc.value.reason == reason
+
+
+class TestContentHash:
+    def test_amount_formatting_is_normalized(self):
+        a = {"date": "2026-02-15", "amount": 50.5, "category": "A", "subcategory": "B", "description": "c"}
+        b = dict(a, amount=50.50000001)
+        assert content_hash(a) == content_hash(b)
+        assert content_hash(a) != content_hash(dict(a, description="d"))
+
+
+class TestImportFromSheets:
+    @patch("bot.services.importer.database")
+    def test_reads_pages_and_reports_reasons(self, mock_db):
+        sheet = FakeSheet([
+            ["Data", "Kwota", "Kategoria", "Podkategoria", "Opis"],
+            _row(1, "10"),
+            _row(2, "abc"),
+            _row(3, "30"),
+            [],
+            _row(4, "40"),
+        ])
+        mock_db.import_sheet_expenses.side_effect = lambda uid, batch: [batch[0][4]] if batch and batch[0][4] == 2 else []
+
+        with patch("bot.services.importer.sheets", sheet):
+            result = importer.import_from_sheets(1, page_size=2)
+
+        assert sheet.requests == [(1, 2), (3, 4), (5, 6), (7, 8)]
+        assert mock_db.import_sheet_expenses.call_count == 3
+        assert result["imported"] == 2
+        assert result["duplicates"] == 1
+        assert result["skipped"] == {"bad_amount": 1, "duplicate": 1}
+        assert (3, "bad_amount", "abc") in result["skipped_rows"]
+        assert result["rows"] == 6
+        assert storage.get_checkpoint(importer.checkpoint_name(1)) is None
+
+    @patch("bot.services.importer.database")
+    def test_repeated_rows_get_increasing_occurrence(self, mock_db):
+        sheet = FakeSheet([_row(1, "10"), _row(1, "10"), _row(1, "10")])
+        mock_db.import_sheet_expenses.return_value = []
+
+        with patch("bot.services.importer.sheets", sheet):
+            importer.import_from_sheets(1, page_size=2)
+
+        batches = [c[0][1] for c in mock_db.import_sheet_expenses.call_args_list]
+        occurrences = [item[1] for batch in batches for item in batch]
+        assert occurrences == [1, 2, 3]
+
+    @patch("bot.services.importer.database")
+    def test_failure_leaves_resumable_checkpoint(self, mock_db):
+        sheet = FakeSheet([_row(d, "10") for d in range(1, 6)])
+        mock_db.import_sheet_expenses.side_effect = [[], Exception("db down")]
+
+        with patch("bot.services.importer.sheets", sheet):
+            with pytest.raises(Exception, match="db down"):
+                importer.import_from_sheets(1, page_size=2)
+
+        checkpoint = storage.get_checkpoint(importer.checkpoint_name(1))
+        assert checkpoint["next_row"] == 3
+        assert checkpoint["imported"] == 2
+
+        mock_db.import_sheet_expenses.side_effect = None
+        mock_db.import_sheet_expenses.return_value = []
+        sheet.requests.clear()
+        with patch("bot.services.importer.sheets", sheet):
+            result = importer.import_from_sheets(1, page_size=2)
+
+        assert sheet.requests[0] == (3, 4)
+        assert result["resumed_from"] == 3
+        assert result["imported"] == 5
+
+    @patch("bot.services.importer.database")
+    def test_checkpoint_holds_only_each_pages_counts(self, mock_db):
+        sheet = FakeSheet([_row(1, "10"), _row(2, "10"), _row(1, "10"), _row(3, "10"), _row(1, "10")])
+        mock_db.import_sheet_expenses.side_effect = [[], [], Exception("db down")]
+        saves = []
+        save_checkpoint = storage.save_checkpoint
+
+        def record(name, data, counts=None):
+            saves.append((data, counts))
+            save_checkpoint(name, data, counts)
+
+        with patch("bot.services.importer.sheets", sheet), \
+                patch("bot.services.storage.save_checkpoint", side_effect=record):
+            with pytest.raises(Exception, match="db down"):
+                importer.import_from_sheets(1, page_size=2)
+
+        assert all("seen" not in data for data, _ in saves)
+        assert [len(counts) for _, counts in saves] == [2, 2]
+        day1 = content_hash(parse_row(_row(1, "10"))[0])
+        assert saves[1][1][day1] == 2
+
+        # The resumed page continues the occurrence count of rows read before
+        mock_db.import_sheet_expenses.side_effect = None
+        mock_db.import_sheet_expenses.return_value = []
+        with patch("bot.services.importer.sheets", sheet):
+            importer.import_from_sheets(1, page_size=2)
+        assert mock_db.import_sheet_expenses.call_args[0][1][0][:2] == (day1, 3)
+        assert storage.get_checkpoint_counts(importer.checkpoint_name(1)) == {}
+
+    @patch("bot.services.importer.database")
+    def test_restart_ignores_checkpoint(self, mock_db):
+        storage.save_checkpoint(importer.checkpoint_name(1), {
+            "next_row": 99, "seen": {}, "imported": 0, "duplicates": 0, "skipped": {}, "rows": 0,
+        })
+        sheet = FakeSheet([_row(1, "10")])
+        mock_db.import_sheet_expenses.return_value = []
+
+        with patch("bot.services.importer.sheets", sheet):
+            result = importer.import_from_sheets(1, page_size=2, resume=False)
+
+        assert sheet.requests[0] == (1, 2)
+        assert result["imported"] == 1
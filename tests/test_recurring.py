@@ -1,6 +1,9 @@
 """Tests for recurring expense logic."""
 
+import asyncio
 from datetime import date, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
 from bot.handlers.commands import _calculate_next_due, FREQ_MAP
 
 
@@ -45,3 +48,46 @@ class TestCalculateNextDue:
             assert result.month == today.month
         else:
             assert result.day == 15
+
+
+class TestProcessRecurring:
+    def _due_item(self, rid, amount):
+        return {
+            "id": rid, "user_id": 1, "telegram_id": 99, "amount": amount,
+            "category": "Rozrywka", "subcategory": "Siłownia / Basen",
+            "description": f"item {rid}", "frequency": "monthly", "day_of_month": 1,
+        }
+
+    @patch("bot.handlers.commands.database")
+    def test_books_all_due_items_in_one_call(self, mock_db):
+        from bot.handlers.commands import process_recurring
+
+        mock_db.aio.is_available = AsyncMock(return_value=True)
+        mock_db.aio.get_due_recurring = AsyncMock(
+            return_value=[self._due_item(1, 120), self._due_item(2, 40)]
+        )
+        mock_db.aio.save_recurring_expenses = AsyncMock(return_value=[10, 11])
+        context = MagicMock()
+        context.bot.send_message = AsyncMock()
+
+        asyncio.run(process_recurring(context))
+
+        mock_db.aio.save_recurring_expenses.assert_awaited_once()
+        items = mock_db.aio.save_recurring_expenses.call_args[0][0]
+        assert [i[0] for i in items] == [1, 2]
+        assert items[0][2]["amount"] == 120.0
+        assert context.bot.send_message.await_count == 2
+
+    @patch("bot.handlers.commands.database")
+    def test_no_notifications_when_save_fails(self, mock_db):
+        from bot.handlers.commands import process_recurring
+
+        mock_db.aio.is_available = AsyncMock(return_value=True)
+        mock_db.aio.get_due_recurring = AsyncMock(return_value=[self._due_item(1, 120)])
+        mock_db.aio.save_recurring_expenses = AsyncMock(side_effect=Exception("db down"))
+        context = MagicMock()
+        context.bot.send_message = AsyncMock()
+
+        asyncio.run(process_recurring(context))
+
+        context.bot.send_message.assert_not_awaited()
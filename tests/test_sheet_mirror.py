@@ -0,0 +1,147 @@
+"""Tests for the local mirror of the expense sheet."""
+
+from unittest.mock import patch
+
+import pytest
+from bot.services import database, sheet_mirror, sheets, storage
+
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    storage.DB_PATH = ":memory:"
+    storage._init_db()
+
+
+HEADER = ["data", "kwota", "kategoria", "podkategoria", "opis", "tekst", "miesiac", "dzien"]
+
+
+def _row(amount, category="Jedzenie", subcategory="Jedzenie dom", month="Luty", description="zakupy"):
+    return ["2026-02-15", amount, category, subcategory, description, f"{description} {amount}", month, "15"]
+
+
+class FakeSheet:
+    """List-backed stand-in for sheets.get_all_rows()/get_rows()."""
+
+    def __init__(self, rows):
+        self.rows = [HEADER] + rows
+        self.full_reads = 0
+        self.ranges = []
+
+    def get_all_rows(self):
+        self.full_reads += 1
+        return [list(r) for r in self.rows]
+
+    def get_rows(self, start_row, end_row):
+        self.ranges.append((start_row, end_row))
+        return [list(r) for r in self.rows[start_row - 1:end_row]]
+
+
+@pytest.fixture
+def sheet():
+    fake = FakeSheet([_row("50,00"), _row("120,00", "Rozrywka", "Siłownia / Basen"), _row("10", month="Marzec")])
+    with patch.object(sheets, "get_all_rows", fake.get_all_rows), \
+            patch.object(sheets, "get_rows", fake.get_rows):
+        yield fake
+
+
+def _totals(month):
+    return database.fold_category_totals(sheet_mirror.get_month_totals(month))
+
+
+class TestMonthTotals:
+    def test_first_call_reads_whole_sheet(self, sheet):
+        grand_total, count, totals, sub_totals = _totals("Luty")
+        assert (grand_total, count) == (170.0, 2)
+        assert sub_totals["Rozrywka"] == {"Siłownia / Basen": 120.0}
+        assert sheet.full_reads == 1
+
+    def test_later_calls_fetch_only_new_rows(self, sheet):
+        _totals("Luty")
+        sheet.rows.append(_row("1 000,50", description="meble"))
+
+        grand_total, count, _, _ = _totals("Luty")
+
+        assert (grand_total, count) == (1170.5, 3)
+        assert sheet.full_reads == 1
+        # Starts at the last mirrored row to check it is unchanged
+        assert sheet.ranges == [(4, 4 + sheet_mirror._PAGE_ROWS - 1)]
+
+    def test_pages_through_many_new_rows(self, sheet):
+        _totals("Luty")
+        sheet.rows.extend(_row("1") for _ in range(sheet_mirror._PAGE_ROWS + 5))
+
+        _, count, _, _ = _totals("Luty")
+
+        assert count == 2 + sheet_mirror._PAGE_ROWS + 5
+        assert len(sheet.ranges) == 2
+
+    def test_change_above_tail_rebuilds(self, sheet):
+        _totals("Luty")
+        del sheet.rows[1]
+
+        grand_total, _, _, _ = _totals("Luty")
+
+        assert grand_total == 120.0
+        assert sheet.full_reads == 2
+
+    def test_unparseable_amount_and_short_rows_skipped(self, sheet):
+        sheet.rows.append(["2026-02-20", "abc", "Jedzenie", "Jedzenie dom", "x", "x", "Luty", "20"])
+        sheet.rows.append(["2026-02-21", "5"])
+        _, count, _, _ = _totals("Luty")
+        assert count == 2
+
+    def test_old_mirror_rebuilt(self, sheet):
+        _totals("Luty")
+        with patch.object(sheet_mirror, "SHEET_MIRROR_MAX_AGE_HOURS", 0):
+            _totals("Luty")
+        assert sheet.full_reads == 2
+
+
+class TestOwnWrites:
+    def test_append_needs_no_read(self, sheet):
+        _totals("Luty")
+        row = sheets.build_expense_row({"date": "2026-02-16", "amount": 7.5, "category": "Jedzenie",
+                                        "subcategory": "Jedzenie dom", "description": "chleb"}, "chleb 7,5")
+        sheet.rows.append([str(c) for c in row])
+        sheet_mirror.record_append([row], [5])
+
+        grand_total, count, _, _ = _totals("Luty")
+
+        assert (grand_total, count) == (177.5, 3)
+        # Only the tail check, which finds nothing new
+        assert sheet.ranges == [(5, 5 + sheet_mirror._PAGE_ROWS - 1)]
+
+    def test_append_after_unknown_rows_left_to_refresh(self, sheet):
+        _totals("Luty")
+        sheet.rows.extend([_row("1"), _row("2")])
+        sheet_mirror.record_append([sheet.rows[-1]], [6])
+
+        _, count, _, _ = _totals("Luty")
+
+        assert count == 4
+        assert sheet.full_reads == 1
+
+    def test_delete_rereads_from_deleted_row(self, sheet):
+        _totals("Luty")
+        del sheet.rows[2]
+        sheet_mirror.record_delete([3])
+
+        grand_total, count, _, _ = _totals("Luty")
+
+        assert (grand_total, count) == (50.0, 1)
+        assert sheet.full_reads == 1
+        assert sheet.ranges == [(2, 2 + sheet_mirror._PAGE_ROWS - 1)]
+
+    def test_sheets_writes_update_mirror(self, sheet):
+        _totals("Luty")
+        with patch.object(sheets, "_get_worksheet") as mock_ws:
+            mock_ws.return_value.append_rows.return_value = {"updates": {"updatedRange": "'Tab'!A5:H5"}}
+            sheets.append_expense_rows([_row("3")])
+            assert storage.get_checkpoint(sheet_mirror._STATE_KEY)["rows"] == 5
+            sheets.delete_rows([5])
+        assert storage.get_checkpoint(sheet_mirror._STATE_KEY)["rows"] == 4
+
+    def test_no_mirror_yet_is_noop(self):
+        sheet_mirror.record_append([_row("3")], [2])
+        sheet_mirror.record_delete([2])
+        assert storage.get_checkpoint(sheet_mirror._STATE_KEY) is None
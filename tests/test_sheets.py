@@ -0,0 +1,254 @@
+"""Tests for Google Sheets writer."""
+
+import logging
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+from gspread.exceptions import APIError
+from bot.services import sheets, storage
+
+
+@pytest.fixture(autouse=True)
+def reset_handles():
+    storage.DB_PATH = ":memory:"
+    storage._init_db()
+    sheets.reset_handles()
+    yield
+    sheets.reset_handles()
+
+
+def _api_error(code):
+    response = MagicMock()
+    response.json.return_value = {"error": {"code": code, "message": "err", "status": "ERR"}}
+    return APIError(response)
+
+
+def _tab(title):
+    ws = MagicMock()
+    ws.title = title
+    return ws
+
+
+@pytest.fixture
+def worksheet():
+    ws = MagicMock()
+    spreadsheet = MagicMock()
+    spreadsheet.worksheet.return_value = ws
+    with patch("bot.services.sheets.gc") as mock_gc:
+        mock_gc.open.return_value = spreadsheet
+        yield ws
+
+
+class TestBuildExpenseRow:
+    def test_row_layout(self):
+        row = sheets.build_expense_row({
+            "date": "2026-02-15",
+            "amount": 50.5,
+            "category": "Jedzenie",
+            "subcategory": "Jedzenie dom",
+            "description": "biedronka",
+        }, "50,5 biedronka")
+        assert row == [
+            "2026-02-15", "50,5", "Jedzenie", "Jedzenie dom",
+            "biedronka", "50,5 biedronka", "Luty", 15,
+        ]
+
+
+class TestErrorClassification:
+    def test_only_429_is_a_rate_limit(self):
+        assert sheets.is_rate_limit_error(_api_error(429))
+        assert not sheets.is_rate_limit_error(_api_error(503))
+        assert not sheets.is_rate_limit_error(TimeoutError())
+
+    def test_server_errors_and_timeouts_are_ambiguous(self):
+        import requests
+
+        assert sheets.is_ambiguous_write_error(_api_error(500))
+        assert sheets.is_ambiguous_write_error(TimeoutError())
+        assert sheets.is_ambiguous_write_error(requests.exceptions.ReadTimeout())
+        assert not sheets.is_ambiguous_write_error(_api_error(429))
+        assert not sheets.is_ambiguous_write_error(_api_error(400))
+        assert not sheets.is_ambiguous_write_error(ValueError())
+
+
+class TestRowIndicesFromResponse:
+    def test_parses_updated_range(self):
+        response = {"updates": {"updatedRange": "'Bot_Data'!A101:H103"}}
+        assert sheets._row_indices_from_response(response, 3) == [101, 102, 103]
+
+    def test_single_cell_range(self):
+        response = {"updates": {"updatedRange": "Bot_Data!A7"}}
+        assert sheets._row_indices_from_response(response, 1) == [7]
+
+    def test_unexpected_range_raises(self):
+        with pytest.raises(ValueError):
+            sheets._row_indices_from_response({"updates": {"updatedRange": "Bot_Data!"}}, 1)
+
+
+class TestSaveExpensesToSheet:
+    def test_single_append_call_without_full_download(self, worksheet):
+        worksheet.append_rows.return_value = {"updates": {"updatedRange": "Bot_Data!A20:H21"}}
+        expenses = [
+            {"date": "2026-02-15", "amount": 50.0, "category": "Jedzenie",
+             "subcategory": "Jedzenie dom", "description": "biedronka"},
+            {"date": "2026-02-15", "amount": 35.0, "category": "Opieka zdrowotna",
+             "subcategory": "Lekarstwa", "description": "apteka"},
+        ]
+
+        result = sheets.save_expenses_to_sheet(expenses, "biedronka 50, apteka 35")
+
+        assert result == [20, 21]
+        worksheet.append_rows.assert_called_once()
+        worksheet.append_row.assert_not_called()
+        worksheet.get_all_values.assert_not_called()
+
+    def test_reuses_worksheet_handle(self, worksheet):
+        worksheet.append_rows.return_value = {"updates": {"updatedRange": "Bot_Data!A5:H5"}}
+        expense = {"date": "2026-02-15", "amount": 50.0, "category": "Jedzenie",
+                   "subcategory": "Jedzenie dom", "description": "biedronka"}
+
+        sheets.save_expenses_to_sheet([expense], "a")
+        sheets.save_expenses_to_sheet([expense], "b")
+
+        assert sheets.gc.open.call_count == 1
+
+    def test_empty_list_makes_no_call(self, worksheet):
+        assert sheets.append_expense_rows([]) == []
+        worksheet.append_rows.assert_not_called()
+
+
+class TestFindAppendedRows:
+    NETFLIX = {"amount": 43.0, "category": "Rozrywka", "subcategory": "Subskrypcje", "description": "netflix"}
+
+    def _serial(self, iso):
+        return (datetime.strptime(iso, "%Y-%m-%d") - datetime(1899, 12, 30)).days
+
+    def _sheet_row(self, iso, amount):
+        return [self._serial(iso), amount, "Rozrywka", "Subskrypcje", "netflix", "recurring: netflix"]
+
+    def test_same_recurring_row_last_month_is_not_a_match(self, worksheet):
+        row = sheets.build_expense_row(dict(self.NETFLIX, date="2026-03-01"), "recurring: netflix")
+        worksheet.col_values.return_value = ["x"] * 40
+        worksheet.get.return_value = [self._sheet_row("2026-02-01", 43)]
+
+        assert sheets.find_appended_rows([row], after_row=39) is None
+
+    def test_matches_only_past_recorded_length(self, worksheet):
+        row = sheets.build_expense_row(dict(self.NETFLIX, date="2026-03-01"), "recurring: netflix")
+        worksheet.col_values.return_value = ["x"] * 41
+        worksheet.get.return_value = [self._sheet_row("2026-03-01", 43.0)]
+
+        assert sheets.find_appended_rows([row], after_row=40) == [41]
+        assert worksheet.get.call_args[0][0] == "A41:F41"
+
+    def test_nothing_past_recorded_length(self, worksheet):
+        row = sheets.build_expense_row(dict(self.NETFLIX, date="2026-03-01"), "recurring: netflix")
+        worksheet.col_values.return_value = ["x"] * 40
+
+        assert sheets.find_appended_rows([row], after_row=40) is None
+        worksheet.get.assert_not_called()
+
+    def test_amount_and_date_are_compared_normalized(self):
+        row = sheets.build_expense_row(dict(self.NETFLIX, date="2026-03-01", amount=12.5), "t")
+        assert sheets._row_fingerprint(row) == sheets._row_fingerprint(
+            [self._serial("2026-03-01"), 12.5, "Rozrywka", "Subskrypcje", "netflix", "t"])
+        assert sheets._row_fingerprint(row) != sheets._row_fingerprint(
+            [self._serial("2026-03-01"), 12.51, "Rozrywka", "Subskrypcje", "netflix", "t"])
+
+
+class TestHandles:
+    @pytest.fixture
+    def client(self):
+        spreadsheet = MagicMock()
+        spreadsheet.id = "sheet-id"
+        spreadsheet.worksheets.return_value = [_tab(sheets.SHEET_TAB_NAME), _tab(sheets.INCOME_SHEET_TAB_NAME)]
+        with patch("bot.services.sheets.gc") as mock_gc:
+            mock_gc.open.return_value = spreadsheet
+            mock_gc.open_by_key.return_value = spreadsheet
+            yield mock_gc
+
+    def test_remembers_id_after_first_search(self, client):
+        sheets.get_all_rows()
+        sheets.reset_handles()
+        sheets.get_all_rows()
+
+        client.open.assert_called_once_with(sheets.SPREADSHEET_NAME)
+        client.open_by_key.assert_called_once_with("sheet-id")
+
+    def test_configured_id_skips_search(self, client):
+        with patch.object(sheets, "SPREADSHEET_ID", "configured"):
+            sheets.get_all_rows()
+        client.open.assert_not_called()
+        client.open_by_key.assert_called_once_with("configured")
+
+    def test_worksheets_loaded_with_one_fetch(self, client):
+        spreadsheet = client.open.return_value
+
+        sheets.get_all_rows()
+        sheets.save_income_to_sheet({"date": "2026-02-15", "amount": 100.0, "category": "Inne", "source": "x"})
+
+        spreadsheet.worksheets.assert_called_once()
+        spreadsheet.worksheet.assert_not_called()
+        spreadsheet.add_worksheet.assert_not_called()
+
+    def test_missing_income_tab_is_created_once(self, client):
+        spreadsheet = client.open.return_value
+        spreadsheet.worksheets.return_value = [_tab(sheets.SHEET_TAB_NAME)]
+        income = {"date": "2026-02-15", "amount": 100.0, "category": "Inne", "source": "x"}
+
+        sheets.save_income_to_sheet(income)
+        sheets.save_income_to_sheet(income)
+
+        spreadsheet.add_worksheet.assert_called_once()
+
+    def test_not_found_reopens_and_retries(self, client):
+        ws = client.open.return_value.worksheets.return_value[0]
+        ws.get_all_values.side_effect = [[["old"]], _api_error(404), [["row"]]]
+        sheets.get_all_rows()
+        sheets.reset_handles()
+
+        assert sheets.get_all_rows() == [["row"]]
+        client.open_by_key.assert_called_once()
+        assert client.open.call_count == 2  # The stale ID was dropped and searched again
+        assert storage.get_checkpoint(sheets._SPREADSHEET_ID_KEY) == {"id": "sheet-id"}
+
+    def test_delete_is_not_retried(self, client):
+        ws = client.open.return_value.worksheets.return_value[0]
+        ws.delete_rows.side_effect = _api_error(404)
+
+        with pytest.raises(APIError):
+            sheets.delete_rows([3, 4])
+        ws.delete_rows.assert_called_once()
+
+    def test_request_counts_are_logged(self, client, caplog):
+        ws = client.open.return_value.worksheets.return_value[0]
+
+        def append_rows(rows, value_input_option):
+            sheets._on_response(None)
+            sheets._on_response(None)
+            return {"updates": {"updatedRange": "Bot_Data!A5:H5"}}
+
+        ws.append_rows.side_effect = append_rows
+        expense = {"date": "2026-02-15", "amount": 50.0, "category": "Jedzenie",
+                   "subcategory": "Jedzenie dom", "description": "biedronka"}
+
+        with caplog.at_level(logging.INFO, logger="bot.services.sheets"):
+            sheets.save_expenses_to_sheet([expense], "a")
+
+        assert "Sheets save_expenses_to_sheet: 2 API request(s)" in caplog.text
+        assert "append_expense_rows" not in caplog.text
+        assert sheets.request_stats()["save_expenses_to_sheet"] >= 2
+
+    def test_access_token_is_reused(self, client):
+        expiry = datetime(2030, 1, 1)
+        storage.save_checkpoint(sheets._TOKEN_KEY, {
+            "account": "bot@example.iam", "token": "cached", "expiry": expiry.isoformat(),
+        })
+        creds = SimpleNamespace(token=None, expiry=None, service_account_email="bot@example.iam")
+        client.http_client.auth = creds
+
+        sheets.get_all_rows()
+
+        assert (creds.token, creds.expiry) == ("cached", expiry)
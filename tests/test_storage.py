@@ -1,5 +1,11 @@
 """Tests for SQLite storage service."""
 
+import asyncio
+import sqlite3
+import threading
+import time
+from unittest.mock import patch
+
 import pytest
 from bot.services import storage
 
@@ -39,6 +45,44 @@ class TestPendingExpenses:
         assert storage.get_pending("del-me") is None
 
 
+class TestPendingVersions:
+    def test_pop_for_other_user_leaves_entry(self):
+        storage.save_pending("e", {"user_id": 1})
+        assert storage.pop_pending("e", user_id=2) is None
+        assert storage.pop_pending("e", user_id=1) == {"user_id": 1}
+        assert storage.get_pending("e") is None
+
+    def test_replace_is_compare_and_swap(self):
+        storage.save_pending("e", {"user_id": 1, "n": 0})
+        data, version = storage.get_pending_entry("e")
+
+        assert storage.replace_pending("e", {"user_id": 1, "n": 1}, version)
+        # A second writer holding the old version loses
+        assert not storage.replace_pending("e", {"user_id": 1, "n": 2}, version)
+        assert storage.get_pending("e")["n"] == 1
+
+    def test_save_bumps_version(self):
+        storage.save_pending("e", {"user_id": 1})
+        _, version = storage.get_pending_entry("e")
+        storage.save_pending("e", {"user_id": 1})
+        assert not storage.replace_pending("e", {"user_id": 1}, version)
+
+    def test_replace_after_pop_fails(self):
+        storage.save_pending("e", {"user_id": 1})
+        _, version = storage.get_pending_entry("e")
+        storage.pop_pending("e")
+        assert not storage.replace_pending("e", {"user_id": 1}, version)
+        assert storage.get_pending("e") is None
+
+    def test_income(self):
+        storage.save_pending_income("i", {"user_id": 1, "amount": 10})
+        data, version = storage.get_pending_income_entry("i")
+        assert storage.replace_pending_income("i", {**data, "amount": 20}, version)
+        assert storage.pop_pending_income("i", user_id=2) is None
+        assert storage.pop_pending_income("i")["amount"] == 20
+        assert storage.pop_pending_income("i") is None
+
+
 class TestLastSaved:
     def test_save_and_get(self):
         data = {"row_indices": [5, 6], "expenses": [{"amount": 50}]}
@@ -59,3 +103,318 @@ class TestLastSaved:
         storage.save_last_saved(1, {"row_indices": [10, 11], "expenses": []})
         result = storage.get_last_saved(1)
         assert result["row_indices"] == [10, 11]
+
+
+class TestCheckpoints:
+    def test_counts_are_upserted_and_deleted_with_checkpoint(self):
+        storage.save_checkpoint("job", {"next_row": 3}, counts={"a": 1, "b": 2})
+        storage.save_checkpoint("job", {"next_row": 5}, counts={"b": 3})
+        storage.save_checkpoint("other", {}, counts={"a": 9})
+
+        assert storage.get_checkpoint("job") == {"next_row": 5}
+        assert storage.get_checkpoint_counts("job") == {"a": 1, "b": 3}
+
+        storage.delete_checkpoint("job")
+        assert storage.get_checkpoint("job") is None
+        assert storage.get_checkpoint_counts("job") == {}
+        assert storage.get_checkpoint_counts("other") == {"a": 9}
+
+
+class TestParseCache:
+    def test_round_trip_counts_hits(self):
+        storage.save_cached_parse("k", [{"amount": 45.0, "date_offset": 0}], 1.5)
+        assert storage.get_cached_parse("k") == ([{"amount": 45.0, "date_offset": 0}], 1.5)
+        storage.get_cached_parse("k")
+        assert storage.parse_cache_stats() == {"entries": 1, "hits": 2, "saved_seconds": 3.0}
+
+    def test_expired_entry_is_a_miss(self):
+        storage.save_cached_parse("k", [], 1.0)
+        with patch("bot.services.storage.time.time", return_value=time.time() + storage.PARSE_CACHE_TTL_SECONDS + 1):
+            assert storage.get_cached_parse("k") is None
+
+    def test_least_recently_used_evicted_over_cap(self):
+        with patch.object(storage, "PARSE_CACHE_MAX_ENTRIES", 2), \
+                patch("bot.services.storage.time.time", side_effect=[1000.0, 1001.0, 1002.0, 1003.0]):
+            storage.save_cached_parse("a", [], 1.0)
+            storage.save_cached_parse("b", [], 1.0)
+            storage.get_cached_parse("a")
+            storage.save_cached_parse("c", [], 1.0)
+        with patch("bot.services.storage.time.time", return_value=1004.0):
+            assert storage.get_cached_parse("a") is not None
+            assert storage.get_cached_parse("b") is None
+            assert storage.get_cached_parse("c") is not None
+
+    def test_disabled_when_cap_is_zero(self):
+        with patch.object(storage, "PARSE_CACHE_MAX_ENTRIES", 0):
+            storage.save_cached_parse("k", [], 1.0)
+        assert storage.get_cached_parse("k") is None
+
+
+class TestMerchantIndex:
+    def test_weights_accumulate_and_drop_at_zero(self):
+        storage.add_merchant_weights(1, [("dino", True, "Jedzenie", "Jedzenie dom", 2)])
+        storage.add_merchant_weights(1, [
+            ("dino", True, "Jedzenie", "Jedzenie dom", 1),
+            ("dino", True, "Higiena", "Inne", -3),
+        ])
+        assert storage.get_merchant_index(1) == [("dino", True, "Jedzenie", "Jedzenie dom", 3.0)]
+
+        storage.add_merchant_weights(1, [("dino", True, "Jedzenie", "Jedzenie dom", -3)])
+        assert storage.get_merchant_index(1) == []
+
+    def test_per_user(self):
+        storage.add_merchant_weights(1, [("dino", False, "Jedzenie", "Jedzenie dom", 1)])
+        assert storage.get_merchant_index(2) == []
+
+
+class TestConnections:
+    @pytest.fixture
+    def file_db(self, tmp_path):
+        storage.DB_PATH = str(tmp_path / "state.db")
+        storage._init_db()
+        yield
+        storage.close()
+
+    def test_connection_reused_per_thread(self, file_db):
+        conn = storage._get_conn()
+        storage.save_pending("a", {"user_id": 1})
+        assert storage._get_conn() is conn
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(storage._get_conn()))
+        thread.start()
+        thread.join()
+        assert other[0] is not conn
+
+    def test_wal_and_synchronous_normal(self, file_db):
+        conn = storage._get_conn()
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == storage.STATE_DB_BUSY_TIMEOUT_MS
+
+    def test_init_db_reopens(self, file_db):
+        conn = storage._get_conn()
+        storage._init_db()
+        assert storage._get_conn() is not conn
+
+    def test_failed_write_rolled_back(self, file_db):
+        rows = [(1, "2026-02-15", 5.0, "Jedzenie", "", "", "", "Luty"), (2, None)]
+        with pytest.raises(Exception):
+            storage.add_sheet_rows(rows, replace=True)
+        assert not storage._get_conn().in_transaction
+        assert storage.get_sheet_row(1) is None
+
+    def test_aio(self, file_db):
+        async def round_trip():
+            await storage.aio.save_pending("a", {"user_id": 1})
+            return await storage.aio.get_pending("a")
+
+        assert asyncio.run(round_trip()) == {"user_id": 1}
+        assert storage.get_pending("a") == {"user_id": 1}
+
+
+class TestSchema:
+    def test_adds_version_to_old_tables(self, tmp_path):
+        path = str(tmp_path / "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute("""CREATE TABLE pending_expenses (expense_id TEXT PRIMARY KEY, user_id INTEGER NOT NULL,
+                        data_json TEXT NOT NULL, created_at REAL NOT NULL)""")
+        conn.execute("INSERT INTO pending_expenses VALUES ('e', 1, '{\"user_id\": 1}', 0)")
+        conn.commit()
+        conn.close()
+
+        storage.DB_PATH = path
+        storage._init_db()
+        try:
+            assert storage.get_pending_entry("e") == ({"user_id": 1}, 0)
+        finally:
+            storage.close()
+
+
+class TestConcurrentPops:
+    @pytest.mark.parametrize("pop, save", [
+        (storage.pop_pending, storage.save_pending),
+        (storage.pop_pending_income, storage.save_pending_income),
+    ])
+    def test_exactly_one_winner(self, tmp_path, pop, save):
+        storage.DB_PATH = str(tmp_path / "state.db")
+        storage._init_db()
+        threads = 8
+        for round_no in range(25):
+            save(f"e{round_no}", {"user_id": 1})
+            barrier = threading.Barrier(threads)
+            results = []
+
+            def worker():
+                barrier.wait()
+                results.append(pop(f"e{round_no}"))
+                storage.close()
+
+            workers = [threading.Thread(target=worker) for _ in range(threads)]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            assert sum(r is not None for r in results) == 1
+        storage.close()
+
+
+class TestSweep:
+    def _age(self, table: str, seconds: float):
+        with storage._get_conn() as conn:
+            conn.execute(f"UPDATE {table} SET created_at = created_at - ?", (seconds,))
+
+    def test_every_policy_table_expires(self):
+        storage.save_pending("e", {"user_id": 1})
+        storage.save_pending_income("i", {"user_id": 1})
+        storage.save_last_saved(1, {"row_indices": [2]})
+        storage.save_cached_parse("k", [], 1.0)
+        for table in ("pending_expenses", "pending_income", "last_saved", "parse_cache"):
+            self._age(table, 365 * 86400)
+        storage.save_pending("fresh", {"user_id": 1})
+
+        expired = storage.sweep_expired()
+
+        assert expired == {"pending_expenses": 1, "pending_income": 1, "last_saved": 1, "parse_cache": 1}
+        assert storage.get_pending("fresh") is not None
+        assert storage.get_last_saved(1) is None
+
+    def test_per_table_ttl(self):
+        storage.save_pending("e", {"user_id": 1})
+        storage.save_last_saved(1, {"row_indices": [2]})
+        self._age("pending_expenses", 2 * 3600)
+        self._age("last_saved", 2 * 3600)
+
+        storage.sweep_expired()
+
+        assert storage.get_pending("e") is None
+        assert storage.get_last_saved(1) is not None
+
+    def test_deletes_in_batches(self):
+        for i in range(25):
+            storage.save_pending(f"e{i}", {"user_id": 1})
+        self._age("pending_expenses", 2 * 3600)
+
+        statements = []
+        conn = storage._get_conn()
+        conn.set_trace_callback(statements.append)
+        try:
+            with patch.object(storage, "SWEEP_BATCH_SIZE", 10):
+                assert storage.sweep_expired()["pending_expenses"] == 25
+        finally:
+            conn.set_trace_callback(None)
+        assert sum(s.startswith("DELETE FROM pending_expenses") for s in statements) == 3
+
+    def test_expiry_uses_index(self):
+        plan = storage._get_conn().execute(
+            "EXPLAIN QUERY PLAN SELECT rowid FROM last_saved WHERE created_at < ? LIMIT 10", (0,)
+        ).fetchall()
+        assert "idx_last_saved_created_at" in str(plan)
+
+    def test_records_history_and_totals(self, tmp_path):
+        storage.DB_PATH = str(tmp_path / "state.db")
+        storage._init_db()
+        try:
+            storage.save_pending("e", {"user_id": 1})
+            self._age("pending_expenses", 2 * 3600)
+            storage.sweep_expired()
+            storage.sweep_expired()
+
+            stats = storage.sweep_stats()
+            assert stats["expired"]["pending_expenses"] >= 1
+            assert len(stats["history"]) == 2
+            assert stats["history"][0]["expired"]["pending_expenses"] == 1
+            assert stats["history"][-1]["db_bytes"] > 0
+            assert stats["history"][-1]["wal_bytes"] == 0  # Checkpointed
+        finally:
+            storage.close()
+
+    def test_vacuum_when_due_and_mostly_free(self, tmp_path):
+        storage.DB_PATH = str(tmp_path / "state.db")
+        storage._init_db()
+        try:
+            for i in range(2000):
+                storage.save_cached_parse(f"k{i}", ["x" * 200], 1.0)
+            self._age("parse_cache", 365 * 86400)
+            size_before = storage._get_conn().execute("PRAGMA page_count").fetchone()[0]
+
+            storage.sweep_expired()
+
+            assert storage._get_conn().execute("PRAGMA page_count").fetchone()[0] < size_before / 2
+            assert storage.get_checkpoint(storage._VACUUM_KEY) is not None
+        finally:
+            storage.close()
+
+
+class TestPendingCache:
+    def _selects(self, func):
+        statements = []
+        conn = storage._get_conn()
+        conn.set_trace_callback(statements.append)
+        try:
+            result = func()
+        finally:
+            conn.set_trace_callback(None)
+        return result, [s for s in statements if s.startswith("SELECT")]
+
+    def test_reads_served_from_memory(self):
+        storage.save_pending("e", {"user_id": 1, "expenses": [{"category": "A"}]})
+        entry, selects = self._selects(lambda: storage.get_pending_entry("e"))
+        assert entry[0]["expenses"] == [{"category": "A"}]
+        assert selects == []
+
+    def test_returned_data_is_a_copy(self):
+        storage.save_pending("e", {"user_id": 1, "expenses": [{"category": "A"}]})
+        storage.get_pending("e")["expenses"][0]["category"] = "B"
+        assert storage.get_pending("e")["expenses"][0]["category"] == "A"
+
+    def test_write_through(self):
+        storage.save_pending("e", {"user_id": 1, "n": 0})
+        data, version = storage.get_pending_entry("e")
+        storage.replace_pending("e", {**data, "n": 1}, version)
+        storage._pending_cache.clear()
+        assert storage.get_pending_entry("e") == ({"user_id": 1, "n": 1}, version + 1)
+
+    def test_other_process_write_invalidates(self, tmp_path):
+        path = str(tmp_path / "state.db")
+        storage.DB_PATH = path
+        storage._init_db()
+        try:
+            storage.save_pending("e", {"user_id": 1, "n": 0})
+            assert storage.get_pending("e")["n"] == 0
+
+            other = sqlite3.connect(path)
+            other.execute("UPDATE pending_expenses SET data_json = ?, version = version + 1",
+                          ('{"user_id": 1, "n": 5}',))
+            other.commit()
+            other.close()
+
+            assert storage.get_pending_entry("e") == ({"user_id": 1, "n": 5}, 1)
+        finally:
+            storage.close()
+
+    def test_bounded(self):
+        with patch.object(storage, "PENDING_CACHE_MAX_ENTRIES", 3):
+            for i in range(5):
+                storage.save_pending(f"e{i}", {"user_id": 1})
+            storage.get_pending("e2")
+            storage.save_pending("e5", {"user_id": 1})
+        assert [k[1] for k in storage._pending_cache] == ["e4", "e2", "e5"]
+        assert storage.get_pending("e0") == {"user_id": 1}
+
+    def test_disabled(self):
+        with patch.object(storage, "PENDING_CACHE_MAX_ENTRIES", 0):
+            storage.save_pending("e", {"user_id": 1})
+            _, selects = self._selects(lambda: storage.get_pending("e"))
+        assert len(selects) == 1
+
+    def test_pop_and_sweep_evict(self):
+        storage.save_pending("e", {"user_id": 1})
+        storage.save_pending("old", {"user_id": 1})
+        storage.pop_pending("e")
+        assert storage.get_pending("e") is None
+
+        with storage._get_conn() as conn:
+            conn.execute("UPDATE pending_expenses SET created_at = 0 WHERE expense_id = 'old'")
+        storage.sweep_expired()
+        assert storage.get_pending("old") is None
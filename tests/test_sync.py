@@ -1,26 +1,58 @@
 """Tests for Sheets background sync service."""
 
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 from datetime import date
 
+import pytest
+from bot.services import sheets, storage
+
+
+@pytest.fixture(autouse=True)
+def reset_storage():
+    storage.DB_PATH = ":memory:"
+    storage._init_db()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def no_sleep():
+    with patch("bot.services.sync._sleep") as mock_sleep:
+        yield mock_sleep
+
+
+def _expense(i: int) -> dict:
+    return {
+        "id": i,
+        "amount": 10.0 + i,
+        "date": date(2026, 2, 15),
+        "category": "Jedzenie",
+        "subcategory": "Jedzenie dom",
+        "description": f"item {i}",
+        "original_text": f"text {i}",
+    }
+
 
 class TestSyncUnsyncedToSheets:
     @patch("bot.services.sync.database")
     @patch("bot.services.sync.sheets")
     def test_no_unsynced_returns_zero(self, mock_sheets, mock_db):
         from bot.services.sync import sync_unsynced_to_sheets
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
 
         mock_db.is_available.return_value = True
         mock_db.get_unsynced_expenses.return_value = []
 
         result = sync_unsynced_to_sheets()
         assert result == 0
-        mock_sheets.save_expenses_to_sheet.assert_not_called()
+        mock_sheets.append_expense_rows.assert_not_called()
 
     @patch("bot.services.sync.database")
     @patch("bot.services.sync.sheets")
     def test_syncs_expenses(self, mock_sheets, mock_db):
         from bot.services.sync import sync_unsynced_to_sheets
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
 
         mock_db.is_available.return_value = True
         mock_db.get_unsynced_expenses.return_value = [
@@ -34,16 +66,37 @@ class TestSyncUnsyncedToSheets:
                 "original_text": "50 biedronka",
             }
         ]
-        mock_sheets.save_expenses_to_sheet.return_value = [42]
+        mock_sheets.append_expense_rows.return_value = [42]
 
         result = sync_unsynced_to_sheets()
         assert result == 1
-        mock_db.mark_synced.assert_called_once_with(1, 42)
+        mock_db.mark_synced_bulk.assert_called_once_with([(1, 42)], conn=ANY)
+
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_syncs_chunk_in_one_append(self, mock_sheets, mock_db):
+        from bot.services.sync import sync_unsynced_to_sheets
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
+
+        mock_db.is_available.return_value = True
+        mock_db.get_unsynced_expenses.return_value = [_expense(i) for i in range(1, 4)]
+        mock_sheets.append_expense_rows.return_value = [10, 11, 12]
+
+        result = sync_unsynced_to_sheets()
+        assert result == 3
+        mock_sheets.append_expense_rows.assert_called_once()
+        rows = mock_sheets.append_expense_rows.call_args[0][0]
+        assert len(rows) == 3
+        mock_db.mark_synced_bulk.assert_called_once_with([(1, 10), (2, 11), (3, 12)], conn=ANY)
+        mock_db.mark_synced.assert_not_called()
 
     @patch("bot.services.sync.database")
     @patch("bot.services.sync.sheets")
     def test_handles_sheets_error_gracefully(self, mock_sheets, mock_db):
         from bot.services.sync import sync_unsynced_to_sheets
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
 
         mock_db.is_available.return_value = True
         mock_db.get_unsynced_expenses.return_value = [
@@ -57,11 +110,13 @@ class TestSyncUnsyncedToSheets:
                 "original_text": "test",
             }
         ]
-        mock_sheets.save_expenses_to_sheet.side_effect = Exception("Sheets API error")
+        mock_sheets.append_expense_rows.side_effect = Exception("Sheets API error")
+        mock_sheets.is_rate_limit_error.return_value = False
+        mock_sheets.is_ambiguous_write_error.return_value = False
 
         result = sync_unsynced_to_sheets()
         assert result == 0
-        mock_db.mark_synced.assert_not_called()
+        mock_db.mark_synced_bulk.assert_not_called()
 
     @patch("bot.services.sync.database")
     def test_skips_when_db_unavailable(self, mock_db):
@@ -72,6 +127,280 @@ class TestSyncUnsyncedToSheets:
         assert result == 0
 
 
+class TestRunSync:
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_processes_backlog_in_chunks(self, mock_sheets, mock_db):
+        from bot.services.sync import run_sync
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
+
+        mock_db.is_available.return_value = True
+        mock_db.get_unsynced_expenses.side_effect = [
+            [_expense(1), _expense(2)],
+            [_expense(3)],
+        ]
+        mock_db.count_unsynced_expenses.return_value = 0
+        mock_sheets.append_expense_rows.side_effect = [[5, 6], [7]]
+
+        result = run_sync(chunk_size=2)
+        assert result["synced"] == 3
+        assert result["chunks"] == 2
+        assert result["remaining"] == 0
+        assert result["error"] is None
+        assert mock_sheets.append_expense_rows.call_count == 2
+        assert mock_db.mark_synced_bulk.call_args_list[1][0][0] == [(3, 7)]
+        assert storage.get_checkpoint("sheets_sync") is None
+
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_max_chunks_leaves_backlog(self, mock_sheets, mock_db):
+        from bot.services.sync import run_sync
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
+
+        mock_db.is_available.return_value = True
+        mock_db.get_unsynced_expenses.return_value = [_expense(1), _expense(2)]
+        mock_db.count_unsynced_expenses.return_value = 40
+        mock_sheets.append_expense_rows.return_value = [5, 6]
+
+        result = run_sync(chunk_size=2, max_chunks=1)
+        assert result["synced"] == 2
+        assert result["remaining"] == 40
+
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_backs_off_on_rate_limit(self, mock_sheets, mock_db, no_sleep):
+        from bot.services.sync import run_sync
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
+
+        mock_db.is_available.return_value = True
+        mock_db.get_unsynced_expenses.return_value = [_expense(1)]
+        mock_sheets.append_expense_rows.side_effect = [Exception("429"), Exception("429"), [9]]
+        mock_sheets.is_rate_limit_error.return_value = True
+        mock_sheets.is_ambiguous_write_error.return_value = False
+
+        result = run_sync()
+        assert result["synced"] == 1
+        assert no_sleep.call_count == 2
+        first_delay, second_delay = (c[0][0] for c in no_sleep.call_args_list)
+        assert second_delay > first_delay / 2
+        mock_sheets.find_appended_rows.assert_not_called()
+
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_backoff_sleeps_outside_the_lock(self, mock_sheets, mock_db, no_sleep):
+        from bot.services.sync import run_sync
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
+        events = []
+        lock = mock_db.sheets_sync_lock.return_value
+        lock.__enter__.side_effect = lambda: events.append("lock") or "conn"
+        lock.__exit__.side_effect = lambda *exc: events.append("unlock")
+        no_sleep.side_effect = lambda delay: events.append("sleep")
+
+        mock_db.is_available.return_value = True
+        mock_db.get_unsynced_expenses.return_value = [_expense(1)]
+        mock_sheets.append_expense_rows.side_effect = [Exception("429"), [9]]
+        mock_sheets.is_rate_limit_error.return_value = True
+        mock_sheets.is_ambiguous_write_error.return_value = False
+
+        result = run_sync()
+        assert result["synced"] == 1
+        assert events == ["lock", "unlock", "lock", "unlock", "sleep", "lock", "unlock"]
+        mock_db.get_unsynced_expenses.assert_called_once_with(limit=200, conn="conn")
+        mock_db.mark_synced_bulk.assert_called_once_with([(1, 9)], conn="conn")
+
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_server_error_uses_rows_that_landed(self, mock_sheets, mock_db):
+        from bot.services.sync import run_sync
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
+
+        mock_db.is_available.return_value = True
+        mock_db.get_unsynced_expenses.return_value = [_expense(1)]
+        mock_sheets.append_expense_rows.side_effect = Exception("503")
+        mock_sheets.is_rate_limit_error.return_value = False
+        mock_sheets.is_ambiguous_write_error.return_value = True
+        mock_sheets.find_appended_rows.return_value = [12]
+
+        result = run_sync()
+        assert result["synced"] == 1
+        assert mock_sheets.append_expense_rows.call_count == 1
+        mock_db.mark_synced_bulk.assert_called_once_with([(1, 12)], conn=ANY)
+        assert mock_sheets.find_appended_rows.call_args[0][1] == 100
+
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_server_error_resends_rows_that_did_not_land(self, mock_sheets, mock_db):
+        from bot.services.sync import run_sync
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
+
+        mock_db.is_available.return_value = True
+        mock_db.get_unsynced_expenses.return_value = [_expense(1)]
+        mock_sheets.append_expense_rows.side_effect = [Exception("503"), [13]]
+        mock_sheets.is_rate_limit_error.return_value = False
+        mock_sheets.is_ambiguous_write_error.return_value = True
+        mock_sheets.find_appended_rows.return_value = None
+
+        result = run_sync()
+        assert result["synced"] == 1
+        assert mock_sheets.append_expense_rows.call_count == 2
+        mock_db.mark_synced_bulk.assert_called_once_with([(1, 13)], conn=ANY)
+
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_stops_if_rows_are_not_marked(self, mock_sheets, mock_db):
+        from bot.services.sync import run_sync
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
+
+        mock_db.is_available.return_value = True
+        mock_db.get_unsynced_expenses.return_value = [_expense(1), _expense(2)]
+        mock_sheets.append_expense_rows.return_value = [5, 6]
+
+        result = run_sync(chunk_size=2)
+        assert result["synced"] == 2
+        assert result["error"] is not None
+        assert mock_sheets.append_expense_rows.call_count == 1
+
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_crash_after_append_keeps_row_indices(self, mock_sheets, mock_db):
+        from bot.services.sync import run_sync
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
+
+        mock_db.is_available.return_value = True
+        mock_db.get_unsynced_expenses.return_value = [_expense(1)]
+        mock_sheets.append_expense_rows.return_value = [30]
+        mock_db.mark_synced_bulk.side_effect = Exception("connection lost")
+
+        mock_sheets.append_expense_rows.side_effect = Exception("killed")
+        mock_sheets.is_rate_limit_error.return_value = False
+        mock_sheets.is_ambiguous_write_error.return_value = False
+        run_sync()
+        assert storage.get_checkpoint("sheets_sync")["sheet_length"] == 100
+        storage.delete_checkpoint("sheets_sync")
+
+        mock_sheets.append_expense_rows.side_effect = None
+        result = run_sync()
+        assert result["error"] == "connection lost"
+        assert storage.get_checkpoint("sheets_sync") == {"ids": [1], "row_indices": [30]}
+
+
+class TestCheckpointRecovery:
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_appended_chunk_is_marked_without_resending(self, mock_sheets, mock_db):
+        from bot.services.sync import run_sync
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
+
+        storage.save_checkpoint("sheets_sync", {"ids": [1, 2], "row_indices": [30, 31]})
+        mock_db.is_available.return_value = True
+        mock_db.get_unsynced_expenses.return_value = []
+
+        result = run_sync()
+        assert result["recovered"] == 2
+        mock_db.mark_synced_bulk.assert_called_once_with([(1, 30), (2, 31)], conn=ANY)
+        mock_sheets.append_expense_rows.assert_not_called()
+        assert storage.get_checkpoint("sheets_sync") is None
+
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_interrupted_append_found_in_sheet(self, mock_sheets, mock_db):
+        from bot.services.sync import run_sync
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
+
+        storage.save_checkpoint("sheets_sync", {"ids": [1], "rows": [["2026-02-15", "11,0"]], "sheet_length": 76})
+        mock_db.is_available.return_value = True
+        mock_db.get_unsynced_expenses.return_value = []
+        mock_sheets.find_appended_rows.return_value = [77]
+
+        result = run_sync()
+        assert result["recovered"] == 1
+        mock_db.mark_synced_bulk.assert_called_once_with([(1, 77)], conn=ANY)
+        mock_sheets.find_appended_rows.assert_called_once_with([["2026-02-15", "11,0"]], 76)
+
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_interrupted_append_not_in_sheet_is_resent(self, mock_sheets, mock_db):
+        from bot.services.sync import run_sync
+        mock_sheets.build_expense_row.side_effect = sheets.build_expense_row
+        mock_sheets.sheet_length.return_value = 100
+
+        storage.save_checkpoint("sheets_sync", {"ids": [1], "rows": [["2026-02-15", "11,0"]]})
+        mock_db.is_available.return_value = True
+        mock_db.get_unsynced_expenses.return_value = [_expense(1)]
+        mock_sheets.find_appended_rows.return_value = None
+        mock_sheets.append_expense_rows.return_value = [50]
+
+        result = run_sync()
+        assert result["recovered"] == 0
+        assert result["synced"] == 1
+        mock_db.mark_synced_bulk.assert_called_once_with([(1, 50)], conn=ANY)
+
+
+class TestSyncSavedExpenses:
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_appends_and_marks_under_lock(self, mock_sheets, mock_db):
+        from bot.services.sync import sync_saved_expenses
+
+        mock_db.filter_unsynced.return_value = {1, 2}
+        mock_sheets.save_expenses_to_sheet.return_value = [10, 11]
+
+        assert sync_saved_expenses([1, 2], [_expense(1), _expense(2)], "text") == [10, 11]
+        mock_db.sheets_sync_lock.return_value.__enter__.assert_called_once()
+        mock_db.mark_synced_bulk.assert_called_once_with([(1, 10), (2, 11)], conn=ANY)
+
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_skips_rows_a_sync_run_already_appended(self, mock_sheets, mock_db):
+        from bot.services.sync import sync_saved_expenses
+
+        mock_db.filter_unsynced.return_value = {2}
+        mock_sheets.save_expenses_to_sheet.return_value = [11]
+
+        sync_saved_expenses([1, 2], [_expense(1), _expense(2)], "text")
+        assert mock_sheets.save_expenses_to_sheet.call_args[0][0] == [_expense(2)]
+        mock_db.mark_synced_bulk.assert_called_once_with([(2, 11)], conn=ANY)
+
+        mock_db.filter_unsynced.return_value = set()
+        assert sync_saved_expenses([1, 2], [_expense(1), _expense(2)], "text") == []
+        assert mock_sheets.save_expenses_to_sheet.call_count == 1
+
+
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_leaves_rows_to_a_running_sync(self, mock_sheets, mock_db):
+        from bot.services.sync import sync_saved_expenses
+
+        mock_db.sheets_sync_lock.return_value.__enter__.return_value = None
+
+        assert sync_saved_expenses([1], [_expense(1)], "text") == []
+        mock_db.sheets_sync_lock.assert_called_once_with(wait=False)
+        mock_db.filter_unsynced.assert_not_called()
+        mock_sheets.save_expenses_to_sheet.assert_not_called()
+
+    @patch("bot.services.sync.database")
+    @patch("bot.services.sync.sheets")
+    def test_skips_rows_a_sync_run_is_appending(self, mock_sheets, mock_db):
+        from bot.services.sync import sync_saved_expenses
+
+        storage.save_checkpoint("sheets_sync", {"ids": [1], "rows": [], "sheet_length": 10})
+        mock_db.filter_unsynced.return_value = {1, 2}
+        mock_sheets.save_expenses_to_sheet.return_value = [11]
+
+        sync_saved_expenses([1, 2], [_expense(1), _expense(2)], "text")
+        assert mock_sheets.save_expenses_to_sheet.call_args[0][0] == [_expense(2)]
+
+
 class TestFullReconciliation:
     @patch("bot.services.sync.database")
     def test_skips_when_db_unavailable(self, mock_db):
@@ -87,9 +416,9 @@ class TestFullReconciliation:
         from bot.services.sync import full_reconciliation
 
         mock_db.is_available.return_value = True
-        mock_db.get_unsynced_expenses.side_effect = [
-            [{"id": 1}],  # first call: 1 unsynced
-            [],  # second call after sync: 0 unsynced
+        mock_db.count_unsynced_expenses.side_effect = [
+            1,  # first call: 1 unsynced
+            0,  # second call after sync: 0 unsynced
         ]
         mock_sync.return_value = 1
 